@@ -0,0 +1,322 @@
+# Headless scenario benchmarks for the example scripts.
+#
+# Each test-*.py script is run end to end in a fresh interpreter with the
+# non-interactive matplotlib backend (so plt.show() returns right away).
+# The run records the wall time, the peak RSS and the results: the data of
+# every plotted line and the numbers that were printed.  The scripts that
+# go through the symbolic solution also have a numeric counterpart (see
+# _fast below), which is run the same way and has to produce the same
+# curves.  The scripts that have already been rewritten to be numeric
+# instead have a symbolic reference (see _reference below), the way the
+# script used to compute its curves, which they are checked against.
+#
+# The records are compared against a baseline file: the results have to
+# agree (to a tolerance) and the times are reported relative to the
+# baseline.
+#
+#   python benchmark.py                  compare against the baseline
+#   python benchmark.py --update         write a new baseline
+#   python benchmark.py test-dtc.py ...  only run some of the scenarios
+#
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+_directory = os.path.dirname(os.path.abspath(__file__))
+_number = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?")
+
+def scenarios():
+    """ The names of the example scripts, in order """
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(_directory, "test-*.py")))
+
+# Numeric counterparts of the scripts that use the symbolic solution.  Each
+# returns the plotted lines as a list of (x, y).
+
+def _db(h):
+    from response import magnitude_db
+    return magnitude_db(h)
+
+def _fast_crystal_filter():
+    from network import Network
+    from elements import Capacitor, Resistor, Series, Inductor
+    network = Network()
+    for a, b, z in (("vin", "va", "zs"), ("va", "gnd", "z1"), ("va", "vb", "zc"), ("vb", "gnd", "z2"),
+        ("vb", "vc", "z3"), ("vc", "vd", "zc"), ("vd", "gnd", "z4"), ("vd", "ve", "z5"),
+        ("ve", "vf", "zc"), ("vf", "gnd", "z6"), ("vf", "vout", "zc"), ("vout", "gnd", "z7"),
+        ("vout", "gnd", "zl")):
+        network.add_element(a, b, z)
+    network.set_input("vin")
+    rc = (1.2e8 * 5) / (400 * 240000)
+    values = { "zs": 50 * 9, "zl": 50 * 9, "zc": Series(Resistor(rc), Inductor(0.098), Capacitor(0.010339e-12)) }
+    for k, c in enumerate((47e-12, 154e-12, 328e-12, 288e-12, 328e-12, 154e-12, 47e-12)):
+        values["z" + str(k + 1)] = Capacitor(c)
+    f = np.linspace(5000000 - 2000, 5000000 + 2000, 100)
+    x, names = network.get_numeric_solution(f, values)
+    return [(f, _db(x[..., names.index("vout")]))]
+
+def _fast_dtc():
+    from network import Network
+    from elements import Capacitor, Inductor
+    network = Network()
+    for a, b, z in (("vin", "va", "rs"), ("va", "vb", "z1"), ("vb", "gnd", "z2"), ("vb", "gnd", "z3"),
+        ("vb", "vc", "z4"), ("vc", "gnd", "z5"), ("vc", "gnd", "z6"), ("vc", "vout", "z7"), ("vout", "gnd", "rl")):
+        network.add_element(a, b, z)
+    network.set_input("vin")
+    values = { "rs": 50, "rl": 50, "z1": Capacitor(250e-12), "z2": Inductor(6.98e-6, 200),
+        "z3": Capacitor(775e-12), "z4": Capacitor(41e-12), "z5": Inductor(6.98e-6, 200),
+        "z6": Capacitor(775e-12), "z7": Capacitor(250e-12) }
+    f = np.linspace(1300000, 2100000, 50)
+    x, names = network.get_numeric_solution(f, values)
+    return [(f, _db(x[..., names.index("vout")]))]
+
+def _fast_lcr_1():
+    from network import Network
+    from elements import Capacitor, Inductor
+    network = Network()
+    network.add_element("vin", "va", "rs")
+    network.add_element("va", "vout", "z1")
+    network.add_element("vout", "gnd", "z2")
+    network.add_element("vout", "gnd", "rl")
+    network.set_input("vin")
+    values = { "rs": 1.0, "rl": 1.0, "z1": Inductor(np.sqrt(2.0)), "z2": Capacitor(np.sqrt(2.0)) }
+    # The script sweeps rad/sec
+    w = np.linspace(0.01, 5, 100)
+    x, names = network.get_numeric_solution(w / (2 * np.pi), values)
+    return [(w, _db(x[..., names.index("vout")]))]
+
+def _fast_lcr_2():
+    from network import Network
+    from elements import Capacitor, Inductor
+    network = Network()
+    for a, b, z in (("vin", "va", "rs"), ("va", "vb", "z1"), ("vb", "gnd", "z2"), ("vb", "vout", "z3"),
+        ("vout", "gnd", "z4"), ("vout", "gnd", "rl")):
+        network.add_element(a, b, z)
+    network.set_input("vin")
+    values = { "rs": 50, "rl": 50, "z1": Inductor(0.609e-6), "z2": Capacitor(580e-12),
+        "z3": Inductor(1.472e-6), "z4": Capacitor(244e-12) }
+    f = np.linspace(0, 50000000, 100)
+    # The sweep starts at DC, where the admittances of the inductors are
+    # infinite, so the first point is solved just above it
+    x, names = network.get_numeric_solution(np.maximum(f, 1e-3), values)
+    return [(f, _db(x[..., names.index("vout")]))]
+
+_fast = {
+    "test-crystal-filter.py": _fast_crystal_filter,
+    "test-dtc.py": _fast_dtc,
+    "test-lcr-1.py": _fast_lcr_1,
+    "test-lcr-2.py": _fast_lcr_2,
+}
+
+# Symbolic references of the scripts that were rewritten to be numeric.
+# Each computes the plotted lines the way the original script did.
+
+def _reference_design_6():
+    # Independent of ladder.py: the synthesis and network of the original
+    # script
+    from sympy import symbols, I
+    from network import Network
+    from filterdesign import (butterworthNormalizedComponents, couplingCoefficientsButterworth,
+        endSectionCoefficientButterworth)
+    fc, bw, N = 5000000, 3000, 4
+    Lm, Cm, Cp, Qu_crystal = 0.098, 0.010339e-12, 4e-12, 240000
+    Rx = (1.2e8 * (fc / 1000000)) / (bw * Qu_crystal)
+    wc = 2 * np.pi * fc
+    Qfilter = fc / bw
+    g_list = butterworthNormalizedComponents(N)
+    k_list = couplingCoefficientsButterworth(g_list)
+    Qe = 1.0 / ((1.0 / (endSectionCoefficientButterworth(g_list) * Qfilter)) - (1.0 / Qu_crystal))
+    Rse = (1 / Qe) * wc * Lm
+    Ck_list = [Cm * Qfilter / k for k in k_list]
+    Cmesh2 = 1 / (1 / Cm + 1 / Ck_list[0] + 1 / Ck_list[1])
+    Cs_list = []
+    for i in range(N):
+        if i == 0:
+            Cs_list.append(1 / (1 / Cmesh2 - 1 / Cm - 1 / Ck_list[i]))
+        elif i == N - 1:
+            Cs_list.append(1 / (1 / Cmesh2 - 1 / Cm - 1 / Ck_list[i - 1]))
+        elif i == 1 or i == N - 2:
+            Cs_list.append(0)
+        else:
+            Cs_list.append(1 / (1 / Cmesh2 - 1 / Cm - 1 / Ck_list[i - 1] - 1 / Ck_list[i]))
+    network = Network()
+    network.add_element("vin", "v1", "rs")
+    network.set_input("vin")
+    network.add_element("v1", "v2", "zs1 + zx")
+    network.add_element("v2", "gnd", "zk1")
+    network.add_element("v" + str(N), "vout", "zs" + str(N) + " + zx")
+    network.add_element("vout", "gnd", "rl")
+    for mesh in range(2, N):
+        network.add_element("v" + str(mesh), "v" + str(mesh + 1), "zs" + str(mesh) + " + zx")
+        network.add_element("v" + str(mesh + 1), "gnd", "zk" + str(mesh))
+    f = np.linspace(fc - bw * 2, fc + bw * 2, 200)
+    x = network.get_solution()
+    s, w = symbols("s w")
+    motional = s * Lm + 1.0 / (s * Cm) + Rx
+    lines = []
+    for zx in (motional, 1 / (1 / motional + s * Cp)):
+        z_values = [(symbols("rs"), Rse), (symbols("rl"), Rse), (symbols("zx"), zx)]
+        for mesh in range(1, N + 1):
+            cs = Cs_list[mesh - 1]
+            z_values.append((symbols("zs" + str(mesh)), 0 if cs == 0 and mesh < N else 1.0 / (cs * s)))
+            if mesh < N:
+                z_values.append((symbols("zk" + str(mesh)), 1.0 / (Ck_list[mesh - 1] * s)))
+        h_fast = x.subs(z_values).subs(s, w * I).lambdify(w, "vout")
+        lines.append((f, 10.0 * np.log10(4.0 * np.absolute(np.vectorize(h_fast)(2.0 * np.pi * f)) ** 2.0)))
+    # The markers at the -3 dB points of the first curve
+    mag = lines[0][1]
+    inside = mag - np.amax(mag) > -3
+    first = np.argmax(inside)
+    lines.append(([f[first]], [mag[first]]))
+    outside = np.nonzero(mag[first:] - np.amax(mag) < -3)[0]
+    if len(outside):
+        lines.append(([f[first + outside[0]]], [mag[first + outside[0]]]))
+    return lines
+
+_reference = {
+    "test-design-6.py": _reference_design_6,
+}
+
+def _child(scenario, mode, path):
+    """ Runs one scenario in this (fresh) process and writes its record to
+        path """
+    import contextlib
+    import io
+    import resource
+    import runpy
+    import time
+    os.environ["MPLBACKEND"] = "Agg"
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        if mode == "fast":
+            lines = _fast[scenario]()
+        elif mode == "reference":
+            lines = _reference[scenario]()
+        else:
+            # The script sees its own command line, without arguments
+            sys.argv = [os.path.join(_directory, scenario)]
+            runpy.run_path(sys.argv[0], run_name="__main__")
+            lines = []
+            if "matplotlib.pyplot" in sys.modules:
+                plt = sys.modules["matplotlib.pyplot"]
+                for number in plt.get_fignums():
+                    for axes in plt.figure(number).axes:
+                        lines.extend(line.get_xydata().T for line in axes.get_lines())
+    elapsed = time.perf_counter() - start
+    record = { "time": elapsed,
+        # ru_maxrss is in KB on Linux
+        "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "lines": [[np.asarray(x, dtype=float).tolist(), np.asarray(y, dtype=float).tolist()] for x, y in lines],
+        "numbers": [] if mode != "script" else [float(n) for n in _number.findall(output.getvalue())] }
+    with open(path, "w") as file:
+        json.dump(record, file)
+
+def run_scenario(scenario, fast=False, timeout=None, reference=False):
+    """ Runs a scenario (the script, with fast its numeric counterpart or
+        with reference its symbolic reference) in a new interpreter.  Returns
+        its record: time (s), rss (bytes), lines (the plotted [x, y]) and
+        numbers (printed by the script). """
+    mode = "fast" if fast else "reference" if reference else "script"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "record.json")
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", scenario, path, "--mode", mode], check=True, cwd=_directory, timeout=timeout,
+            stdout=subprocess.DEVNULL, env=dict(os.environ, MPLBACKEND="Agg"))
+        with open(path) as file:
+            return json.load(file)
+
+def _agree(a, b, rtol, atol):
+    """ Whether two records have the same results """
+    if len(a["lines"]) != len(b["lines"]) or len(a["numbers"]) != len(b["numbers"]):
+        return False
+    for (xa, ya), (xb, yb) in zip(a["lines"], b["lines"]):
+        if len(ya) != len(yb) or not (np.allclose(xa, xb, rtol, atol, equal_nan=True) and
+            np.allclose(ya, yb, rtol, atol, equal_nan=True)):
+            return False
+    return np.allclose(a["numbers"], b["numbers"], rtol, atol)
+
+def compare(records, baseline, rtol=1e-6, atol=1e-9):
+    """ Compares the records of run_benchmarks() with a baseline (the same
+        structure).  Returns a dict of, for each scenario, whether the
+        results agree with the baseline, whether the fast path agrees with
+        the script and the script with its symbolic reference, and the time
+        ratios (None without a baseline). """
+    report = {}
+    for scenario, record in records.items():
+        old = baseline.get(scenario)
+        entry = { "time": record["script"]["time"], "rss": record["script"]["rss"],
+            "baseline": old is not None and _agree(record["script"], old["script"], rtol, atol),
+            "speed": old["script"]["time"] / record["script"]["time"] if old else None }
+        if "fast" in record:
+            # The numeric path is compared with the curves of the script
+            script = dict(record["script"], numbers=[])
+            entry["fast time"] = record["fast"]["time"]
+            entry["fast agrees"] = _agree(record["fast"], script, rtol, atol)
+        if "reference" in record:
+            script = dict(record["script"], numbers=[])
+            entry["reference time"] = record["reference"]["time"]
+            entry["reference agrees"] = _agree(script, record["reference"], rtol, atol)
+        report[scenario] = entry
+    return report
+
+def run_benchmarks(names=None, timeout=None):
+    """ Runs the scenarios (all of them by default).  Returns a dict of
+        scenario -> { "script": record, "fast": record } (see
+        run_scenario()), where there is only a fast record for the
+        scenarios that have a numeric counterpart, and a "reference" record
+        for those with a symbolic reference. """
+    records = {}
+    for scenario in names or scenarios():
+        records[scenario] = { "script": run_scenario(scenario, timeout=timeout) }
+        if scenario in _fast:
+            records[scenario]["fast"] = run_scenario(scenario, True, timeout)
+        if scenario in _reference:
+            records[scenario]["reference"] = run_scenario(scenario, timeout=timeout, reference=True)
+    return records
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Runs the example scripts as benchmarks")
+    parser.add_argument("scenarios", nargs="*", help="scripts to run (all of the test-*.py by default)")
+    parser.add_argument("--baseline", default=os.path.join(_directory, "benchmark-baseline.json"))
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--timeout", type=float, default=None, help="limit for each run (s)")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="script", help=argparse.SUPPRESS)
+    options = parser.parse_args(arguments)
+    if options.child:
+        _child(options.child[0], options.mode, options.child[1])
+        return 0
+
+    records = run_benchmarks(options.scenarios, options.timeout)
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+    report = compare(records, baseline)
+    failed = False
+    print("%-24s %9s %9s %8s %9s %10s %6s %10s %6s" % ("scenario", "time (s)", "RSS (MB)", "speed", "baseline",
+        "fast (s)", "fast", "ref (s)", "ref"))
+    for scenario, entry in report.items():
+        speed = "-" if entry["speed"] is None else "%.2fx" % entry["speed"]
+        agrees = "-" if scenario not in baseline else "ok" if entry["baseline"] else "DIFFERS"
+        fast_time = "%.3f" % entry["fast time"] if "fast time" in entry else "-"
+        fast = "-" if "fast agrees" not in entry else "ok" if entry["fast agrees"] else "DIFFERS"
+        reference_time = "%.3f" % entry["reference time"] if "reference time" in entry else "-"
+        reference = "-" if "reference agrees" not in entry else "ok" if entry["reference agrees"] else "DIFFERS"
+        print("%-24s %9.3f %9.1f %8s %9s %10s %6s %10s %6s" % (scenario, entry["time"], entry["rss"] / 1e6,
+            speed, agrees, fast_time, fast, reference_time, reference))
+        failed |= "DIFFERS" in (agrees, fast, reference)
+    if options.update:
+        baseline.update(records)
+        with open(options.baseline, "w") as file:
+            json.dump(baseline, file)
+        print("Wrote", options.baseline)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# A memory-bounded LRU cache of numeric solutions, for loops (optimizers,
+# tuning tools, searches) that keep coming back to the same values.
+#
+# The key is made of the topology of the network (see
+# Network.get_topology_key()), the values with their mantissas rounded to
+# a number of bits (so that values that only differ by rounding noise
+# share an entry), the exact frequency grid and the precision.
+#
+import collections
+import hashlib
+import numpy as np
+from elements import Element
+
+def _digest(a):
+    a = np.ascontiguousarray(a)
+    return (a.shape, a.dtype.str, hashlib.blake2b(a.tobytes(), digest_size=16).digest())
+
+class ResultCache:
+    def __init__(self, max_bytes=64e6, bits=40):
+        # Upper limit on the memory used by the cached solutions
+        self.max_bytes = max_bytes
+        # Mantissa bits kept when comparing values (40 bits is about 12
+        # significant digits)
+        self.bits = bits
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Calls that couldn't be cached (e.g. values given as arbitrary
+        # callables)
+        self.uncacheable = 0
+
+    def _quantize(self, value):
+        """ Hashable, quantized form of a value (or None if there isn't one) """
+        if isinstance(value, Element):
+            return self._quantize(value.key())
+        if isinstance(value, tuple):
+            parts = [self._quantize(v) for v in value]
+            return None if any(p is None and v is not None for p, v in zip(parts, value)) else tuple(parts)
+        if value is None or isinstance(value, str):
+            return value
+        if callable(value):
+            return None
+        try:
+            a = np.asarray(value)
+        except Exception:
+            return None
+        if a.dtype.kind == "c":
+            a = np.stack([a.real, a.imag])
+        elif a.dtype.kind not in "iuf":
+            return None
+        m, e = np.frexp(a.astype(float))
+        return _digest(np.round(m * 2.0 ** self.bits)), _digest(e)
+
+    def key(self, network, f, values, precision="double"):
+        """ Returns the cache key for a solve, or None if the values can't
+            be keyed """
+        quantized = []
+        for name in sorted(values):
+            q = self._quantize(values[name])
+            if q is None:
+                return None
+            quantized.append((name, q))
+        return network.get_topology_key(), tuple(quantized), _digest(np.asarray(f, dtype=float)), precision
+
+    def get_numeric_solution(self, network, f, values, precision="double"):
+        """ Network.get_numeric_solution() through the cache.  A returned
+            array that is cached is shared with the cache, so it is
+            read-only. """
+        key = self.key(network, f, values, precision)
+        if key is None:
+            self.uncacheable += 1
+            return network.get_numeric_solution(f, values, precision)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            x, names = self._entries[key]
+            return x, list(names)
+        self.misses += 1
+        x, names = network.get_numeric_solution(f, values, precision)
+        if x.nbytes <= self.max_bytes:
+            x.setflags(write=False)
+            self._entries[key] = (x, names)
+            self._bytes += x.nbytes
+            while self._bytes > self.max_bytes:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+                self.evictions += 1
+        return x, list(names)
+
+    def statistics(self):
+        """ The hit/miss counters and the current size of the cache """
+        total = self.hits + self.misses
+        return { "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "uncacheable": self.uncacheable, "entries": len(self._entries), "bytes": self._bytes,
+            "hit_rate": self.hits / total if total else 0.0 }
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
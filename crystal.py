@@ -0,0 +1,150 @@
+# Extraction of the Butterworth-Van Dyke crystal parameters (Lm, Cm, Rx,
+# Cp) from measured sweeps, for a whole lot of crystals at once.
+#
+# The measurements are either the crystal impedance Z or the S21 of a
+# series test jig (crystal in series between two R0 ports, so that
+# S21 = 2 R0 / (2 R0 + Z)).  Complex data or magnitudes can be used.
+#
+# The fit starts from estimates taken from the series (fs) and parallel
+# (fp) resonances and is refined with a Levenberg-Marquardt iteration on
+# the log of the response, using the log of the parameters so that they
+# stay positive.  Every step is vectorized across the batch of crystals.
+#
+import math
+import numpy as np
+from elements import Crystal
+from numeric import omega
+
+class CrystalFit:
+    """ The fitted parameters, one entry per crystal """
+    def __init__(self, lm, cm, rx, cp, rms):
+        self.lm = lm
+        self.cm = cm
+        self.rx = rx
+        self.cp = cp
+        # RMS of the log residuals (roughly the relative error)
+        self.rms = rms
+
+    def fs(self):
+        """ Series resonant frequency (Hz) """
+        return 1.0 / (2.0 * math.pi * np.sqrt(self.lm * self.cm))
+
+    def qu(self):
+        """ Unloaded Q """
+        return 2.0 * math.pi * self.fs() * self.lm / self.rx
+
+    def crystal(self):
+        """ One (batched) crystal model for the whole lot """
+        return Crystal(self.lm, self.cm, self.rx, self.cp)
+
+    def crystals(self):
+        """ A crystal model for each crystal """
+        return [Crystal(*p) for p in zip(self.lm, self.cm, self.rx, self.cp)]
+
+def _initial_estimate(f, zmag):
+    """ Estimates the parameters from |Z| (shape (B, F)) """
+    w = omega(f)
+    i_s = np.argmin(zmag, axis=-1)
+    i_p = np.argmax(zmag, axis=-1)
+    outside = (i_s == 0) | (i_s == len(w) - 1) | (i_p == 0) | (i_p == len(w) - 1) | (i_p <= i_s)
+    if np.any(outside):
+        raise ValueError("The sweep doesn't cover the resonances of crystal(s) " + str(np.flatnonzero(outside).tolist()))
+    ws = w[i_s]
+    wp = w[i_p]
+    rx = np.take_along_axis(zmag, i_s[:, np.newaxis], -1)[:, 0]
+    # fp = fs * sqrt(1 + Cm/Cp)
+    k = (wp / ws) ** 2 - 1.0
+    # Use the sample furthest from fs to set the scale:
+    # |Y| = w Cp |1 - k / ((w/ws)^2 - 1)|
+    i_e = np.where(np.absolute(w[0] - ws) > np.absolute(w[-1] - ws), 0, len(w) - 1)
+    we = w[i_e]
+    ze = np.take_along_axis(zmag, i_e[:, np.newaxis], -1)[:, 0]
+    cp = 1.0 / (ze * we * np.absolute(1.0 - k / ((we / ws) ** 2 - 1.0)))
+    cm = k * cp
+    lm = 1.0 / (ws ** 2 * cm)
+    return np.stack([lm, cm, rx, cp], axis=-1)
+
+def _model(theta, s, kind, r0):
+    """ Returns log(model) and its derivatives with respect to the log
+        parameters (shape (4, B, F)) """
+    lm, cm, rx, cp = [p[:, np.newaxis] for p in np.exp(theta).T]
+    zm = rx + lm * s + 1.0 / (cm * s)
+    z = Crystal(lm[:, 0], cm[:, 0], rx[:, 0], cp[:, 0])(s)
+    # dZ/dZm = (Z/Zm)^2 and dZ/dCp = -s Z^2, times p for the log parameters
+    dz_dzm = (z / zm) ** 2
+    dz = np.stack([dz_dzm * lm * s, dz_dzm * (-1.0 / (cm * s)), dz_dzm * rx, -s * z * z * cp])
+    if kind == "s21":
+        # d log(S21) = -dZ / (2 R0 + Z)
+        return np.log(2.0 * r0 / (2.0 * r0 + z)), -dz / (2.0 * r0 + z)
+    return np.log(z), dz / z
+
+def fit_crystals(f, data, kind="z", r0=50.0, iterations=100, tol=1e-9):
+    """ Fits the BVD parameters for a batch of crystals.  f is the sweep (Hz)
+        and data has shape (number of crystals, len(f)) holding Z or S21
+        (kind="s21", for a series jig with port impedance r0).  Complex data
+        is fitted in magnitude and phase, real data as a magnitude.  The
+        sweep needs to include both the series and parallel resonances.
+        Returns a CrystalFit. """
+    f = np.asarray(f, dtype=float)
+    data = np.atleast_2d(data)
+    magnitude_only = not np.iscomplexobj(data)
+    if kind == "s21":
+        # Convert to |Z| for the initial estimate (treating S21 as real,
+        # which is close enough for a starting point)
+        zmag = np.absolute(2.0 * r0 * (1.0 / (np.absolute(data) if magnitude_only else data) - 1.0))
+    elif kind == "z":
+        zmag = np.absolute(data)
+    else:
+        raise ValueError("kind must be 'z' or 's21'")
+    target = np.log(np.absolute(data)) if magnitude_only else np.log(data)
+    s = 1j * omega(f)
+
+    def residuals(theta, active):
+        value, deriv = _model(theta, s, kind, r0)
+        r = value - target[active]
+        if magnitude_only:
+            r = r.real
+            J = deriv.real
+        else:
+            # Compare the phase too, wrapped onto (-pi, pi]
+            r = np.concatenate([r.real, np.angle(np.exp(1j * r.imag))], axis=-1)
+            J = np.concatenate([deriv.real, deriv.imag], axis=-1)
+        # J as (B, 4, M)
+        return r, np.ascontiguousarray(np.moveaxis(J, 0, 1))
+
+    theta = np.log(_initial_estimate(f, zmag))
+    everything = np.arange(len(theta))
+    r, J = residuals(theta, everything)
+    cost = np.sum(r * r, axis=-1)
+    lam = np.full(cost.shape, 1e-3)
+    eye = np.eye(4)
+    # Only the crystals that haven't converged yet are iterated
+    active = everything
+    for _ in range(iterations):
+        if len(active) == 0:
+            break
+        Ja = J[active]
+        g = Ja @ r[active][..., np.newaxis]
+        H = Ja @ Ja.swapaxes(-1, -2)
+        a = H + lam[active, np.newaxis, np.newaxis] * (H * eye + 1e-12 * eye)
+        step = -np.linalg.solve(a, g)[..., 0]
+        r_new, J_new = residuals(theta[active] + step, active)
+        cost_new = np.sum(r_new * r_new, axis=-1)
+        better = cost_new < cost[active]
+        # Accept the improved crystals and adjust the damping per crystal
+        accepted = active[better]
+        theta[accepted] += step[better]
+        r[accepted] = r_new[better]
+        J[accepted] = J_new[better]
+        improvement = np.where(better, cost[active] - cost_new, 0.0)
+        cost[accepted] = cost_new[better]
+        lam[active] = np.clip(np.where(better, lam[active] / 10.0, lam[active] * 10.0), 1e-15, 1e15)
+        # A crystal is done once its parameters stop changing (the
+        # parameters are logs, so the step is a relative change) or it
+        # can't improve any further
+        done = (better & ((np.amax(np.absolute(step), axis=-1) < tol) | (improvement <= tol * cost[active])))
+        done |= lam[active] >= 1e15
+        active = active[~done]
+    p = np.exp(theta)
+    rms = np.sqrt(cost / r.shape[-1])
+    return CrystalFit(p[:, 0], p[:, 1], p[:, 2], p[:, 3], rms)
@@ -0,0 +1,187 @@
+# A local database of synthesized designs and their simulated responses,
+# kept in SQLite so that it is shared between scripts and sessions.
+#
+# Each design is stored with its inputs (order, centre frequency,
+# bandwidth, crystal parameters, lot), the synthesized element values and
+# any metrics that were computed for it.  The order, centre frequency,
+# bandwidth and lot are indexed columns, so queries like "all 4 crystal
+# designs at 5 MHz with 2.4 - 3 kHz bandwidth" don't scan the table.
+#
+# Responses are keyed like the entries of ResultCache (topology, quantized
+# values and frequency grid) and stored as zlib compressed arrays.
+#
+import hashlib
+import json
+import sqlite3
+import zlib
+import numpy as np
+from cache import ResultCache
+import ladder
+
+_schema = """
+create table if not exists designs (
+    id integer primary key,
+    key text unique not null,
+    kind text not null,
+    n integer,
+    fc real,
+    bw real,
+    lot text,
+    inputs text not null,
+    result text not null,
+    metrics text not null default '{}'
+);
+create index if not exists designs_fc on designs (fc, bw);
+create index if not exists designs_n on designs (n, fc, bw);
+create index if not exists designs_lot on designs (lot);
+create table if not exists responses (
+    key text primary key,
+    design integer references designs (id),
+    names text not null,
+    shape text not null,
+    dtype text not null,
+    data blob not null
+);
+create index if not exists responses_design on responses (design);
+"""
+
+class DesignRecord:
+    """ One row of the designs table.  inputs, result and metrics are dicts. """
+    def __init__(self, id, kind, n, fc, bw, lot, inputs, result, metrics):
+        self.id = id
+        self.kind = kind
+        self.n = n
+        self.fc = fc
+        self.bw = bw
+        self.lot = lot
+        self.inputs = inputs
+        self.result = result
+        self.metrics = metrics
+
+    def __repr__(self):
+        return "DesignRecord(" + str(self.id) + ", " + self.kind + ", n=" + str(self.n) + \
+            ", fc=" + str(self.fc) + ", bw=" + str(self.bw) + ")"
+
+def _range(column, value):
+    """ SQL condition for a column that is either equal to value or in the
+        range value = (low, high) """
+    if isinstance(value, (tuple, list)):
+        return column + " between ? and ?", list(value)
+    return column + " = ?", [value]
+
+def _decode(names, shape, dtype, data):
+    x = np.frombuffer(bytearray(zlib.decompress(data)), dtype=dtype).reshape(json.loads(shape))
+    return x, json.loads(names)
+
+class DesignDatabase:
+    def __init__(self, path=":memory:", bits=40):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_schema)
+        # Keys the responses (see ResultCache)
+        self._keys = ResultCache(bits=bits)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._connection.close()
+
+    def _record(self, row):
+        id, kind, n, fc, bw, lot, inputs, result, metrics = row
+        return DesignRecord(id, kind, n, fc, bw, lot, json.loads(inputs), json.loads(result),
+            json.loads(metrics))
+
+    def _select(self, where="", parameters=()):
+        rows = self._connection.execute("select id, kind, n, fc, bw, lot, inputs, result, metrics "
+            "from designs " + where + " order by id", parameters)
+        return [self._record(row) for row in rows]
+
+    def design_key(self, kind, inputs):
+        """ Digest of the kind and inputs (a dict that can be written as JSON) """
+        text = json.dumps([kind, inputs], sort_keys=True)
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def get_design(self, kind, inputs):
+        """ The stored design of this kind for inputs (a dict), or None """
+        key = self.design_key(kind, inputs)
+        records = self._select("where key = ?", (key,))
+        return records[0] if records else None
+
+    def add_design(self, kind, inputs, result, n=None, fc=None, bw=None, lot=None, metrics=None):
+        """ Stores a design (or returns the one already stored for the same
+            kind and inputs).  Returns its DesignRecord. """
+        key = self.design_key(kind, inputs)
+        with self._connection:
+            self._connection.execute("insert or ignore into designs "
+                "(key, kind, n, fc, bw, lot, inputs, result, metrics) values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, n, fc, bw, lot, json.dumps(inputs, sort_keys=True), json.dumps(result),
+                json.dumps(metrics or {})))
+        return self._select("where key = ?", (key,))[0]
+
+    def set_metrics(self, design, **metrics):
+        """ Adds (or replaces) metrics of a design (a DesignRecord or id) """
+        id = design.id if isinstance(design, DesignRecord) else design
+        with self._connection:
+            row = self._connection.execute("select metrics from designs where id = ?", (id,)).fetchone()
+            if row is None:
+                raise ValueError("No design with id " + str(id))
+            merged = json.loads(row[0])
+            merged.update(metrics)
+            self._connection.execute("update designs set metrics = ? where id = ?", (json.dumps(merged), id))
+
+    def find(self, kind=None, n=None, fc=None, bw=None, lot=None):
+        """ Returns the stored designs that match all of the given conditions.
+            fc and bw are either a value or a (low, high) range, e.g.
+            find(n=4, fc=5e6, bw=(2400, 3000)). """
+        conditions = []
+        parameters = []
+        for column, value in (("kind", kind), ("n", n), ("fc", fc), ("bw", bw), ("lot", lot)):
+            if value is not None:
+                condition, p = _range(column, value)
+                conditions.append(condition)
+                parameters.extend(p)
+        where = "where " + " and ".join(conditions) if conditions else ""
+        return self._select(where, parameters)
+
+    def crystal_ladder_design(self, N, fc, bw, Lm, Cm, Qu_crystal, lot=None):
+        """ ladder.crystal_ladder_design() through the database.  Returns the
+            same (Rse, Ck_list, Cs_list, fmesh2). """
+        inputs = { "N": N, "fc": fc, "bw": bw, "Lm": Lm, "Cm": Cm, "Qu_crystal": Qu_crystal, "lot": lot }
+        record = self.get_design("crystal_ladder", inputs)
+        if record is None:
+            self.misses += 1
+            Rse, Ck_list, Cs_list, fmesh2 = ladder.crystal_ladder_design(N, fc, bw, Lm, Cm, Qu_crystal)
+            result = { "Rse": Rse, "Ck_list": Ck_list, "Cs_list": Cs_list, "fmesh2": fmesh2 }
+            record = self.add_design("crystal_ladder", inputs, result, N, fc, bw, lot)
+        else:
+            self.hits += 1
+        result = record.result
+        return result["Rse"], result["Ck_list"], result["Cs_list"], result["fmesh2"]
+
+    def get_numeric_solution(self, network, f, values, design=None, precision="double"):
+        """ Network.get_numeric_solution() through the database.  design (a
+            DesignRecord or id) links a new response to its design. """
+        key = self._keys.key(network, f, values, precision)
+        if key is None:
+            return network.get_numeric_solution(f, values, precision)
+        key = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        row = self._connection.execute("select names, shape, dtype, data from responses where key = ?",
+            (key,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            return _decode(*row)
+        self.misses += 1
+        x, names = network.get_numeric_solution(f, values, precision)
+        id = design.id if isinstance(design, DesignRecord) else design
+        with self._connection:
+            self._connection.execute("insert or replace into responses (key, design, names, shape, dtype, data) "
+                "values (?, ?, ?, ?, ?, ?)", (key, id, json.dumps(names), json.dumps(x.shape), x.dtype.str,
+                zlib.compress(np.ascontiguousarray(x).tobytes())))
+        return x, names
+
+    def responses(self, design):
+        """ The stored responses of a design, as a list of (x, names) """
+        id = design.id if isinstance(design, DesignRecord) else design
+        rows = self._connection.execute("select names, shape, dtype, data from responses where design = ? "
+            "order by rowid", (id,))
+        return [_decode(*row) for row in rows]
@@ -0,0 +1,190 @@
+# Numeric impedance models for use with Network.get_numeric_solution().
+#
+# Each element is a callable that takes the complex frequency s (an array
+# of j*w values) and returns the complex impedance.  Component values may
+# be scalars or arrays; array values are treated as a batch and end up
+# on the leading axes of the result, with frequency on the last axis.
+#
+import numpy as np
+from numeric import Dual
+
+def _param(x):
+    """ Prepares a component value for broadcasting against the frequency axis.
+        Dual values (used for derivatives with respect to component values)
+        are passed through. """
+    if isinstance(x, Dual):
+        return x
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 0:
+        return float(x)
+    return x[..., np.newaxis]
+
+def _scalar(x):
+    x = np.asarray(x, dtype=float)
+    if x.ndim != 0:
+        raise ValueError("Only scalar component values can be expanded into branches")
+    return float(x)
+
+class Element:
+    """ Base class for the numeric impedance models """
+    def __call__(self, s):
+        raise NotImplementedError()
+
+    def branches(self, a, b, new_node):
+        """ Expands the element into primitive branches between nodes a and b, 
+            calling new_node() to create any internal nodes.  Each branch is a 
+            tuple (kind, a, b, value) where kind is "g" (conductance), "c" 
+            (capacitance), "l" (inductance) or "short".  This is used to 
+            build the G/C matrices for model-order reduction. """
+        raise ValueError(type(self).__name__ + " can't be expanded into R, L and C branches")
+
+    def key(self):
+        """ Describes the element as nested tuples of its type and values
+            (the values are left as they are, see cache.py) """
+        return (type(self).__name__,) + tuple((name, _key(value)) for name, value in sorted(vars(self).items()))
+
+def _key(value):
+    if isinstance(value, Element):
+        return value.key()
+    if isinstance(value, (list, tuple)):
+        return tuple(_key(v) for v in value)
+    return value
+
+class Resistor(Element):
+    def __init__(self, r):
+        self.r = r
+
+    def __call__(self, s):
+        return _param(self.r) + 0 * s
+
+    def branches(self, a, b, new_node):
+        r = _scalar(self.r)
+        if r == 0:
+            return [("short", a, b, None)]
+        return [("g", a, b, 1.0 / r)]
+
+class Capacitor(Element):
+    def __init__(self, c):
+        self.c = c
+
+    def __call__(self, s):
+        return 1.0 / (_param(self.c) * s)
+
+    def branches(self, a, b, new_node):
+        return [("c", a, b, _scalar(self.c))]
+
+class Inductor(Element):
+    """ Inductor with an optional unloaded Q.  The loss is modeled using a
+        series resistor that depends on w (not s!), as in test-dtc.py. """
+    def __init__(self, l, qu=None):
+        self.l = l
+        self.qu = qu
+
+    def __call__(self, s):
+        l = _param(self.l)
+        z = l * s
+        if self.qu is not None:
+            w = s / 1j
+            z = z + l * w / _param(self.qu)
+        return z
+
+    def branches(self, a, b, new_node):
+        if self.qu is not None:
+            # The loss depends on w, which doesn't fit G + sC
+            return super().branches(a, b, new_node)
+        return [("l", a, b, _scalar(self.l))]
+
+class Short(Element):
+    """ Zero impedance.  Useful when a mesh has no tuning capacitor. """
+    def __call__(self, s):
+        return 0 * s
+
+    def branches(self, a, b, new_node):
+        return [("short", a, b, None)]
+
+class OptionalCapacitor(Element):
+    """ A capacitor where a value of 0 means no capacitor (a short), for
+        batches in which only some designs have the capacitor. """
+    def __init__(self, c):
+        self.c = c
+
+    def __call__(self, s):
+        c = _param(self.c)
+        present = c != 0
+        return np.where(present, 1.0 / (np.where(present, c, 1.0) * s), 0 * s)
+
+    def branches(self, a, b, new_node):
+        if _scalar(self.c) == 0:
+            return [("short", a, b, None)]
+        return [("c", a, b, _scalar(self.c))]
+
+class Series(Element):
+    def __init__(self, *elements):
+        self.elements = elements
+
+    def __call__(self, s):
+        z = 0 * s
+        for e in self.elements:
+            z = z + e(s)
+        return z
+
+    def branches(self, a, b, new_node):
+        return series_branches(self.elements, a, b, new_node)
+
+class Parallel(Element):
+    def __init__(self, *elements):
+        self.elements = elements
+
+    def __call__(self, s):
+        y = 0 * s
+        for e in self.elements:
+            y = y + 1.0 / e(s)
+        return 1.0 / y
+
+    def branches(self, a, b, new_node):
+        result = []
+        for e in self.elements:
+            result += e.branches(a, b, new_node)
+        return result
+
+class Crystal(Element):
+    """ Butterworth-Van Dyke crystal model: the motional arm (rx, lm, cm) in
+        series, optionally in parallel with the holder capacitance cp. """
+    def __init__(self, lm, cm, rx, cp=None):
+        self.lm = lm
+        self.cm = cm
+        self.rx = rx
+        self.cp = cp
+
+    def __call__(self, s):
+        z = _param(self.rx) + _param(self.lm) * s + 1.0 / (_param(self.cm) * s)
+        if self.cp is not None:
+            z = 1.0 / (1.0 / z + _param(self.cp) * s)
+        return z
+
+    def branches(self, a, b, new_node):
+        motional = Series(Resistor(self.rx), Inductor(self.lm), Capacitor(self.cm))
+        if self.cp is None:
+            return motional.branches(a, b, new_node)
+        return Parallel(motional, Capacitor(self.cp)).branches(a, b, new_node)
+
+def as_element(value):
+    """ Plain numbers are taken to be resistances """
+    if isinstance(value, Element):
+        return value
+    if callable(value):
+        raise ValueError("Only the models in elements.py can be expanded into branches")
+    return Resistor(value)
+
+def series_branches(elements, a, b, new_node):
+    """ Chains the elements between nodes a and b, creating an internal node 
+        between each pair. """
+    result = []
+    elements = [as_element(e) for e in elements]
+    for i, e in enumerate(elements):
+        end = b if i == len(elements) - 1 else new_node()
+        result += e.branches(a, end, new_node)
+        a = end
+    if len(elements) == 0:
+        result.append(("short", a, b, None))
+    return result
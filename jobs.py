@@ -0,0 +1,196 @@
+# Checkpointed jobs for long sweeps and Monte Carlo runs.
+#
+# A job splits its work into a fixed number of chunks that only depend on
+# the job description, so the same chunk always computes the same thing.
+# Each finished chunk is written to the job directory atomically (to a
+# temporary file that is then renamed), so a job that is killed keeps
+# everything that was finished and running it again only computes the
+# missing chunks.  The chunks can be spread over worker processes, in
+# which case the network and make_values() have to be picklable (e.g.
+# make_values defined at module level).
+#
+# Monte Carlo chunks draw from their own generator, seeded from the job
+# seed and the chunk number, so the results don't depend on which chunks
+# were computed in which run (or process).
+#
+import concurrent.futures
+import json
+import os
+import numpy as np
+from sweep import SweepResult
+from elements import as_element
+
+def _sync_directory(path):
+    """ Flushes the directory holding path, so that a rename in it survives a
+        crash """
+    descriptor = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+def _save(path, **arrays):
+    """ Writes the arrays to path (an .npz file) atomically """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    _sync_directory(path)
+
+def _run_chunk(job, k):
+    job.run_chunk(k)
+    return k
+
+class Job:
+    """ Base class: the chunking, checkpoint files and running.  Subclasses
+        provide describe() and compute(k). """
+    def __init__(self, directory, chunks):
+        self.directory = directory
+        self.chunks = chunks
+
+    def describe(self):
+        """ What the job computes, as a dict that can be written as JSON """
+        raise NotImplementedError()
+
+    def compute(self, k):
+        """ Computes chunk k, returning a dict of arrays """
+        raise NotImplementedError()
+
+    def _chunk_path(self, k):
+        return os.path.join(self.directory, "chunk-" + str(k) + ".npz")
+
+    def _prepare(self):
+        """ Creates the job directory, or checks that the job in it is this
+            one """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "job.json")
+        description = json.loads(json.dumps(dict(self.describe(), chunks=self.chunks)))
+        if os.path.exists(path):
+            with open(path) as file:
+                if json.load(file) != description:
+                    raise ValueError("The directory holds a different job: " + self.directory)
+        else:
+            temporary = path + ".tmp"
+            with open(temporary, "w") as file:
+                json.dump(description, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+            _sync_directory(path)
+
+    def completed(self):
+        return [k for k in range(self.chunks) if os.path.exists(self._chunk_path(k))]
+
+    def run_chunk(self, k):
+        _save(self._chunk_path(k), **self.compute(k))
+
+    def run(self, workers=1, progress=None):
+        """ Computes the chunks that aren't finished yet, on workers processes
+            (in this process for 1).  progress(done, total) is called after
+            each chunk. """
+        self._prepare()
+        done = set(self.completed())
+        pending = [k for k in range(self.chunks) if k not in done]
+        if workers is None or workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                for future in concurrent.futures.as_completed([executor.submit(_run_chunk, self, k) for k in pending]):
+                    done.add(future.result())
+                    if progress is not None:
+                        progress(len(done), self.chunks)
+        else:
+            for k in pending:
+                self.run_chunk(k)
+                done.add(k)
+                if progress is not None:
+                    progress(len(done), self.chunks)
+
+    def load_chunk(self, k):
+        with np.load(self._chunk_path(k)) as data:
+            return { name: data[name] for name in data.files }
+
+    def _check_finished(self):
+        missing = self.chunks - len(self.completed())
+        if missing:
+            raise ValueError(str(missing) + " chunks haven't been computed yet")
+
+class SweepJob(Job):
+    """ A Sweep (see sweep.py) run in chunks along its first axis """
+    def __init__(self, directory, sweep, network, make_values, outputs, chunk_size=1):
+        self.sweep = sweep
+        self.network = network
+        self.make_values = make_values
+        self.outputs = list(outputs)
+        self.chunk_size = chunk_size
+        length = sweep.shape()[0] if sweep.axes else 1
+        super().__init__(directory, -(-length // chunk_size))
+
+    def describe(self):
+        return { "kind": "sweep", "topology": self.network.get_topology_key(), "dims": list(self.sweep.dims()),
+            "shape": list(self.sweep.shape()), "f": self.sweep.f.tolist(), "outputs": self.outputs,
+            "chunk_size": self.chunk_size,
+            "coords": { name: np.asarray(c).tolist() for name, c in self.sweep.axes.items() } }
+
+    def compute(self, k):
+        start = k * self.chunk_size
+        grid = self.sweep.grid(start, start + self.chunk_size)
+        values = { name: value if callable(value) else as_element(value)
+            for name, value in self.make_values(**grid).items() }
+        x, names = self.network.get_numeric_solution(self.sweep.f, values)
+        shape = self.sweep.shape()
+        if self.sweep.axes:
+            shape = (len(next(iter(grid.values()))),) + shape[1:]
+        # Axes that the values don't depend on are broadcast
+        x = np.broadcast_to(x[..., [names.index(name) for name in self.outputs]], shape + (len(self.outputs),))
+        return { "x": np.ascontiguousarray(x) }
+
+    def result(self):
+        """ The SweepResult, once every chunk has been computed """
+        self._check_finished()
+        parts = [self.load_chunk(k)["x"] for k in range(self.chunks)]
+        data = np.concatenate(parts) if self.sweep.axes else parts[0]
+        coords = dict(self.sweep.axes)
+        coords["f"] = self.sweep.f
+        return SweepResult(data, self.outputs, self.sweep.dims(), coords)
+
+class MonteCarloJob(Job):
+    """ samples random value sets, solved in chunks of chunk_size.
+        make_values(rng, count) returns the values dict for a batch of count
+        samples (arrays of length count, e.g. rng.normal(c, tol, count)),
+        drawing from the numpy Generator rng. """
+    def __init__(self, directory, network, make_values, f, samples, outputs, seed=0, chunk_size=1000):
+        self.network = network
+        self.make_values = make_values
+        self.f = np.asarray(f, dtype=float)
+        self.samples = samples
+        self.outputs = list(outputs)
+        self.seed = seed
+        self.chunk_size = chunk_size
+        super().__init__(directory, -(-samples // chunk_size))
+
+    def describe(self):
+        return { "kind": "monte carlo", "topology": self.network.get_topology_key(), "f": self.f.tolist(),
+            "samples": self.samples, "outputs": self.outputs, "seed": self.seed, "chunk_size": self.chunk_size }
+
+    def generator(self, k):
+        """ The random generator of chunk k """
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(k,)))
+
+    def compute(self, k):
+        count = min(self.chunk_size, self.samples - k * self.chunk_size)
+        rng = self.generator(k)
+        state = json.dumps(rng.bit_generator.state)
+        values = { name: value if callable(value) else as_element(value)
+            for name, value in self.make_values(rng, count).items() }
+        x, names = self.network.get_numeric_solution(self.f, values)
+        # Values that aren't random are broadcast over the samples
+        x = np.broadcast_to(x, (count, len(self.f), x.shape[-1]))
+        return { "x": np.ascontiguousarray(x[..., [names.index(name) for name in self.outputs]]),
+            "state": np.array(state) }
+
+    def result(self):
+        """ The node voltages of the outputs, with shape (samples, len(f),
+            outputs), once every chunk has been computed """
+        self._check_finished()
+        return np.concatenate([self.load_chunk(k)["x"] for k in range(self.chunks)])
@@ -0,0 +1,155 @@
+# Design of a generalized crystal ladder filter using an arbitrary
+# number of crystals >2 (see test-design-6.py).
+#
+# The coupling capacitors are shunt in this design.
+#
+import math
+import numpy as np
+from network import Network
+from filterdesign import *
+from elements import Capacitor, OptionalCapacitor, Short
+
+def crystal_ladder_network(N, shared_crystal=True):
+    """ Builds the ladder network.  All meshes use the crystal "zx", unless
+        shared_crystal is False in which case mesh k uses "zx<k>" (so that
+        each mesh can be given a different crystal). """
+
+    def zx(mesh):
+        return "zx" if shared_crystal else "zx" + str(mesh)
+
+    network = Network()
+
+    # Source impedance
+    network.add_element("vin", "v1", "rs")
+    # Shut off KCL for the input node
+    network.set_input("vin")
+    # Input Mesh
+    network.add_element("v1", "v2", "zs1 + " + zx(1))
+    network.add_element("v2", "gnd", "zk1")
+    # Output Mesh with load impedance
+    network.add_element("v" + str(N), "vout", "zs" + str(N) + " + " + zx(N))
+    network.add_element("vout", "gnd", "rl")
+    # Go through the inner meshes (stops before output mesh)
+    for mesh in range(2, N):
+        network.add_element("v" + str(mesh), "v" + str(mesh+1), "zs" + str(mesh) + " + " + zx(mesh))
+        network.add_element("v" + str(mesh + 1), "gnd", "zk" + str(mesh))
+
+    return network
+
+def crystal_ladder_values(N, crystal, Rse, Cs_list, Ck_list):
+    """ Creates the values for crystal_ladder_network().  crystal is an element
+        model (e.g. elements.Crystal) or a list with one per mesh.  The
+        capacitor values may be arrays (a batch of designs). """
+
+    values = {}
+    # Setup the source/load impedances
+    values["rs"] = Rse
+    values["rl"] = Rse
+    # Setup the crystal values
+    if isinstance(crystal, (list, tuple)):
+        for mesh in range(1, N + 1):
+            values["zx" + str(mesh)] = crystal[mesh - 1]
+    else:
+        values["zx"] = crystal
+    # Setup the capactors for each mesh, except for the end
+    for mesh in range(1, N):
+        cs = Cs_list[mesh-1]
+        if (not np.any(cs)) if isinstance(cs, np.ndarray) else cs == 0:
+            # The no capacitor case looks like a short-circuit
+            values["zs" + str(mesh)] = Short()
+        elif isinstance(cs, np.ndarray) and not np.all(cs):
+            # Only some of the designs of the batch have the capacitor
+            values["zs" + str(mesh)] = OptionalCapacitor(cs)
+        else:
+            values["zs" + str(mesh)] = Capacitor(cs)
+        ck = Ck_list[mesh-1]
+        values["zk" + str(mesh)] = Capacitor(ck)
+    # Output mesh
+    cs = Cs_list[N-1]
+    values["zs" + str(N)] = Capacitor(cs)
+
+    return values
+
+def crystal_ladder_design(N, fc, bw, Lm, Cm, Qu_crystal, db=None):
+    """ Butterworth design of the ladder.  Returns the end resistance Rse,
+        the coupling capacitors Ck_list (N-1), the tuning capacitors Cs_list
+        (N, 0 means no capacitor) and the mesh frequency.  With db (a
+        designdb.DesignDatabase) the design is looked up in (or added to)
+        the database. """
+
+    if db is not None:
+        return db.crystal_ladder_design(N, fc, bw, Lm, Cm, Qu_crystal)
+
+    # Angular center frequency
+    wc = 2 * math.pi * fc
+    # The filter Q is a a function of the desired bandwidth
+    Qfilter = fc / bw
+
+    # Butterworth LPF parameters
+    g_list = butterworthNormalizedComponents(N)
+    # Convert into BPF normalized parameters
+    k_list = couplingCoefficientsButterworth(g_list)
+    q = endSectionCoefficientButterworth(g_list)
+
+    # Compute the denormalized end Q (by definition, doesn't matter
+    # whether this is series or parallel)
+    Qe = 1.0 / ((1.0 / (q * Qfilter)) - (1.0 / Qu_crystal))
+
+    # Figure out the end resistance needed to properly load
+    # the end resonator to acheive the desired end Q.  This
+    # is by definition of "Q" for an inductor.
+    #
+    # THIS HAS NOTING TO DO WITH THE DESIRED SYSTEM IMPEDANCE R0!
+    # THIS IS WHAT IS REQUIRED TO HIT THE END Qe.
+    Rse = (1 / Qe) * wc * Lm
+
+    # Produce the denormalized coupling capacitors
+    Ck_list = [Cm * Qfilter / x for x in k_list]
+
+    # Compute the total capacitance of the second mesh since this will
+    # be used to establish the frequency of resonance across all of the
+    # meshes.  This works becase the second mesh has the highest
+    # frequency because the crystal is connected in series with the
+    # smallest coupling capacitances on both sides.
+
+    # The second mesh has the first and second shunt coupling capactors
+    # and the motional capacitance of the crystal all connected in
+    # series.
+    Cmesh2 = 1 / ( 1 / Cm + 1 / Ck_list[0] + 1 / Ck_list[1])
+    # Convert the second mesh capacitance to the network mesh frequency
+    fmesh2 = 1 / (2 * math.pi * math.sqrt(Lm * Cmesh2))
+
+    # Walk through the meshes and determine the appropriate tuning
+    # capacitor that is needed to make the mesh resonate at the
+    # same frequency as mesh #2.
+    Cs_list = []
+
+    for i in range(0, N):
+        # Special case for the first mesh (an end)
+        if i == 0:
+            # Adjustment is whatever is neededd to match the loop
+            # capacitance of the second mesh.  We pull out the series
+            # equivalent of the load match, the motional capacitance
+            # of the crystal, and the coupling capacitor.
+            Cs = 1 / (1 / Cmesh2 - 1 / Cm - 1 / Ck_list[i])
+        # Special case for the last mesh (an end)
+        elif i == N-1:
+            # See above case
+            Cs = 1 / (1 / Cmesh2 - 1 / Cm - 1 / Ck_list[i-1])
+        # Special case for the second mesh (and the mirror) since
+        # they don't require an adjustment (alread the higest freq)
+        elif i == 1 or i == N-2:
+            Cs = 0
+        else:
+            # Here we pull out the motional capacitance and the two coupling
+            # capacitances
+            Cs = 1 / (1 / Cmesh2 - 1 / Cm - 1 / Ck_list[i-1] - 1 / Ck_list[i])
+
+        Cs_list.append(Cs)
+
+    # Re-tuning: Now we need to adjust the resonator capacitor in order
+    # maintain the same fc.  We are "backing out" the capacitance
+    # that was introduced in the loop as a consequence of the loading and/or
+    # coupling capacitors
+
+    return Rse, Ck_list, Cs_list, fmesh2
@@ -0,0 +1,112 @@
+# Precomputed response tables for evaluating H(f) repeatedly.
+#
+# The table holds samples of log(H) = ln|H| + j phase together with the
+# exact derivative d log(H)/df (from Network.get_numeric_derivative()),
+# so each interval is interpolated with a cubic Hermite polynomial.  The
+# log keeps the interpolation well behaved across the many decades of a
+# filter skirt and the phase is unwrapped locally for each interval.
+#
+# The samples are placed adaptively: each interval is checked at its
+# midpoint and split until the interpolation there is within the
+# tolerance, which puts the samples where the response changes quickly
+# (i.e. around the resonances).  Every pass solves all of the new
+# midpoints in one batched call.
+#
+import numpy as np
+from numeric import omega
+
+def _hermite(f0, f1, y0, y1, d0, d1, f):
+    """ Cubic Hermite interpolation between (f0, y0, d0) and (f1, y1, d1) """
+    h = f1 - f0
+    t = (f - f0) / h
+    return ((1 + 2 * t) * (1 - t) ** 2 * y0 + t * (1 - t) ** 2 * h * d0
+        + t * t * (3 - 2 * t) * y1 + t * t * (t - 1) * h * d1)
+
+class ResponseTable:
+    """ The response at one node on an adaptive frequency grid.  Calling the
+        table interpolates the (complex) response at any frequencies in
+        [f[0], f[-1]]. """
+
+    def __init__(self, f, h, dh, error, output):
+        self.f = f
+        # The samples of H and dH/df, shape (..., len(f))
+        self.h = h
+        self.dh = dh
+        # Estimated relative error of each interval (len(f) - 1)
+        self.error = error
+        self.output = output
+
+    def _interval(self, f):
+        f = np.asarray(f, dtype=float)
+        if np.any(f < self.f[0]) or np.any(f > self.f[-1]):
+            raise ValueError("Frequency outside of the table")
+        return f, np.clip(np.searchsorted(self.f, f, side="right") - 1, 0, len(self.f) - 2)
+
+    def __call__(self, f):
+        f, k = self._interval(f)
+        return np.exp(_log_interpolate(self.f, self.h, self.dh, k, f))
+
+    def error_estimate(self, f):
+        """ Estimated relative error of the interpolated response at f """
+        _, k = self._interval(f)
+        return self.error[k]
+
+def _log_interpolate(fs, h, dh, k, f):
+    """ Interpolates log(H) in the intervals k at the frequencies f """
+    h0 = h[..., k]
+    h1 = h[..., k + 1]
+    y0 = np.log(h0)
+    # Unwrap the phase across the interval
+    y1 = y0 + np.log(h1 / h0)
+    return _hermite(fs[k], fs[k + 1], y0, y1, dh[..., k] / h0, dh[..., k + 1] / h1, f)
+
+def build_response_table(network, values, f_low, f_high, output="vout", tolerance=1e-4, points=65,
+    max_points=100000):
+    """ Builds a ResponseTable of the response at output between f_low and
+        f_high (Hz).  values are as for Network.get_numeric_solution() and
+        may be batched, in which case the grid is shared.  Intervals are
+        split until the relative error at their midpoint is below tolerance,
+        starting from points uniformly spaced frequencies. """
+
+    def solve(f):
+        x, dx, names = network.get_numeric_derivative(f, values)
+        k = names.index(output)
+        # dH/dw to dH/df
+        return x[..., k], dx[..., k] * omega(1.0)
+
+    f = np.linspace(f_low, f_high, points)
+    h, dh = solve(f)
+    error = np.zeros(len(f) - 1)
+    # Intervals (by their left sample) that still need to be checked
+    pending = np.arange(len(f) - 1)
+    while len(pending) > 0:
+        mid = (f[pending] + f[pending + 1]) / 2
+        hm, dhm = solve(mid)
+        estimate = _log_interpolate(f, h, dh, pending, mid)
+        # Relative error, comparing the logs modulo 2 pi j
+        measured = np.absolute(np.log(hm * np.exp(-estimate)))
+        measured = measured.reshape(-1, len(pending)).max(axis=0) if measured.ndim > 1 else measured
+        # The midpoints are kept either way.  Halving an interval that is
+        # already within tolerance cuts the error of the cubic by ~16, the
+        # others keep the measured error until they are checked again.
+        split = measured > tolerance
+        halves = np.where(split, measured, measured / 16.0)
+        order = np.argsort(np.concatenate([f, mid]), kind="stable")
+        f = np.concatenate([f, mid])[order]
+        h = np.concatenate([h, hm], axis=-1)[..., order]
+        dh = np.concatenate([dh, dhm], axis=-1)[..., order]
+        # Each checked interval k becomes two, the others shift along
+        position = np.arange(len(error)) + np.searchsorted(pending, np.arange(len(error)))
+        new = position[pending]
+        expanded = np.zeros(len(f) - 1)
+        expanded[position] = error
+        expanded[new] = halves
+        expanded[new + 1] = halves
+        error = expanded
+        todo = np.zeros(len(f) - 1, dtype=bool)
+        todo[new] = split
+        todo[new + 1] = split
+        if len(f) > max_points:
+            break
+        pending = np.flatnonzero(todo)
+    return ResponseTable(f, h, dh, error, output)
@@ -0,0 +1,134 @@
+# Selection of crystals from a measured lot (see crystal.py) for the
+# crystal ladder filter (see ladder.py), and the assignment of the
+# selected crystals to the meshes.
+#
+# Trying every choice and permutation is out of the question, so the
+# search is pruned:
+#
+# 1. The lot is sorted by series resonant frequency and each run of N
+#    consecutive crystals (a frequency bin) is scored as a candidate.
+#    Only the best bins are kept.
+# 2. Within each kept bin the meshes are filled greedily, one mesh at a
+#    time, trying each remaining crystal of the bin.
+# 3. A local search then tries every swap of two meshes and every
+#    replacement of one crystal by a nearby unused crystal, keeping the
+#    best improvement until there is none.
+#
+# The candidates of each step (for all of the bins at once) are scored
+# together with one batched numeric solve, with the crystal values on a
+# leading axis.
+#
+import numpy as np
+from ladder import crystal_ladder_network, crystal_ladder_values
+from elements import Crystal
+from response import magnitude_db
+
+class Match:
+    def __init__(self, assignment, score, evaluated):
+        # Index (into the lot) of the crystal for each mesh
+        self.assignment = assignment
+        # RMS deviation (dB) from the target response
+        self.score = score
+        # Number of assignments that were scored during the search
+        self.evaluated = evaluated
+
+def assignment_scores(N, lot, assignments, Rse, Cs_list, Ck_list, f, target_db, weight=None,
+    chunk_size=512):
+    """ Scores assignments (shape (count, N), indices into the lot for each
+        mesh) by the RMS deviation (dB) of the ladder response at the
+        frequencies f from target_db.  weight (one per frequency) can be used
+        to emphasize the passband. """
+    assignments = np.atleast_2d(assignments)
+    network = crystal_ladder_network(N, shared_crystal=False)
+    weight = np.ones(len(f)) if weight is None else np.asarray(weight, dtype=float)
+    weight = weight / np.sum(weight)
+    scores = np.empty(len(assignments))
+    # Chunks keep the (count, len(f), n, n) system to a sensible size
+    for start in range(0, len(assignments), chunk_size):
+        chunk = assignments[start:start + chunk_size]
+        crystals = [Crystal(lot.lm[k], lot.cm[k], lot.rx[k], lot.cp[k]) for k in chunk.T]
+        values = crystal_ladder_values(N, crystals, Rse, Cs_list, Ck_list)
+        x, names = network.get_numeric_solution(f, values)
+        error = magnitude_db(x[..., names.index("vout")]) - target_db
+        scores[start:start + chunk_size] = np.sqrt(np.sum(weight * error ** 2, axis=-1))
+    return scores
+
+def match_crystals(N, lot, Rse, Cs_list, Ck_list, f, target_db, weight=None, bins=8, neighbours=4,
+    exclude=None, max_rounds=50):
+    """ Picks N crystals from the lot (a crystal.CrystalFit) and assigns them
+        to the meshes of the ladder so that the response is as close as
+        possible to target_db (see assignment_scores()).  bins is the number
+        of frequency bins that are searched and neighbours is the number of
+        crystals on either side of a bin that may be swapped in.  Crystals
+        listed in exclude (e.g. already used in another filter) are skipped.
+        Returns a Match. """
+    available = np.setdiff1d(np.arange(len(lot.lm)), [] if exclude is None else exclude)
+    if len(available) < N:
+        raise ValueError("Only " + str(len(available)) + " crystals are available for " + str(N) + " meshes")
+    ordered = available[np.argsort(lot.fs()[available])]
+    evaluated = 0
+
+    def score(assignments):
+        nonlocal evaluated
+        evaluated += len(assignments)
+        return assignment_scores(N, lot, np.array(assignments), Rse, Cs_list, Ck_list, f, target_db, weight)
+
+    # 1. Frequency bins
+    starts = np.arange(len(ordered) - N + 1)
+    windows = ordered[starts[:, np.newaxis] + np.arange(N)]
+    kept = np.argsort(score(windows))[:bins]
+    pools = [ordered[max(i - neighbours, 0):i + N + neighbours] for i in kept]
+
+    # 2. Greedy fill of the meshes.  The meshes that haven't been decided
+    # yet get the rest of the bin in frequency order.
+    current = [list(windows[i]) for i in kept]
+    for mesh in range(N):
+        candidates = []
+        owners = []
+        for w, assignment in enumerate(current):
+            for k in range(mesh, N):
+                rest = assignment[mesh:k] + assignment[k + 1:]
+                candidates.append(assignment[:mesh] + [assignment[k]] + rest)
+                owners.append(w)
+        scores = score(candidates)
+        owners = np.array(owners)
+        for w in range(len(current)):
+            mine = np.flatnonzero(owners == w)
+            current[w] = candidates[mine[np.argmin(scores[mine])]]
+    best = score(current)
+
+    # 3. Local search with swaps and replacements
+    active = list(range(len(current)))
+    for _ in range(max_rounds):
+        if not active:
+            break
+        candidates = []
+        owners = []
+        for w in active:
+            assignment = current[w]
+            for a in range(N):
+                for b in range(a + 1, N):
+                    swapped = list(assignment)
+                    swapped[a], swapped[b] = swapped[b], swapped[a]
+                    candidates.append(swapped)
+                    owners.append(w)
+                for spare in pools[w]:
+                    if spare not in assignment:
+                        replaced = list(assignment)
+                        replaced[a] = spare
+                        candidates.append(replaced)
+                        owners.append(w)
+        scores = score(candidates)
+        owners = np.array(owners)
+        improved = []
+        for w in active:
+            mine = np.flatnonzero(owners == w)
+            k = mine[np.argmin(scores[mine])]
+            if scores[k] < best[w]:
+                current[w] = candidates[k]
+                best[w] = scores[k]
+                improved.append(w)
+        active = improved
+
+    w = int(np.argmin(best))
+    return Match(np.array(current[w]), float(best[w]), evaluated)
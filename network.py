@@ -1,5 +1,25 @@
-from sympy import symbols, Matrix, simplify, zeros, parse_expr, I, re, im
+# NOTE: sympy is only imported when the symbolic features are used so that 
+# numeric-only users just pay for importing NumPy.
 import numpy as np
+import collections
+import hashlib
+from numeric import compile_expression, evaluate_expression, make_namespace, omega, Dual, parts, LUFactorization, rename_symbols, estimate_condition
+from sparse import EliminationPlan
+
+_dtypes = { "single": np.complex64, "double": complex }
+
+def _subset(namespace, mask):
+    """ The namespace restricted to the points selected by mask (with the 
+        batch shape) """
+    return { name: np.broadcast_to(value, mask.shape)[mask] for name, value in namespace.items() }
+
+def _equilibrate(A):
+    """ Row and then column scales (powers of two) that bring the largest 
+        entry of each row and column of A to about 1 """
+    _, e = np.frexp(np.amax(np.absolute(A), axis=-1))
+    rows = np.ldexp(1.0, -e)
+    _, e = np.frexp(np.amax(np.absolute(A * rows[..., :, np.newaxis]), axis=-2))
+    return rows, np.ldexp(1.0, -e)
 
 class Node:
     """ Observable node in the circuit """
@@ -16,10 +36,57 @@ class Edge:
         self.end = end_node
         self.imp = imp_expr
 
+class Solution:
+    """ Symbolic node voltages that are only materialized when they are 
+        requested.  subs() and simplify() return new (lazy) solutions, so a 
+        chain like solution.subs(...).subs(...).simplify()["vout"] only does 
+        the substitutions and simplification for vout.  Each stage caches 
+        its results per node. """
+    def __init__(self, names, compute):
+        self.names = names
+        self._compute = compute
+        self._cache = {}
+        self._compiled = {}
+
+    def __getitem__(self, name):
+        # Nodes can also be requested by position, as with the old matrix
+        if isinstance(name, int):
+            name = self.names[name]
+        if name not in self.names:
+            raise KeyError(name)
+        if name not in self._cache:
+            self._cache[name] = self._compute(name)
+        return self._cache[name]
+
+    def subs(self, *args):
+        """ Same arguments as sympy's subs() """
+        return Solution(self.names, lambda name: self[name].subs(*args))
+
+    def simplify(self):
+        from sympy import simplify
+        return Solution(self.names, lambda name: simplify(self[name]))
+
+    def lambdify(self, args, name):
+        """ Compiles the expression for one node into a function of args 
+            (see sympy's lambdify()). """
+        from sympy import lambdify
+        key = (str(args), name)
+        if key not in self._compiled:
+            self._compiled[key] = lambdify(args, self[name])
+        return self._compiled[key]
+
+    def matrix(self):
+        """ All of the node voltages as a column vector (in names order) """
+        from sympy import Matrix
+        return Matrix([self[name] for name in self.names])
+
 class Network:
     def __init__(self):
         self.edges = []
         self.nodes = {}
+        self.instances = []
+        # See get_elimination_plan()
+        self._plan = None
         # Automatically create ground
         n = self.get_or_create_node("gnd")
         n.ground = True
@@ -39,7 +106,92 @@ class Network:
     def set_input(self, name: str):
         self.nodes[name].input = True
 
-    def get_linear_system(self):
+    def get_topology_key(self):
+        """ A digest of the structure of the network (nodes, edges and 
+            subcircuit instances), independent of the values. """
+        digest = hashlib.blake2b(digest_size=16)
+        for node in self.nodes.values():
+            digest.update(repr((node.name, node.ordinal, node.input, node.ground)).encode())
+        for edge in self.edges:
+            digest.update(repr((edge.start.name, edge.end.name, edge.imp)).encode())
+        for instance in self.instances:
+            digest.update(repr((instance.name, [node.name for node in instance.nodes], 
+                sorted(instance.symbols.items()), instance.subcircuit.ports, 
+                instance.subcircuit.get_topology_key())).encode())
+        return digest.hexdigest()
+
+    def add_subcircuit(self, subcircuit, node_names, symbols=None, name=None):
+        """ Adds an instance of subcircuit with its ports connected to the 
+            nodes node_names (in the order of subcircuit.ports).  symbols 
+            optionally renames the symbols used inside the subcircuit for 
+            this instance, e.g. { "zs": "zs3" }. """
+        if len(node_names) != len(subcircuit.ports):
+            raise ValueError("Expected " + str(len(subcircuit.ports)) + " nodes for the subcircuit ports")
+        nodes = [self.get_or_create_node(n) for n in node_names]
+        if name is None:
+            name = "x" + str(len(self.instances) + 1)
+        self.instances.append(Instance(name, subcircuit, nodes, dict(symbols or {})))
+
+    def _stamp_kcl(self, A, node, known=None):
+        """ Adds the KCL expression for node to the symbolic matrix A.  known 
+            maps symbols to the values that are substituted in first. """
+        from sympy import parse_expr
+        # Look at all of the edges that touch the node.  Edges that 
+        # touch add/subtract current.
+        for edge in self.edges:
+            if edge.start == node or edge.end == node:
+                z = parse_expr(edge.imp, evaluate=False)
+                if known:
+                    z = z.xreplace(known)
+                contrib = 1.0 / z
+                # The direction of contribution depends on whether this 
+                # is an out-flowing branch or an in-flowing one.
+                if edge.end == node:
+                    A[node.ordinal, edge.start.ordinal] -= contrib
+                    A[node.ordinal, edge.end.ordinal] += contrib
+                else:
+                    A[node.ordinal, edge.start.ordinal] += contrib
+                    A[node.ordinal, edge.end.ordinal] -= contrib
+        # Subcircuit instances contribute through their port admittance
+        for instance in self.instances:
+            if node in instance.nodes:
+                y = instance.subcircuit.get_port_admittance(instance.symbols)
+                if known:
+                    y = y.xreplace(known)
+                i = instance.nodes.index(node)
+                for j, other in enumerate(instance.nodes):
+                    A[node.ordinal, other.ordinal] += y[i, j]
+
+    def _known_values(self, values, keep):
+        """ Converts the values for get_solution() into sympy expressions.  
+            Numbers and strings are taken as they are and the models in 
+            elements.py are evaluated with a symbolic s. """
+        from sympy import Symbol, sympify, parse_expr
+        values = dict(values or {})
+        if keep is not None:
+            keep = set(keep)
+            both = [name for name in values if name in keep]
+            if both:
+                raise ValueError("Symbols can't be both kept and given a value: " + ", ".join(both))
+            missing = [name for name in self.get_symbol_names() 
+                if name not in values and name not in keep and name not in ("s", "w")]
+            if missing:
+                raise ValueError("No value provided for symbols: " + ", ".join(missing))
+        s = Symbol("s")
+        known = {}
+        for name, value in values.items():
+            if isinstance(value, str):
+                value = parse_expr(value)
+            elif callable(value):
+                value = value(s)
+            known[Symbol(name)] = sympify(value)
+        return known
+
+    def get_linear_system(self, values=None, keep=None):
+        """ Creates the symbolic system A x = b.  values and keep are as for 
+            get_solution(). """
+        from sympy import Matrix
+        known = self._known_values(values, keep)
 
         # Create the system of equations based on the KCL for each node.
         # Start off with zeros
@@ -62,23 +214,494 @@ class Network:
             else:
                 # Sum of the currents is always zero
                 b[node.ordinal] = 0
-                # Look at all of the edges that touch the node.  Edges that 
-                # touch add/subtract current.
-                for edge in self.edges:
-                    if edge.start == node or edge.end == node:
-                        contrib = 1.0 / parse_expr(edge.imp, evaluate=False)
-                        # The direction of contribution depends on whether this 
-                        # is an out-flowing branch or an in-flowing one.
-                        if edge.end == node:
-                            A[node.ordinal, edge.start.ordinal] -= contrib
-                            A[node.ordinal, edge.end.ordinal] += contrib
-                        else:
-                            A[node.ordinal, edge.start.ordinal] += contrib
-                            A[node.ordinal, edge.end.ordinal] -= contrib
+                self._stamp_kcl(A, node, known)
+        return A, b, names
+
+    def get_solution(self, values=None, keep=None):
+        """ Returns the (lazy) symbolic solution for the node voltages.  
+            Nothing is solved until the first node is requested.  values 
+            maps symbols to known values (numbers, expressions or the models 
+            in elements.py, which are written in terms of s), which are 
+            substituted before the elimination so that it works on much 
+            smaller expressions.  keep lists the symbols that are to stay 
+            free (s is always free); when it is given every other symbol 
+            needs a value. """
+        # Check the values now rather than on first use
+        self._known_values(values, keep)
+        names = [None] * len(self.nodes)
+        for node in self.nodes.values():
+            names[node.ordinal] = node.name
+        solved = []
+        def solve(name):
+            if not solved:
+                a, b, _ = self.get_linear_system(values, keep)
+                # Solve for the node voltages
+                solved.append(a.LUsolve(b))
+            return solved[0][names.index(name)]
+        return Solution(names, solve)
+
+    def get_parallel_solution(self, outputs=None, values=None, keep=None, workers=None, 
+        timeout=None, progress=None):
+        """ Same as get_solution(), but for large networks: the node voltages 
+            in outputs (all of them by default) are solved with Cramer's rule 
+            and the determinants are spread over a pool of workers processes 
+            (see parallel.py).  progress(done, total) is called as the 
+            determinants finish and TimeoutError is raised if the solve takes 
+            more than timeout seconds.  Only the outputs (and the input and 
+            ground nodes) are available from the solution. """
+        from parallel import reduce_system, cramer_solve
+        a, b, names = self.get_linear_system(values, keep)
+        known = { node.ordinal: 1 if node.input == True else 0 
+            for node in self.nodes.values() if node.input == True or node.ground == True }
+        a, b, unknown = reduce_system(a, b, names, known)
+        if outputs is None:
+            outputs = unknown
+        outputs = [name for name in outputs if name in unknown]
+        x = cramer_solve(a, b, [unknown.index(name) for name in outputs], workers, timeout, progress)
+        solved = dict(zip(outputs, x))
+        for k, value in known.items():
+            solved[names[k]] = value
+        def solve(name):
+            if name not in solved:
+                raise KeyError(name + " wasn't one of the outputs")
+            return solved[name]
+        return Solution(names, solve)
+
+    def flatten(self):
+        """ Returns an equivalent network with every subcircuit instance 
+            expanded in place.  Internal subcircuit nodes are named 
+            "<instance>.<node>". """
+        flat = Network()
+        for name in self._get_names():
+            flat.get_or_create_node(name)
+            if self.nodes[name].input == True:
+                flat.set_input(name)
+        for edge in self.edges:
+            flat.add_element(edge.start.name, edge.end.name, edge.imp)
+        for instance in self.instances:
+            instance.expand(flat)
+        return flat
+
+    def _get_names(self):
+        names = [None] * len(self.nodes)
+        for node in self.nodes.values():
+            names[node.ordinal] = node.name
+        return names
+
+    def get_symbol_names(self):
+        """ Returns the names referenced by the impedance expressions, in the 
+            order that they are first used. """
+        names = []
+        for edge in self.edges:
+            for name in compile_expression(edge.imp)[1]:
+                if name not in names:
+                    names.append(name)
+        for instance in self.instances:
+            for name in instance.subcircuit.get_symbol_names():
+                name = instance.symbols.get(name, name)
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def _nodal_numeric(self, namespace, dtype=complex):
+        """ Numeric nodal admittance matrix with a KCL row for every node.  
+            The impedance of each edge is evaluated using namespace and the 
+            resulting admittances are stamped into a stack of matrices.  When 
+            s (or any of the values) in the namespace is a Dual the derivative 
+            is stamped as well, otherwise dY is None. """
+        n = len(self.nodes)
+        ys = [(edge.start.ordinal, edge.end.ordinal, 1.0 / evaluate_expression(edge.imp, namespace)) 
+            for edge in self.edges]
+        ports = [(instance.get_ordinals(), instance.get_numeric_port_admittance(namespace)) 
+            for instance in self.instances]
+        derivative = (isinstance(namespace["s"], Dual) or any(isinstance(y, Dual) for _, _, y in ys) 
+            or any(dy is not None for _, (_, dy) in ports))
+        ys = [(a, b, parts(y)) for a, b, y in ys]
+        shape = np.broadcast_shapes(np.shape(parts(namespace["s"])[0]), *[np.shape(y[0]) for _, _, y in ys],
+            *[np.shape(y[0])[:-2] for _, y in ports])
+        Y = np.zeros(shape + (n, n), dtype=dtype)
+        dY = None
+        if derivative:
+            dY = np.zeros(shape + (n, n), dtype=complex)
+        for a, b, (y, dy) in ys:
+            if a == b:
+                continue
+            Y[..., a, a] += y
+            Y[..., b, b] += y
+            Y[..., a, b] -= y
+            Y[..., b, a] -= y
+            if dY is not None:
+                dY[..., a, a] += dy
+                dY[..., b, b] += dy
+                dY[..., a, b] -= dy
+                dY[..., b, a] -= dy
+        for ordinals, (y, dy) in ports:
+            for i, a in enumerate(ordinals):
+                for j, b in enumerate(ordinals):
+                    Y[..., a, b] += y[..., i, j]
+                    if dy is not None:
+                        dY[..., a, b] += dy[..., i, j]
+        return Y, dY
+
+    def _stamp_numeric(self, namespace, dtype=complex):
+        """ Numeric counterpart of get_linear_system().  Returns A, dA (None 
+            unless the namespace holds Duals), b and the names. """
+        A, dA = self._nodal_numeric(namespace, dtype)
+        b = np.zeros(len(self.nodes), dtype=dtype)
+        names = [None] * len(self.nodes)
+        for node in self.nodes.values():
+            names[node.ordinal] = node.name
+            # No KCL for the input and ground nodes, their voltages are fixed
+            if node.input == True or node.ground == True:
+                A[..., node.ordinal, :] = 0
+                A[..., node.ordinal, node.ordinal] = 1.0
+                if dA is not None:
+                    dA[..., node.ordinal, :] = 0
+                if node.input == True:
+                    b[node.ordinal] = 1.0
+        return A, dA, b, names
+
+    def get_numeric_system(self, f, values, precision="double"):
+        """ Creates the linear system numerically at the frequencies f (Hz).  
+            values maps each symbol used in the impedance expressions to a 
+            numeric impedance or to a callable of s (see elements.py).  
+            Returns A with shape (..., len(f), n, n), b and the node names. 
+            With precision="single" A and b are complex64 (the impedances 
+            are still evaluated in double, since the reactances of a high-Q 
+            resonator cancel near resonance). """
+        if precision not in _dtypes:
+            raise ValueError("precision must be 'single' or 'double'")
+        s = 1j * omega(f)
+        namespace = make_namespace(self.get_symbol_names(), values, s)
+        A, _, b, names = self._stamp_numeric(namespace, _dtypes[precision])
         return A, b, names
 
-    def get_solution(self):
-        a, b, names = self.get_linear_system()
-        # Solve for the node voltages
-        x = a.LUsolve(b)
+    def get_numeric_solution(self, f, values, precision="double", tolerance=1e-4, db=None):
+        """ Solves for the node voltages numerically.  Returns x with shape 
+            (..., len(f), n) and the node names.  precision="single" stamps 
+            in double, equilibrates the system the same way as 
+            get_equilibrated_solution() and factors it in complex64.  The 
+            error of each node voltage is then estimated with one step of 
+            iterative refinement (the residual is computed in double and 
+            solved in single), and the points where the estimate is above 
+            tolerance relative to any node voltage are solved again in 
+            double.  This catches the ill-conditioned points of high-Q 
+            networks, e.g. the deep stopband of a crystal ladder.  x is 
+            complex64 either way.  With db (a designdb.DesignDatabase) the 
+            solution is looked up in (or added to) the database. """
+        if db is not None:
+            return db.get_numeric_solution(self, f, values, precision=precision)
+        if precision == "double":
+            A, b, names = self.get_numeric_system(f, values)
+            return np.linalg.solve(A, b), names
+        if precision != "single":
+            raise ValueError("precision must be 'single' or 'double'")
+        s = 1j * omega(f)
+        namespace = make_namespace(self.get_symbol_names(), values, s)
+        A, _, b, names = self._stamp_numeric(namespace)
+        rows, columns = _equilibrate(A)
+        A32 = (A * rows[..., :, np.newaxis] * columns[..., np.newaxis, :]).astype(np.complex64)
+        b32 = (b * rows).astype(np.complex64)
+        try:
+            y = np.linalg.solve(A32, b32[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            # Singular once rounded to single precision
+            return np.linalg.solve(A, b).astype(np.complex64), names
+        x = y * columns
+        residual = (b - np.einsum("...ij,...j->...i", A, x)) * rows
+        dy = np.linalg.solve(A32, residual.astype(np.complex64)[..., np.newaxis])[..., 0]
+        with np.errstate(invalid="ignore"):
+            bad = np.any(np.absolute(dy) > tolerance * np.absolute(y), axis=-1)
+        x = x.astype(np.complex64)
+        if np.any(bad):
+            # Solve just the (few) ill-conditioned points in double
+            x[bad] = np.linalg.solve(A[bad], b)
         return x, names
+
+    def get_equilibrated_solution(self, f, values, precision="double", refine=1, condition=False):
+        """ Solves for the node voltages with the system equilibrated first: 
+            each row and then each column of A is scaled by a power of two 
+            so that its largest entry is about 1.  This takes care of the 
+            impedance and frequency scaling of the network (crystal arms, 
+            coupling capacitors and the fixed input and ground rows end up 
+            on the same scale) without changing the rounding of any entry.  
+            With precision="single" the factorization is done in complex64 
+            and refine steps of iterative refinement, with the residuals in 
+            double, bring the result back to double precision accuracy 
+            whenever the condition number is well below 1 / eps32 (in 
+            double, refinement gains nothing and refine is ignored).  With 
+            condition, the 1-norm condition estimates of the equilibrated 
+            matrices are returned as well (otherwise None).  Returns x 
+            (complex128, shape (..., len(f), n)), the node names and the 
+            condition estimates. """
+        if precision not in _dtypes:
+            raise ValueError("precision must be 'single' or 'double'")
+        A, b, names = self.get_numeric_system(f, values)
+        rows, columns = _equilibrate(A)
+        A = A * rows[..., :, np.newaxis] * columns[..., np.newaxis, :]
+        b = b * rows
+        lu = None
+        if precision == "double":
+            y = np.linalg.solve(A, b[..., np.newaxis])[..., 0]
+        else:
+            lu = LUFactorization(A, np.complex64)
+            y = lu.solve(b).astype(complex)
+            for _ in range(refine):
+                residual = b - np.einsum("...ij,...j->...i", A, y)
+                y += lu.solve(residual)
+        estimate = None
+        if condition:
+            estimate = estimate_condition(A, LUFactorization(A) if lu is None else lu)
+        return y * columns, names, estimate
+
+    def get_elimination_plan(self):
+        """ The sparse elimination plan for the current topology (see 
+            sparse.py).  It is only recomputed when the topology changes. """
+        key = self.get_topology_key()
+        if self._plan is None or self._plan.key != key:
+            self._plan = EliminationPlan(self)
+        return self._plan
+
+    def get_sparse_solution(self, f, values):
+        """ Same as get_numeric_solution(), but using the sparse elimination 
+            plan so that only the numeric factorization is done for each 
+            point.  This pays off for large networks (100+ nodes).  Points 
+            with a tiny pivot in the static order, or too much growth in 
+            the factors, are solved densely. """
+        s = 1j * omega(f)
+        namespace = make_namespace(self.get_symbol_names(), values, s)
+        plan = self.get_elimination_plan()
+        x, bad = plan.solve(self, namespace)
+        if np.any(bad):
+            A, _, b, _ = self._stamp_numeric(_subset(namespace, bad))
+            x[bad] = np.linalg.solve(A, b)
+        return x, list(plan.names)
+
+    def get_variant_solution(self, f, variants):
+        """ Solves the network for several variants (different element 
+            models or value sets) in a single numeric call.  variants maps 
+            each variant name to a values dict, as used by 
+            get_numeric_solution().  The variants are stacked on a new 
+            leading axis of x, in the order given. """
+        variants = dict(variants)
+        s = 1j * omega(f)
+        symbols = self.get_symbol_names()
+        spaces = []
+        for variant_name, values in variants.items():
+            for name in symbols:
+                if name not in values and name not in ("s", "w"):
+                    raise ValueError("Variant '" + str(variant_name) + "' has no value for symbol '" + name + "'")
+            spaces.append(make_namespace(symbols, values, s))
+        namespace = { "s": s, "w": s / 1j }
+        for name in symbols:
+            if name in namespace:
+                continue
+            zs = [space[name] for space in spaces]
+            shape = np.broadcast_shapes(np.shape(s), *[np.shape(z) for z in zs])
+            namespace[name] = np.stack([np.broadcast_to(z, shape) for z in zs])
+        A, _, b, names = self._stamp_numeric(namespace)
+        return np.linalg.solve(A, b), names
+
+    def get_numeric_derivative(self, f, values):
+        """ Solves for the node voltages and their exact derivatives with 
+            respect to w (rad/sec).  The derivative comes from 
+            dV/dw = -A^-1 (dA/dw) V, reusing the LU factorization from the 
+            forward solve.  Returns x, dx (both with shape (..., len(f), n))
+            and the node names. """
+        w = omega(f)
+        s = Dual(1j * w, 1j * np.ones_like(w))
+        namespace = make_namespace(self.get_symbol_names(), values, s)
+        A, dA, b, names = self._stamp_numeric(namespace)
+        lu = LUFactorization(A)
+        x = lu.solve(b)
+        dx = -lu.solve(np.einsum("...ij,...j->...i", dA, x))
+        return x, dx, names
+
+    def get_numeric_noise(self, f, values, output="vout", temperature=290.0):
+        """ Thermal noise at output contributed by each lossy element.  One
+            adjoint solve A^T z = e_output per point gives the transfer from
+            a current injected at any node to the output (z), so an edge
+            with admittance y between a and b contributes
+            4kT Re(y) |z[a] - z[b]|^2 and a subcircuit instance with port
+            admittance Y contributes 2kT t^T (Y + Y^H) conj(t) for the
+            transfers t of its ports.  Returns the noise power densities
+            (V^2/Hz) with shape (..., len(f), elements) and the element
+            names: the impedance of each edge (followed by its nodes when
+            more than one edge uses it) and then the instance names. """
+        k = 1.380649e-23
+        s = 1j * omega(f)
+        namespace = make_namespace(self.get_symbol_names(), values, s)
+        A, _, b, names = self._stamp_numeric(namespace)
+        if output not in names:
+            raise ValueError("No node named '" + output + "'")
+        lu = LUFactorization(A)
+        e = np.zeros(len(names))
+        e[names.index(output)] = 1.0
+        z = lu.solve(e, trans=True)
+        # Current can't be injected into the nodes with fixed voltages
+        for node in self.nodes.values():
+            if node.input == True or node.ground == True:
+                z[..., node.ordinal] = 0
+        noise = []
+        elements = []
+        counts = collections.Counter(edge.imp for edge in self.edges)
+        for edge in self.edges:
+            y = 1.0 / evaluate_expression(edge.imp, namespace)
+            t = z[..., edge.start.ordinal] - z[..., edge.end.ordinal]
+            noise.append(4 * k * temperature * np.real(y) * np.absolute(t) ** 2)
+            elements.append(edge.imp if counts[edge.imp] == 1 else
+                edge.imp + "(" + edge.start.name + "," + edge.end.name + ")")
+        for instance in self.instances:
+            Y = instance.get_numeric_port_admittance(namespace)[0]
+            t = z[..., instance.get_ordinals()]
+            C = Y + np.conj(np.swapaxes(Y, -1, -2))
+            noise.append(2 * k * temperature * np.real(np.einsum("...i,...ij,...j->...", t, C, np.conj(t))))
+            elements.append(instance.name)
+        shape = z.shape[:-1]
+        return np.stack([np.broadcast_to(n, shape) for n in noise], axis=-1), elements
+
+    def get_numeric_gradient(self, f, make_values, p):
+        """ Solves for the node voltages and their exact derivatives with 
+            respect to the parameters p.  make_values(p) must return the 
+            values dict (as for get_numeric_solution()) for a list of 
+            parameter values.  Each parameter is passed as a Dual in turn to 
+            stamp dA/dp, and dV/dp = -A^-1 (dA/dp) V reuses one LU 
+            factorization.  Returns x, dx (with shape (len(p), ..., len(f), 
+            n)) and the node names. """
+        s = 1j * omega(f)
+        symbols = self.get_symbol_names()
+        A, _, b, names = self._stamp_numeric(make_namespace(symbols, make_values(list(p)), s))
+        lu = LUFactorization(A)
+        x = lu.solve(b)
+        rhs = []
+        for k in range(len(p)):
+            pk = list(p)
+            pk[k] = Dual(p[k], 1.0)
+            _, dA, _, _ = self._stamp_numeric(make_namespace(symbols, make_values(pk), s))
+            if dA is None:
+                # The parameter isn't used
+                rhs.append(np.zeros_like(x))
+            else:
+                rhs.append(np.einsum("...ij,...j->...i", dA, x))
+        dx = -lu.solve(np.stack(rhs))
+        return x, dx, names
+
+class Instance:
+    """ One use of a Subcircuit inside a Network """
+    def __init__(self, name, subcircuit, nodes, symbols):
+        self.name = name
+        self.subcircuit = subcircuit
+        self.nodes = nodes
+        self.symbols = symbols
+
+    def get_ordinals(self):
+        return [node.ordinal for node in self.nodes]
+
+    def get_numeric_port_admittance(self, namespace):
+        # Bind the subcircuit symbols to the values of the parent symbols
+        # that they were renamed to
+        inner = { "s": namespace["s"], "w": namespace["w"] }
+        for name in self.subcircuit.get_symbol_names():
+            outer = self.symbols.get(name, name)
+            if outer in namespace:
+                inner[name] = namespace[outer]
+        return self.subcircuit.get_numeric_port_admittance(inner)
+
+    def expand(self, flat):
+        """ Adds the edges of the subcircuit to the flat network """
+        sub = self.subcircuit.flatten()
+        mapping = { "gnd": "gnd" }
+        for port, node in zip(self.subcircuit.ports, self.nodes):
+            mapping[port] = node.name
+        for edge in sub.edges:
+            start = mapping.get(edge.start.name, self.name + "." + edge.start.name)
+            end = mapping.get(edge.end.name, self.name + "." + edge.end.name)
+            flat.add_element(start, end, rename_symbols(edge.imp, self.symbols))
+
+def _value_key(x):
+    """ Content key for a (possibly Dual) numeric value """
+    key = []
+    for a in parts(x):
+        a = np.ascontiguousarray(a)
+        key.append((a.shape, a.dtype.str, hashlib.blake2b(a.tobytes(), digest_size=16).digest()))
+    return tuple(key)
+
+class Subcircuit(Network):
+    """ A network with named ports that can be instantiated many times using 
+        Network.add_subcircuit().  The internal nodes are eliminated once into 
+        a port admittance matrix (the Schur complement 
+        Ypp - Ypi Yii^-1 Yip), which is cached both symbolically and, per set 
+        of numeric values, numerically.  Ground is shared with the parent. """
+
+    # Number of numeric port admittances kept per subcircuit
+    cache_size = 32
+
+    def __init__(self, ports):
+        super().__init__()
+        self.ports = list(ports)
+        for name in self.ports:
+            self.get_or_create_node(name)
+        self._symbolic_ports = None
+        self._numeric_ports = collections.OrderedDict()
+
+    def set_input(self, name: str):
+        raise ValueError("Subcircuits are driven through their ports")
+
+    def _partition(self):
+        """ Returns the ordinals of the ports and of the internal nodes """
+        p = [self.nodes[name].ordinal for name in self.ports]
+        i = [node.ordinal for node in self.nodes.values() 
+            if node.ground == False and node.ordinal not in p]
+        return p, i
+
+    def get_port_admittance(self, symbols=None):
+        """ Returns the symbolic port admittance matrix, with the symbols 
+            renamed as given. """
+        from sympy import zeros, Symbol
+        # The cache is keyed by the topology, so that elements added after
+        # a solve are picked up
+        topology = self.get_topology_key()
+        if self._symbolic_ports is None or self._symbolic_ports[0] != topology:
+            Y = zeros(len(self.nodes), len(self.nodes))
+            for node in self.nodes.values():
+                if node.ground == False:
+                    self._stamp_kcl(Y, node)
+            p, i = self._partition()
+            y = Y.extract(p, p)
+            if i:
+                y = y - Y.extract(p, i) * Y.extract(i, i).LUsolve(Y.extract(i, p))
+            self._symbolic_ports = (topology, y)
+        y = self._symbolic_ports[1]
+        if not symbols:
+            return y
+        return y.xreplace({ Symbol(k): Symbol(v) for k, v in symbols.items() })
+
+    def get_numeric_port_admittance(self, namespace):
+        """ Returns the numeric port admittance (and its derivative, or None) 
+            for the evaluated impedances in namespace. """
+        key = (self.get_topology_key(),) + tuple((name, _value_key(namespace[name])) 
+            for name in ["s"] + self.get_symbol_names() if name in namespace)
+        if key in self._numeric_ports:
+            self._numeric_ports.move_to_end(key)
+            return self._numeric_ports[key]
+        Y, dY = self._nodal_numeric(namespace)
+        p, i = self._partition()
+        y = Y[..., p, :][..., :, p]
+        dy = None if dY is None else dY[..., p, :][..., :, p]
+        if i:
+            yii = Y[..., i, :][..., :, i]
+            yip = Y[..., i, :][..., :, p]
+            ypi = Y[..., p, :][..., :, i]
+            x = np.linalg.solve(yii, yip)
+            y = y - ypi @ x
+            if dY is not None:
+                dyii = dY[..., i, :][..., :, i]
+                dyip = dY[..., i, :][..., :, p]
+                dypi = dY[..., p, :][..., :, i]
+                dx = np.linalg.solve(yii, dyip - dyii @ x)
+                dy = dy - dypi @ x - ypi @ dx
+        result = (y, dy)
+        self._numeric_ports[key] = result
+        if len(self._numeric_ports) > self.cache_size:
+            self._numeric_ports.popitem(last=False)
+        return result
@@ -0,0 +1,191 @@
+# Numeric (NumPy) support for evaluating networks without sympy.
+#
+import ast
+import functools
+import numpy as np
+
+@functools.lru_cache(maxsize=None)
+def compile_expression(expr: str):
+    """ Compiles an impedance expression (e.g. "zs1 + zx") once so that it
+        can be evaluated repeatedly with arrays bound to the symbol names.
+        Returns the code object and the names that it references. """
+    code = compile(expr, "<impedance>", "eval")
+    return code, code.co_names
+
+def evaluate_expression(expr: str, namespace):
+    """ Evaluates an impedance expression using the values in namespace. """
+    code, names = compile_expression(expr)
+    for name in names:
+        if name not in namespace:
+            raise ValueError("No value provided for symbol '" + name + "' in '" + expr + "'")
+    return eval(code, {"__builtins__": {}}, namespace)
+
+def rename_symbols(expr: str, mapping):
+    """ Renames the symbols in an impedance expression """
+    if not mapping:
+        return expr
+    tree = ast.parse(expr, mode="eval")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in mapping:
+            node.id = mapping[node.id]
+    return ast.unparse(tree)
+
+def evaluate_value(value, s):
+    """ Turns a user-provided value into an impedance at s.  Callables (like
+        the models in elements.py) are called with s, anything else is taken
+        to be a frequency-independent impedance. """
+    if callable(value):
+        return value(s)
+    return value
+
+def make_namespace(names, values, s):
+    """ Builds the namespace used to evaluate impedance expressions.  s and w
+        are always available. """
+    namespace = { "s": s, "w": s / 1j }
+    for name in names:
+        if name in values:
+            namespace[name] = evaluate_value(values[name], s)
+    return namespace
+
+def omega(f):
+    """ Convert the frequency in Hz to frequency in Radians/second """
+    return 2.0 * np.pi * np.asarray(f, dtype=float)
+
+class Dual:
+    """ A value together with its derivative with respect to one variable 
+        (forward-mode differentiation).  Impedance expressions and the 
+        models in elements.py only use arithmetic, so evaluating them with 
+        s = Dual(jw, j) gives dZ/dw exactly alongside Z. """
+
+    # Make NumPy hand arithmetic with arrays back to the methods below
+    __array_ufunc__ = None
+
+    def __init__(self, value, deriv):
+        self.value = value
+        self.deriv = deriv
+
+    def __add__(self, other):
+        v, d = parts(other)
+        return Dual(self.value + v, self.deriv + d)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        v, d = parts(other)
+        return Dual(self.value - v, self.deriv - d)
+
+    def __rsub__(self, other):
+        v, d = parts(other)
+        return Dual(v - self.value, d - self.deriv)
+
+    def __mul__(self, other):
+        v, d = parts(other)
+        return Dual(self.value * v, self.deriv * v + self.value * d)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        v, d = parts(other)
+        return Dual(self.value / v, (self.deriv * v - self.value * d) / (v * v))
+
+    def __rtruediv__(self, other):
+        v, d = parts(other)
+        return Dual(v / self.value, (d * self.value - v * self.deriv) / (self.value * self.value))
+
+    def __pow__(self, n):
+        return Dual(self.value ** n, n * self.value ** (n - 1) * self.deriv)
+
+    def __neg__(self):
+        return Dual(-self.value, -self.deriv)
+
+    def __pos__(self):
+        return self
+
+def parts(x):
+    """ Returns the value and derivative of x (the derivative of anything 
+        that isn't a Dual is zero). """
+    if isinstance(x, Dual):
+        return x.value, x.deriv
+    return x, 0
+
+def _swap_rows(a, k, p):
+    """ Swaps row k with row p[...] in each matrix of the stack a. """
+    idx = np.broadcast_to(p[..., np.newaxis, np.newaxis], a.shape[:-2] + (1, a.shape[-1]))
+    row_p = np.take_along_axis(a, idx, axis=-2)
+    row_k = a[..., k:k+1, :].copy()
+    a[..., k:k+1, :] = row_p
+    np.put_along_axis(a, idx, row_k, axis=-2)
+
+class LUFactorization:
+    """ LU factorization (with partial pivoting) of a stack of matrices with 
+        shape (..., n, n).  The factorization is done once and can then be 
+        used for any number of solves, including solves with the transposed 
+        matrices.  dtype=np.complex64 factors (and solves) in single 
+        precision. """
+
+    def __init__(self, a, dtype=complex):
+        lu = np.array(a, dtype=dtype)
+        n = lu.shape[-1]
+        perm = np.broadcast_to(np.arange(n), lu.shape[:-1]).copy()
+        for k in range(n):
+            # Pick the largest pivot in the column 
+            p = k + np.argmax(np.abs(lu[..., k:, k]), axis=-1)
+            if np.any(p != k):
+                _swap_rows(lu, k, p)
+                _swap_rows(perm[..., np.newaxis], k, p)
+            pivot = lu[..., k, k]
+            if np.any(pivot == 0):
+                raise np.linalg.LinAlgError("Singular matrix")
+            lu[..., k+1:, k] /= pivot[..., np.newaxis]
+            lu[..., k+1:, k+1:] -= lu[..., k+1:, k, np.newaxis] * lu[..., np.newaxis, k, k+1:]
+        self.lu = lu
+        self.perm = perm
+
+    def _prepare(self, b):
+        shape = np.broadcast_shapes(np.shape(b), self.lu.shape[:-1])
+        return np.array(np.broadcast_to(b, shape), dtype=self.lu.dtype), np.broadcast_to(self.perm, shape)
+
+    def solve(self, b, trans=False):
+        """ Solves A x = b (or A^T x = b when trans is True).  b has shape 
+            (..., n) and is broadcast against the stack of matrices. """
+        lu = self.lu
+        n = lu.shape[-1]
+        x, perm = self._prepare(b)
+        if not trans:
+            x = np.take_along_axis(x, perm, axis=-1)
+            # Forward substitution (L has a unit diagonal)
+            for i in range(1, n):
+                x[..., i] -= np.sum(lu[..., i, :i] * x[..., :i], axis=-1)
+            # Back substitution
+            for i in reversed(range(n)):
+                x[..., i] = (x[..., i] - np.sum(lu[..., i, i+1:] * x[..., i+1:], axis=-1)) / lu[..., i, i]
+            return x
+        else:
+            # A^T = U^T L^T P
+            for i in range(n):
+                x[..., i] = (x[..., i] - np.sum(lu[..., :i, i] * x[..., :i], axis=-1)) / lu[..., i, i]
+            for i in reversed(range(n - 1)):
+                x[..., i] -= np.sum(lu[..., i+1:, i] * x[..., i+1:], axis=-1)
+            result = np.empty_like(x)
+            np.put_along_axis(result, perm, x, axis=-1)
+            return result
+
+def estimate_condition(a, lu, iterations=5):
+    """ Estimates the 1-norm condition number of each matrix in the stack a 
+        from its LUFactorization lu, without forming the inverse (Hager's 
+        method, as in LAPACK's xGECON: a few solves with A and A^H that 
+        look for the column of A^-1 with the largest norm). """
+    n = a.shape[-1]
+    x = np.full(a.shape[:-1], 1.0 / n, dtype=complex)
+    estimate = np.zeros(a.shape[:-2])
+    for _ in range(iterations):
+        y = lu.solve(x)
+        estimate = np.maximum(estimate, np.sum(np.absolute(y), axis=-1))
+        magnitude = np.absolute(y)
+        xi = np.where(magnitude == 0, 1.0, y / np.where(magnitude == 0, 1.0, magnitude))
+        # A^-H xi, from the solve with A^T
+        z = np.conj(lu.solve(np.conj(xi), trans=True))
+        j = np.argmax(np.absolute(z), axis=-1)
+        x = np.zeros_like(x)
+        np.put_along_axis(x, j[..., np.newaxis], 1.0, axis=-1)
+    return np.amax(np.sum(np.absolute(a), axis=-2), axis=-1) * estimate
@@ -0,0 +1,114 @@
+# Gradient-based tuning of element values against a target response mask.
+#
+# The response is fitted with a bounded Levenberg-Marquardt iteration on
+# the mask violations.  The Jacobian comes from the analytic derivatives
+# in Network.get_numeric_gradient(), so each iteration costs one
+# factorization per frequency plus a few cheap re-stamps.
+#
+import math
+import numpy as np
+from response import magnitude_db
+
+def passband_mask(f, fc, bw, ripple_db=1.0, loss_db=0.0, stop_bw=None, stop_db=None):
+    """ Creates the (lower_db, upper_db) limits at the frequencies f for a
+        band-pass response centred on fc.  Inside fc +/- bw/2 the response
+        must be within ripple_db of -loss_db (above and below).  Outside
+        fc +/- stop_bw/2 it must be below -stop_db.  Anything else is
+        unconstrained. """
+    f = np.asarray(f, dtype=float)
+    lower = np.full(f.shape, -np.inf)
+    upper = np.full(f.shape, np.inf)
+    inside = np.absolute(f - fc) <= bw / 2.0
+    lower[inside] = -loss_db - ripple_db
+    upper[inside] = -loss_db + ripple_db
+    if stop_bw is not None and stop_db is not None:
+        upper[np.absolute(f - fc) >= stop_bw / 2.0] = -stop_db
+    return lower, upper
+
+class OptimizeResult:
+    def __init__(self, p, cost, iterations, converged):
+        # The final parameter values
+        self.p = p
+        # Sum of the squared mask violations (dB^2)
+        self.cost = cost
+        self.iterations = iterations
+        self.converged = converged
+
+def mask_violations(network, make_values, p, f, lower_db, upper_db, output="vout"):
+    """ Returns the mask violations (dB) at each frequency, without the
+        Jacobian (see mask_residuals()). """
+    x, names = network.get_numeric_solution(f, make_values(list(p)))
+    mag = magnitude_db(x[..., names.index(output)])
+    return np.where(mag < lower_db, lower_db - mag, 0.0) + np.where(mag > upper_db, mag - upper_db, 0.0)
+
+def mask_residuals(network, make_values, p, f, lower_db, upper_db, output="vout"):
+    """ Returns the mask violations (dB) at each frequency and their Jacobian
+        with respect to p (shape (len(f), len(p))). """
+    x, dx, names = network.get_numeric_gradient(f, make_values, p)
+    h = x[..., names.index(output)]
+    dh = dx[..., names.index(output)]
+    mag = magnitude_db(h)
+    # d(20 log10|h|)/dp
+    dmag = (20.0 / math.log(10.0)) * np.real(dh / h)
+    below = mag < lower_db
+    above = mag > upper_db
+    r = np.where(below, lower_db - mag, 0.0) + np.where(above, mag - upper_db, 0.0)
+    J = np.where(below, -dmag, 0.0) + np.where(above, dmag, 0.0)
+    return r, J.T
+
+def optimize_mask(network, make_values, p0, f, lower_db, upper_db, bounds=None, output="vout",
+    max_iter=100, tol=1e-9):
+    """ Adjusts the parameters p (starting from p0) so that the response at
+        output fits between lower_db and upper_db (see passband_mask()).
+        make_values(p) returns the values dict for a list of parameters, as
+        for Network.get_numeric_gradient().  bounds is a list of (low, high)
+        pairs (None for no limit).  Returns an OptimizeResult, which is
+        not converged if the iteration stalls or reaches max_iter. """
+    p = np.array(p0, dtype=float)
+    # Work on parameters scaled to the starting point, since component
+    # values are often in pF
+    scale = np.where(p != 0, np.absolute(p), 1.0)
+    lo = np.full(p.shape, -np.inf)
+    hi = np.full(p.shape, np.inf)
+    if bounds is not None:
+        for k, (low, high) in enumerate(bounds):
+            if low is not None:
+                lo[k] = low
+            if high is not None:
+                hi[k] = high
+    p = np.clip(p, lo, hi)
+
+    r, J = mask_residuals(network, make_values, p, f, lower_db, upper_db, output)
+    cost = float(r @ r)
+    lam = 1e-3
+    iterations = 0
+    converged = cost <= tol
+    while not converged and iterations < max_iter:
+        iterations += 1
+        Js = J * scale
+        g = Js.T @ r
+        H = Js.T @ Js
+        # Raise the damping until a step lowers the cost.  The trials only
+        # need the cost; the Jacobian is computed for the accepted step.
+        cost_new = cost
+        while lam <= 1e12:
+            step = -np.linalg.solve(H + lam * (np.diag(np.diag(H)) + 1e-12 * np.eye(len(p))), g)
+            p_new = np.clip(p + step * scale, lo, hi)
+            r_new = mask_violations(network, make_values, p_new, f, lower_db, upper_db, output)
+            cost_new = float(r_new @ r_new)
+            if cost_new < cost:
+                break
+            lam *= 10.0
+        if cost_new >= cost:
+            # Stalled: no step lowers the cost, however much it is damped
+            break
+        lam = max(lam / 10.0, 1e-12)
+        improvement = cost - cost_new
+        moved = np.linalg.norm((p_new - p) / scale)
+        p, r, cost = p_new, r_new, cost_new
+        # Converged when the mask is met, or when the cost or the (scaled)
+        # parameters stop changing
+        converged = cost <= tol or improvement <= tol * max(cost, 1.0) * 1e-3 or moved <= tol
+        if not converged and iterations < max_iter:
+            r, J = mask_residuals(network, make_values, p, f, lower_db, upper_db, output)
+    return OptimizeResult(p, cost, iterations, converged)
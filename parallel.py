@@ -0,0 +1,107 @@
+# Symbolic solution of large networks on several processes.
+#
+# sympy's LUsolve runs on one core and the elimination can't be split up,
+# so the solution is written with Cramer's rule instead.  The known nodes
+# (input and ground) are moved to the right-hand side of the reduced
+# system A x = b and each node voltage is
+#
+#   x[j] = det(A with column j replaced by b) / det(A)
+#
+# Every determinant is independent of the others, so they are handed to a
+# process pool (one task for det(A) and one per requested node).  When
+# there are more workers than determinants, they are split further by
+# Laplace expansion along their sparsest rows (nodal matrices only have a
+# few entries per row), so that every worker has minors to work on.  The
+# Berkowitz determinant doesn't divide, which keeps the expressions from
+# growing nested fractions.
+#
+import multiprocessing
+import os
+import time
+
+def _determinant(task):
+    index, coefficient, matrix, method = task
+    return index, coefficient * matrix.det(method=method)
+
+def _expand(tasks, count):
+    """ Splits the determinants by Laplace expansion until there are at least 
+        count tasks (or the minors get small) """
+    while len(tasks) < count:
+        split = []
+        for index, coefficient, matrix, method in tasks:
+            if matrix.shape[0] <= 3:
+                split.append((index, coefficient, matrix, method))
+                continue
+            rows = [[j for j in range(matrix.shape[1]) if matrix[i, j] != 0] for i in range(matrix.shape[0])]
+            i = min(range(len(rows)), key=lambda i: len(rows[i]))
+            for j in rows[i]:
+                sign = -1 if (i + j) % 2 else 1
+                split.append((index, sign * coefficient * matrix[i, j], matrix.minor_submatrix(i, j), method))
+        if len(split) == len(tasks):
+            break
+        tasks = split
+    return tasks
+
+def reduce_system(A, b, names, known):
+    """ Moves the known node voltages (a dict from node ordinal to value) of
+        the system A x = b to the right-hand side.  Returns the reduced A and
+        b and the names of the remaining nodes. """
+    unknown = [k for k in range(A.shape[0]) if k not in known]
+    a = A.extract(unknown, unknown)
+    r = b.extract(unknown, [0])
+    for k, value in known.items():
+        if value != 0:
+            r -= A.extract(unknown, [k]) * value
+    return a, r, [names[k] for k in unknown]
+
+def cramer_solve(A, b, columns, workers=None, timeout=None, progress=None, method="berkowitz"):
+    """ Solves A x = b for the entries columns of x, computing the
+        determinants on workers processes (os.cpu_count() by default, 1
+        solves in this process).  progress(done, total) is called as each
+        determinant (or minor) finishes.  Raises TimeoutError if the solve takes more
+        than timeout seconds.  Returns the solutions in columns order. """
+    tasks = [(None, 1, A, method)]
+    for j in columns:
+        tasks.append((j, 1, A.copy(), method))
+        tasks[-1][2][:, j] = b
+    results = { index: 0 for index, _, _, _ in tasks }
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1:
+        tasks = _expand(tasks, 4 * workers)
+    total = len(tasks)
+    done = 0
+    if workers <= 1:
+        start = time.monotonic()
+        for task in tasks:
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError("Symbolic solve didn't finish in " + str(timeout) + " seconds")
+            index, det = _determinant(task)
+            results[index] += det
+            done += 1
+            if progress is not None:
+                progress(done, total)
+    else:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pool = multiprocessing.Pool(min(workers, total))
+        try:
+            # One task at a time, as they take very different times
+            finished = pool.imap_unordered(_determinant, tasks, chunksize=1)
+            for _ in range(total):
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    index, det = finished.next(remaining)
+                except multiprocessing.TimeoutError:
+                    raise TimeoutError("Symbolic solve didn't finish in " + str(timeout) + " seconds")
+                results[index] += det
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            # Also stops the workers that are still busy after a timeout
+            pool.terminate()
+            pool.join()
+    det = results[None]
+    if det == 0:
+        raise ValueError("The system is singular")
+    return [results[j] / det for j in columns]
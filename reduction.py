@@ -0,0 +1,247 @@
+# Krylov (PRIMA-style) model-order reduction of a Network.
+#
+# The network is expanded into primitive R, L and C branches (see
+# Element.branches()) and written in first-order MNA form:
+#
+#   (G + sC) x = B u
+#
+# where x holds the node voltages, the inductor currents and the input
+# source current.  With this arrangement G + G^T and C are positive
+# semi-definite.  An orthonormal basis V of the Krylov space of
+# (G + s0 C)^-1 C and (G + s0 C)^-1 B around the expansion point s0 is then
+# used for the congruence transform Gr = V^T G V, Cr = V^T C V, which
+# matches the leading moments of the transfer function around s0 and
+# preserves passivity.  The reduced model only needs q x q solves.
+#
+import ast
+import numpy as np
+from elements import series_branches
+from numeric import LUFactorization, omega
+
+def _series_names(expr: str):
+    """ Returns the parts of an impedance expression that are in series.
+        Only sums of symbols (e.g. "zs1 + zx") can be expanded. """
+    def walk(node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            return walk(node.left) + walk(node.right)
+        if isinstance(node, ast.Name):
+            return [node.id]
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return [node.value]
+        raise ValueError("Impedance expression '" + expr + "' isn't a sum of elements")
+    return walk(ast.parse(expr, mode="eval").body)
+
+def get_descriptor_system(network, values):
+    """ Expands the network into the first-order MNA form (G + sC) x = B u
+        with u = vin = 1.  values maps each symbol to a model from
+        elements.py (or a number, taken to be a resistance).  Returns G, C,
+        B and a dict mapping each node name to its row in x (None for
+        nodes that are tied to ground). """
+    if network.instances:
+        network = network.flatten()
+    count = [len(network.nodes)]
+    def new_node():
+        count[0] += 1
+        return count[0] - 1
+
+    branches = []
+    for edge in network.edges:
+        parts = []
+        for name in _series_names(edge.imp):
+            if isinstance(name, str):
+                if name not in values:
+                    raise ValueError("No value provided for symbol '" + name + "' in '" + edge.imp + "'")
+                parts.append(values[name])
+            else:
+                parts.append(name)
+        branches += series_branches(parts, edge.start.ordinal, edge.end.ordinal, new_node)
+
+    # Shorts merge nodes together
+    parent = list(range(count[0]))
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+    ground = network.nodes["gnd"].ordinal
+    for kind, a, b, _ in branches:
+        if kind == "short":
+            ra, rb = find(a), find(b)
+            # Keep ground as the representative
+            if rb == find(ground):
+                ra, rb = rb, ra
+            parent[rb] = ra
+
+    rows = {}
+    for k in range(count[0]):
+        r = find(k)
+        if r != find(ground) and r not in rows:
+            rows[r] = len(rows)
+    def row(k):
+        return rows.get(find(k))
+
+    inductors = [branch for branch in branches if branch[0] == "l"]
+    nv = len(rows)
+    n = nv + len(inductors) + 1
+    G = np.zeros((n, n))
+    C = np.zeros((n, n))
+    B = np.zeros(n)
+
+    def stamp(m, a, b, value):
+        for p, q, sign in ((a, a, 1.0), (b, b, 1.0), (a, b, -1.0), (b, a, -1.0)):
+            if p is not None and q is not None:
+                m[p, q] += sign * value
+
+    k = nv
+    for kind, a, b, value in branches:
+        a, b = row(a), row(b)
+        if kind == "g":
+            stamp(G, a, b, value)
+        elif kind == "c":
+            stamp(C, a, b, value)
+        elif kind == "l":
+            # KCL gets the inductor current, the branch row is
+            # -(va - vb) + sL i = 0
+            for p, sign in ((a, 1.0), (b, -1.0)):
+                if p is not None:
+                    G[p, k] += sign
+                    G[k, p] -= sign
+            C[k, k] = value
+            k += 1
+
+    # The input source current and the row that forces vin = u
+    inputs = [node for node in network.nodes.values() if node.input == True]
+    if len(inputs) != 1:
+        raise ValueError("Model-order reduction needs exactly one input node")
+    p = row(inputs[0].ordinal)
+    if p is None:
+        raise ValueError("The input node is shorted to ground")
+    G[p, n - 1] += 1.0
+    G[n - 1, p] -= 1.0
+    B[n - 1] = -1.0
+
+    index = { name: row(node.ordinal) for name, node in network.nodes.items() }
+    return G, C, B, index
+
+class ReducedModel:
+    """ A reduced model (Gr + sCr) z = Br, v = Lr z.  The basis is nested, so
+        the model truncated to its first k columns is the reduced model of
+        order k. """
+
+    def __init__(self, Gr, Cr, Br, Lr, names, f0, full_order, step):
+        self.Gr = Gr
+        self.Cr = Cr
+        self.Br = Br
+        self.Lr = Lr
+        self.names = names
+        self.f0 = f0
+        self.order = Gr.shape[0]
+        self.full_order = full_order
+        # Number of columns added by the last Krylov step
+        self.step = step
+        # Maximum relative error against the full network at the check
+        # frequencies (see reduce_network())
+        self.error = None
+        # Whether the error got below the tolerance, when the order was
+        # chosen by reduce_network() (None otherwise)
+        self.converged = None
+
+    def evaluate(self, f, order=None):
+        """ Evaluates the node voltages of the outputs at the frequencies f
+            (Hz).  Returns x with shape (len(f), len(names)) and the names. """
+        q = self.order if order is None else order
+        s = 1j * omega(f)[..., np.newaxis, np.newaxis]
+        a = self.Gr[:q, :q] + s * self.Cr[:q, :q]
+        z = np.linalg.solve(a, self.Br[:q])
+        return z @ self.Lr[:, :q].T, self.names
+
+    def error_estimate(self, f):
+        """ Cheap estimate of the error at the frequencies f from the
+            difference with the model of the previous order. """
+        x, _ = self.evaluate(f)
+        x_prev, _ = self.evaluate(f, self.order - self.step)
+        return np.absolute(x - x_prev)
+
+    def is_passive(self, tol=1e-9):
+        """ Checks that the congruence transform kept Gr + Gr^T and Cr positive
+            semi-definite. """
+        g = np.linalg.eigvalsh(self.Gr + self.Gr.T)
+        c = np.linalg.eigvalsh((self.Cr + self.Cr.T) / 2.0)
+        return bool(g.min() >= -tol * max(g.max(), 1.0) and c.min() >= -tol * max(c.max(), 1e-300))
+
+def _orthogonalize(V, v):
+    """ Two passes of Gram-Schmidt against the (orthonormal) columns of V """
+    for _ in range(2):
+        v = v - V @ (V.conj().T @ v)
+    return v
+
+def reduce_network(network, values, f0, order=None, outputs=("vout",), f_check=None, tolerance=1e-4, max_order=60):
+    """ Reduces the network around the expansion point f0 (Hz, e.g. the filter
+        centre frequency).  Either give the order (size of the reduced model),
+        or give f_check and the order is increased until the relative error
+        against the full network at those frequencies is below tolerance.
+        When f_check is given the achieved error is reported in the .error of
+        the result.  If the tolerance isn't met by max_order (or before the
+        Krylov space runs out), the result is the last model with its
+        .converged False. """
+    if order is None and f_check is None:
+        raise ValueError("Either order or f_check must be given")
+    G, C, B, index = get_descriptor_system(network, values)
+    n = G.shape[0]
+    outputs = list(outputs)
+    L = np.zeros((len(outputs), n))
+    for i, name in enumerate(outputs):
+        if index[name] is not None:
+            L[i, index[name]] = 1.0
+    target = n if order is None else min(order, n)
+    target = min(target, max_order)
+
+    if f_check is not None:
+        f_check = np.asarray(f_check, dtype=float)
+        s = 1j * omega(f_check)[..., np.newaxis, np.newaxis]
+        full = np.linalg.solve(G + s * C, B) @ L.T
+        scale = np.amax(np.absolute(full))
+
+    # Symmetric diagonal scaling x = D x~.  The voltages, inductor currents
+    # and capacitances are many orders of magnitude apart, which would
+    # otherwise swamp the orthogonalization.  D G D and D C D keep their
+    # definiteness, so passivity is preserved.
+    M = G + 1j * omega(f0) * C
+    D = 1.0 / np.sqrt(np.amax(np.absolute(M), axis=1))
+    G = D[:, np.newaxis] * G * D
+    C = D[:, np.newaxis] * C * D
+    B = D * B
+    L = L * D
+
+    lu = LUFactorization(G + 1j * omega(f0) * C)
+    # W is the (complex) Arnoldi basis and V the real basis used for the
+    # projection.  Splitting into real and imaginary parts keeps the model
+    # real.
+    w = lu.solve(B)
+    W = np.zeros((n, 0), dtype=complex)
+    V = np.zeros((n, 0))
+    model = None
+    while V.shape[1] < target:
+        w = _orthogonalize(W, w)
+        if np.linalg.norm(w) < 1e-12:
+            # The Krylov space is exhausted
+            break
+        w = w / np.linalg.norm(w)
+        W = np.column_stack((W, w))
+        start = V.shape[1]
+        for part in (w.real, w.imag):
+            v = _orthogonalize(V, part)
+            if np.linalg.norm(v) > 1e-10 and V.shape[1] < target:
+                V = np.column_stack((V, v / np.linalg.norm(v)))
+        if V.shape[1] > start:
+            model = ReducedModel(V.T @ G @ V, V.T @ C @ V, V.T @ B, L @ V, outputs, f0, n, V.shape[1] - start)
+            if f_check is not None:
+                x, _ = model.evaluate(f_check)
+                model.error = np.amax(np.absolute(x - full)) / scale
+                if order is None and model.error < tolerance:
+                    break
+        # Next Krylov vector
+        w = lu.solve(C @ w)
+    if order is None and model is not None:
+        model.converged = bool(model.error < tolerance)
+    return model
@@ -0,0 +1,38 @@
+# Functions related to filter response metrics
+import numpy as np
+
+def magnitude_db(h):
+    """ Converts the transfer function H = vout / vin into dB.  This is a power
+        ratio, so use 10*log10() for the dB calculation.  Also notice the
+        4.0*(Vout**2) formulation since we are using available power for a
+        matched load.  A complex64 h (precision="single") gives float32. """
+    return 10.0 * np.log10(4.0 * (np.absolute(h) ** 2.0))
+
+def group_delay(h, dh):
+    """ Computes the group delay (seconds) -d(phase)/dw from H and the exact
+        derivative dH/dw (see Network.get_numeric_derivative()).  Since
+        phase = Im(log(H)), d(phase)/dw = Im(dH/dw / H).  Stays in float32 
+        when both are complex64. """
+    return -np.imag(dh / h)
+
+def passband(f, mag_db, level_db=-3.0):
+    """ Looks for the places where the response crosses level_db below the
+        peak, the same way as the example scripts do.  f is the (1-D) sweep 
+        and mag_db can have any leading batch axes.  Returns (min_freq, 
+        max_freq), NaN where no crossing is found. """
+    f = np.asarray(f, dtype=float)
+    inside = (mag_db - np.amax(mag_db, axis=-1, keepdims=True)) > level_db
+    first = np.argmax(inside, axis=-1)
+    # The first sample that drops back out of the passband
+    outside = ~inside & (np.arange(f.shape[-1]) >= first[..., np.newaxis])
+    last = np.argmax(outside, axis=-1)
+    min_freq = np.where(np.any(inside, axis=-1), f[first], np.nan)
+    max_freq = np.where(np.any(outside, axis=-1), f[last], np.nan)
+    return min_freq, max_freq
+
+def noise_figure(noise, elements, source):
+    """ Noise figure (dB) from the output noise of each element (see 
+        Network.get_numeric_noise()): the total output noise relative to the 
+        part that comes from the source element. """
+    noise = np.asarray(noise)
+    return 10.0 * np.log10(np.sum(noise, axis=-1) / noise[..., elements.index(source)])
@@ -0,0 +1,329 @@
+# A local simulation server that stays warm between runs.
+#
+# Starting a script pays for importing NumPy (and sympy), building the
+# network and compiling its expressions before any solving is done.  The
+# server keeps the networks it has seen (by topology key, with their
+# compiled expressions, subcircuit port caches and elimination plans) and
+# solves batched requests on a thread pool (NumPy releases the GIL in
+# LAPACK), so a repeat evaluation costs the solve and not the start-up.
+#
+# The protocol runs over a Unix socket: every message is a 4 byte length
+# followed by JSON.  A solve request carries the network (its edges and
+# input node), the frequencies and the values (numbers or the models in
+# elements.py, described by their type and attributes).  The node voltages
+# are written to a shared memory block, whose name is sent back; the client
+# copies them out and unlinks the block.  The server unlinks the blocks of a
+# connection too, once the next request comes in or the connection closes,
+# so a client that goes away doesn't leave them behind.
+#
+# The impedance expressions of a network are evaluated by Python, so they
+# are checked to be arithmetic on symbols and numbers first, the elements
+# are built through their constructors, and the socket is only accessible
+# to the user running the server.  The networks are shared by the worker
+# threads, so the solves of each network (which fill its caches) take
+# turns.
+#
+#   python server.py /tmp/cyrcuit.sock
+#
+import ast
+import asyncio
+import collections
+import concurrent.futures
+import inspect
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import elements
+from network import Network
+
+# Encoding of networks and values
+
+def encode_network(network):
+    """ Describes a network as a dict that can be written as JSON.  Networks
+        with subcircuits are flattened first. """
+    if network.instances:
+        network = network.flatten()
+    names = [None] * len(network.nodes)
+    for node in network.nodes.values():
+        names[node.ordinal] = node.name
+    return { "key": network.get_topology_key(), "nodes": names,
+        "edges": [[edge.start.name, edge.end.name, edge.imp] for edge in network.edges],
+        "input": [node.name for node in network.nodes.values() if node.input == True] }
+
+# The syntax allowed in the impedance expressions that are received
+_allowed = (ast.Expression, ast.Name, ast.Load, ast.Constant, ast.BinOp, ast.UnaryOp,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.UAdd, ast.USub)
+
+def check_expression(expr):
+    """ Raises ValueError unless expr is arithmetic (+, -, * and /) on
+        symbols and numbers """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except (SyntaxError, TypeError):
+        raise ValueError("Impedance expression '" + str(expr) + "' can't be parsed")
+    for node in ast.walk(tree):
+        if not isinstance(node, _allowed) or (isinstance(node, ast.Constant) and
+                not isinstance(node.value, (int, float, complex))):
+            raise ValueError("Impedance expression '" + expr + "' isn't arithmetic on symbols and numbers")
+
+def decode_network(spec):
+    network = Network()
+    # Create the nodes in order so that the ordinals (and so the key) match
+    for name in spec["nodes"]:
+        network.get_or_create_node(name)
+    for a, b, imp in spec["edges"]:
+        check_expression(imp)
+        network.add_element(a, b, imp)
+    for name in spec["input"]:
+        network.set_input(name)
+    return network
+
+def encode_value(value):
+    """ Describes a value (a number, array or one of the models in
+        elements.py) for JSON """
+    if isinstance(value, elements.Element):
+        return { "type": type(value).__name__,
+            "attributes": { name: encode_value(v) for name, v in vars(value).items() } }
+    if isinstance(value, (list, tuple)):
+        return { "list": [encode_value(v) for v in value] }
+    if value is None or isinstance(value, str):
+        return value
+    if callable(value):
+        raise ValueError("Only the models in elements.py can be sent to the server")
+    a = np.asarray(value)
+    if a.dtype.kind == "c":
+        return { "real": a.real.tolist(), "imag": a.imag.tolist() }
+    return a.tolist()
+
+def decode_value(spec):
+    if isinstance(spec, dict):
+        if "type" in spec:
+            cls = getattr(elements, spec["type"], None)
+            if not (isinstance(cls, type) and issubclass(cls, elements.Element)):
+                raise ValueError("Unknown element type '" + str(spec["type"]) + "'")
+            # The attributes of the models are their constructor arguments
+            parameters = inspect.signature(cls).parameters
+            attributes = spec["attributes"]
+            for name in attributes:
+                if name not in parameters:
+                    raise ValueError(spec["type"] + " has no attribute '" + str(name) + "'")
+            args = []
+            for name, parameter in parameters.items():
+                if name not in attributes:
+                    continue
+                value = decode_value(attributes[name])
+                if parameter.kind == parameter.VAR_POSITIONAL:
+                    args.extend(value)
+                else:
+                    args.append(value)
+            return cls(*args)
+        if "list" in spec:
+            return tuple(decode_value(v) for v in spec["list"])
+        return np.asarray(spec["real"]) + 1j * np.asarray(spec["imag"])
+    if isinstance(spec, list):
+        return np.asarray(spec, dtype=float)
+    return spec
+
+# Framing
+
+def _pack(message):
+    data = json.dumps(message).encode()
+    return struct.pack(">I", len(data)) + data
+
+async def _read(reader):
+    size, = struct.unpack(">I", await reader.readexactly(4))
+    return json.loads(await reader.readexactly(size))
+
+def _receive(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("The server closed the connection")
+        data += chunk
+    return data
+
+class SimulationServer:
+    def __init__(self, path, workers=None, max_networks=32):
+        self.path = path
+        self.max_networks = max_networks
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        # Topology key -> (Network, the lock for its solves), least recently
+        # used first
+        self._networks = collections.OrderedDict()
+        # Shared memory blocks that were handed out and not released yet
+        self._blocks = set()
+        self._server = None
+        self.requests = 0
+        self.network_hits = 0
+
+    def _get_network(self, spec):
+        key = spec["key"]
+        if key in self._networks:
+            self.network_hits += 1
+            self._networks.move_to_end(key)
+            return self._networks[key]
+        network = decode_network(spec)
+        if network.get_topology_key() != key:
+            raise ValueError("The network doesn't match its key")
+        self._networks[key] = network, threading.Lock()
+        while len(self._networks) > self.max_networks:
+            self._networks.popitem(last=False)
+        return self._networks[key]
+
+    def _solve(self, network, lock, request):
+        f = np.asarray(request["f"], dtype=float)
+        values = { name: decode_value(v) for name, v in request["values"].items() }
+        # The caches of the network are filled by the first solves
+        with lock:
+            x, names = network.get_numeric_solution(f, values, request.get("precision", "double"))
+        outputs = request.get("outputs")
+        if outputs is not None:
+            x = x[..., [names.index(name) for name in outputs]]
+            names = list(outputs)
+        x = np.ascontiguousarray(x)
+        block = shared_memory.SharedMemory(create=True, size=max(1, x.nbytes))
+        np.ndarray(x.shape, dtype=x.dtype, buffer=block.buf)[...] = x
+        name = block.name
+        block.close()
+        # The block is unlinked explicitly (see _release()), not when this
+        # process exits
+        resource_tracker.unregister(block._name, "shared_memory")
+        return { "ok": True, "shm": name, "shape": list(x.shape), "dtype": x.dtype.str, "names": names }
+
+    async def _handle(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return { "ok": True }
+        if op == "statistics":
+            return { "ok": True, "requests": self.requests, "network_hits": self.network_hits,
+                "networks": len(self._networks) }
+        if op == "solve":
+            self.requests += 1
+            network, lock = self._get_network(request["network"])
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._solve, network, lock, request)
+        raise ValueError("Unknown request '" + str(op) + "'")
+
+    def _release(self, names):
+        """ Unlinks the shared memory blocks (unless the client already has) """
+        for name in names:
+            self._blocks.discard(name)
+            try:
+                block = shared_memory.SharedMemory(name)
+            except FileNotFoundError:
+                continue
+            block.close()
+            block.unlink()
+        names.clear()
+
+    async def _connection(self, reader, writer):
+        # The blocks sent on this connection.  The client reads a response
+        # before it sends the next request, so they can go then.
+        blocks = []
+        try:
+            while True:
+                try:
+                    request = await _read(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                self._release(blocks)
+                try:
+                    response = await self._handle(request)
+                except Exception as e:
+                    response = { "ok": False, "error": type(e).__name__ + ": " + str(e) }
+                if "shm" in response:
+                    blocks.append(response["shm"])
+                    self._blocks.add(response["shm"])
+                writer.write(_pack(response))
+                await writer.drain()
+        finally:
+            self._release(blocks)
+            writer.close()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        # Create the socket without access for other users
+        umask = os.umask(0o077)
+        try:
+            self._server = await asyncio.start_unix_server(self._connection, self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o600)
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._executor.shutdown()
+        # Blocks of connections that are still open
+        self._release(list(self._blocks))
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+class SimulationClient:
+    """ Blocking client for a SimulationServer """
+    def __init__(self, path):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+
+    def close(self):
+        self._socket.close()
+
+    def _request(self, message):
+        self._socket.sendall(_pack(message))
+        size, = struct.unpack(">I", _receive(self._socket, 4))
+        response = json.loads(_receive(self._socket, size))
+        if not response["ok"]:
+            raise RuntimeError("Server error: " + response["error"])
+        return response
+
+    def ping(self):
+        self._request({ "op": "ping" })
+
+    def statistics(self):
+        response = self._request({ "op": "statistics" })
+        del response["ok"]
+        return response
+
+    def get_numeric_solution(self, network, f, values, outputs=None, precision="double"):
+        """ Network.get_numeric_solution() on the server.  outputs limits the
+            nodes that are sent back (all of them by default; the internal
+            nodes of subcircuits are named as by Network.flatten()). """
+        response = self._request({ "op": "solve", "network": encode_network(network),
+            "f": np.asarray(f, dtype=float).tolist(), "precision": precision,
+            "values": { name: encode_value(value) for name, value in values.items() },
+            "outputs": None if outputs is None else list(outputs) })
+        block = shared_memory.SharedMemory(response["shm"])
+        try:
+            x = np.ndarray(response["shape"], dtype=response["dtype"], buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+        return x, response["names"]
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    path = arguments[0] if arguments else "/tmp/cyrcuit.sock"
+    logging.basicConfig(level=logging.INFO)
+    server = SimulationServer(path)
+    logging.info("Listening on %s", path)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
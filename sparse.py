@@ -0,0 +1,171 @@
+# Sparse numeric solution with an elimination plan that is computed once
+# per topology.
+#
+# The nonzero pattern of the nodal matrix only depends on the topology,
+# so the symbolic work (ordering, fill-in, index bookkeeping) is done
+# once by EliminationPlan and every solve after that only does the
+# numeric factorization.  The values are kept in a compact (nonzeros,
+# batch) array, so each pivot is a handful of vectorized operations
+# over all of the frequency points and parameter sets at once.
+#
+# The input and ground voltages are known, so those nodes are moved to
+# the right-hand side and the remaining (unknown) nodes are ordered by
+# minimum degree.  The pivots are the diagonal entries in that static
+# order (nodal matrices normally have a dominant diagonal); points where
+# a pivot turns out to be tiny, or where the factors grew much larger than
+# the matrix (a small pivot near a resonance, with several neighbours),
+# are solved with the dense path instead.
+#
+import numpy as np
+from numeric import evaluate_expression
+
+def _minimum_degree(adjacency):
+    """ Greedy minimum-degree ordering of a symmetric pattern (a list of
+        sets).  Returns the order and, for each step, the fill pattern (the
+        neighbours of the node that are eliminated after it). """
+    adjacency = [set(a) for a in adjacency]
+    remaining = set(range(len(adjacency)))
+    order = []
+    later = []
+    while remaining:
+        k = min(remaining, key=lambda i: (len(adjacency[i]), i))
+        neighbours = adjacency[k]
+        # Eliminating k connects all of its neighbours
+        for i in neighbours:
+            adjacency[i] |= neighbours
+            adjacency[i].discard(i)
+            adjacency[i].discard(k)
+        order.append(k)
+        later.append(set(neighbours))
+        remaining.discard(k)
+    return order, later
+
+class EliminationPlan:
+    """ The symbolic analysis of a network: the order of elimination and
+        the slots of the filled-in nonzero entries. """
+
+    def __init__(self, network):
+        self.key = network.get_topology_key()
+        self.names = [None] * len(network.nodes)
+        for node in network.nodes.values():
+            self.names[node.ordinal] = node.name
+        # Known voltages (input = 1, ground = 0) and the unknown nodes
+        self.known = { node.ordinal: 1.0 if node.input == True else 0.0
+            for node in network.nodes.values() if node.input == True or node.ground == True }
+        self.unknown = [k for k in range(len(network.nodes)) if k not in self.known]
+        index = { k: i for i, k in enumerate(self.unknown) }
+
+        adjacency = [set() for _ in self.unknown]
+        def connect(a, b):
+            if a in index and b in index and a != b:
+                adjacency[index[a]].add(index[b])
+                adjacency[index[b]].add(index[a])
+        for edge in network.edges:
+            connect(edge.start.ordinal, edge.end.ordinal)
+        for instance in network.instances:
+            ordinals = instance.get_ordinals()
+            for a in ordinals:
+                for b in ordinals:
+                    connect(a, b)
+        order, later = _minimum_degree(adjacency)
+        # Position of each unknown node in the elimination order
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        self.position = { k: int(position[index[k]]) for k in self.unknown }
+
+        # Slots for the diagonal and for every (filled) off-diagonal entry
+        self.slots = {}
+        for p in range(len(order)):
+            self.slots[(p, p)] = len(self.slots)
+        for p in range(len(order)):
+            for i in sorted(int(position[j]) for j in later[p]):
+                self.slots[(p, i)] = len(self.slots)
+                self.slots[(i, p)] = len(self.slots)
+        # The index arrays used by each pivot p: the diagonal, column p
+        # below it (L), row p to the right of it (U) and the block that
+        # they update
+        self.steps = []
+        for p in range(len(order)):
+            rest = sorted(int(position[j]) for j in later[p])
+            lower = np.array([self.slots[(i, p)] for i in rest], dtype=int)
+            upper = np.array([self.slots[(p, j)] for j in rest], dtype=int)
+            block = np.array([[self.slots[(i, j)] for j in rest] for i in rest], dtype=int)
+            self.steps.append((self.slots[(p, p)], np.array(rest, dtype=int), lower, upper, block))
+
+    def _stamp(self, network, namespace):
+        """ Evaluates the admittances and stamps them into the compact values
+            (nonzeros, batch) and the right-hand side (unknowns, batch).
+            Returns them with the batch shape. """
+        ys = [(edge.start.ordinal, edge.end.ordinal, 1.0 / evaluate_expression(edge.imp, namespace))
+            for edge in network.edges]
+        ports = [(instance.get_ordinals(), instance.get_numeric_port_admittance(namespace)[0])
+            for instance in network.instances]
+        shape = np.broadcast_shapes(np.shape(namespace["s"]), *[np.shape(y) for _, _, y in ys],
+            *[np.shape(y)[:-2] for _, y in ports])
+        count = int(np.prod(shape))
+        values = np.zeros((len(self.slots), count), dtype=complex)
+        rhs = np.zeros((len(self.unknown), count), dtype=complex)
+
+        def add(a, b, y):
+            # Adds y to entry (a, b) of the nodal matrix
+            if a not in self.position:
+                return
+            if b in self.position:
+                values[self.slots[(self.position[a], self.position[b])]] += y
+            elif self.known[b] != 0:
+                rhs[self.position[a]] -= y * self.known[b]
+
+        for a, b, y in ys:
+            if a == b:
+                continue
+            y = np.broadcast_to(y, shape).reshape(count)
+            add(a, a, y)
+            add(b, b, y)
+            add(a, b, -y)
+            add(b, a, -y)
+        for ordinals, y in ports:
+            y = np.broadcast_to(y, shape + y.shape[-2:]).reshape((count,) + y.shape[-2:])
+            for i, a in enumerate(ordinals):
+                for j, b in enumerate(ordinals):
+                    add(a, b, y[:, i, j])
+        return values, rhs, shape
+
+    def solve(self, network, namespace, pivot_tolerance=1e-12, growth_tolerance=1e6):
+        """ Solves the network for the evaluated namespace.  Returns x (with
+            shape (..., n) for the batch shape of the namespace) and a mask of
+            the points whose pivots were too small, or whose factors grew by
+            more than growth_tolerance (the error is about eps times the 
+            growth).  Those points are left as NaN. """
+        values, x, shape = self._stamp(network, namespace)
+        scale = np.amax(np.absolute(values), axis=0)
+        bad = np.zeros(values.shape[1], dtype=bool)
+        # Numeric factorization, with L stored below the diagonal
+        for diagonal, rest, lower, upper, block in self.steps:
+            pivot = values[diagonal]
+            small = np.absolute(pivot) <= pivot_tolerance * scale
+            if np.any(small):
+                bad |= small
+                pivot = np.where(small, 1.0, pivot)
+                values[diagonal] = pivot
+            if len(rest) == 0:
+                continue
+            l = values[lower] / pivot
+            values[lower] = l
+            values[block] -= l[:, np.newaxis] * values[upper][np.newaxis]
+        bad |= np.amax(np.absolute(values), axis=0) > growth_tolerance * scale
+        # Forward and back substitution
+        for p, (diagonal, rest, lower, upper, block) in enumerate(self.steps):
+            if len(rest):
+                x[rest] -= values[lower] * x[p]
+        for p in reversed(range(len(self.steps))):
+            diagonal, rest, lower, upper, block = self.steps[p]
+            if len(rest):
+                x[p] -= np.sum(values[upper] * x[rest], axis=0)
+            x[p] /= values[diagonal]
+        result = np.zeros((len(self.names), x.shape[1]), dtype=complex)
+        for k, v in self.known.items():
+            result[k] = v
+        for k, p in self.position.items():
+            result[k] = x[p]
+        result[:, bad] = np.nan
+        return np.moveaxis(result, 0, -1).reshape(shape + (len(self.names),)), bad.reshape(shape)
@@ -0,0 +1,160 @@
+# Quantization of designed component values to standard (E-series)
+# parts.
+#
+# Each ideal value is replaced by a standard value or by a pair of
+# standard values in parallel or in series.  A handful of the closest
+# candidates is kept for each element and the combination is then chosen
+# by a search against the response of the network: every round scores
+# all single-element changes and all two-element changes at once with a
+# batched numeric solve (the candidate values are on a leading axis), and
+# takes the best until nothing improves.
+#
+import itertools
+import numpy as np
+from response import magnitude_db
+
+E12 = [1.0, 1.2, 1.5, 1.8, 2.2, 2.7, 3.3, 3.9, 4.7, 5.6, 6.8, 8.2]
+E24 = [1.0, 1.1, 1.2, 1.3, 1.5, 1.6, 1.8, 2.0, 2.2, 2.4, 2.7, 3.0,
+       3.3, 3.6, 3.9, 4.3, 4.7, 5.1, 5.6, 6.2, 6.8, 7.5, 8.2, 9.1]
+# The E96 values follow the formula exactly (3 significant figures)
+E96 = [round(10 ** (i / 96), 2) for i in range(96)]
+
+_prefixes = [(1e-12, "p"), (1e-9, "n"), (1e-6, "u"), (1e-3, "m"), (1.0, ""), (1e3, "k"), (1e6, "M")]
+
+def _format(value):
+    """ Formats a value with an SI prefix (e.g. 4.7e-12 as 4.7p) """
+    for scale, prefix in reversed(_prefixes):
+        if value >= scale * 0.999:
+            break
+    return ("%.3g" % (value / scale)) + prefix
+
+def standard_values(series, low, high):
+    """ Returns the values of the series (e.g. E24) between low and high """
+    decades = range(int(np.floor(np.log10(low))), int(np.ceil(np.log10(high))) + 1)
+    values = np.array([round(v * 10.0 ** d, 12 - d) for d in decades for v in series])
+    return values[(values >= low * (1 - 1e-9)) & (values <= high * (1 + 1e-9))]
+
+class Part:
+    """ A standard value, or two in parallel or in series """
+    def __init__(self, value, values, connection):
+        self.value = value
+        self.values = values
+        # "single", "parallel" or "series"
+        self.connection = connection
+
+    def __repr__(self):
+        if self.connection == "single":
+            return _format(self.values[0])
+        if self.connection == "parallel":
+            return " || ".join(_format(v) for v in self.values)
+        # Not "a + b", which reads as a sum for capacitors
+        return "series(" + ", ".join(_format(v) for v in self.values) + ")"
+
+def standard_parts(value, kind="c", series=E24, count=8):
+    """ Returns the count Parts that are closest to value, made from a single
+        standard value or two in parallel or in series.  kind is "c" for
+        capacitors (which add in parallel) or "r"/"l" (which add in series).
+        Single values are preferred when they are as close as a pair. """
+    if value <= 0:
+        raise ValueError("Only positive values can be quantized")
+    base = standard_values(series, value / 100.0, value * 100.0)
+    a, b = np.meshgrid(base, base, indexing="ij")
+    upper = a >= b
+    a, b = a[upper], b[upper]
+    adding = a + b
+    reciprocal = a * b / (a + b)
+    parallel, serial = (adding, reciprocal) if kind == "c" else (reciprocal, adding)
+    candidates = [(v, (v,), "single") for v in base]
+    candidates += [(v, (x, y), "parallel") for v, x, y in zip(parallel, a, b)]
+    candidates += [(v, (x, y), "series") for v, x, y in zip(serial, a, b)]
+    # Rank by relative error, pairs after singles for equal values
+    errors = np.array([abs(v / value - 1.0) + (0.0 if c == "single" else 1e-9) for v, _, c in candidates])
+    parts = []
+    for k in np.argsort(errors, kind="stable"):
+        v, values, connection = candidates[k]
+        # Keep one way of making each value
+        if all(abs(v / p.value - 1.0) > 1e-9 for p in parts):
+            parts.append(Part(float(v), values, connection))
+            if len(parts) == count:
+                break
+    return parts
+
+class QuantizeResult:
+    def __init__(self, parts, p, score, evaluated):
+        # The chosen Part for each parameter (None where the parameter is 0)
+        self.parts = parts
+        # The values of the chosen parts
+        self.p = p
+        # RMS deviation (dB) from the target response
+        self.score = score
+        # Number of combinations that were scored
+        self.evaluated = evaluated
+
+def response_scores(network, make_values, P, f, target_db, weight=None, output="vout", chunk_size=512):
+    """ Scores parameter sets P (shape (count, len(p))) by the RMS deviation
+        (dB) of the response at output from target_db.  make_values(p) is as
+        for Network.get_numeric_gradient(), but is given arrays (one value
+        per parameter set). """
+    P = np.atleast_2d(P)
+    weight = np.ones(len(f)) if weight is None else np.asarray(weight, dtype=float)
+    weight = weight / np.sum(weight)
+    scores = np.empty(len(P))
+    for start in range(0, len(P), chunk_size):
+        chunk = P[start:start + chunk_size]
+        x, names = network.get_numeric_solution(f, make_values(list(chunk.T)))
+        error = magnitude_db(x[..., names.index(output)]) - target_db
+        scores[start:start + chunk_size] = np.sqrt(np.sum(weight * error ** 2, axis=-1))
+    return scores
+
+def quantize_values(network, make_values, p, f, target_db, kinds="c", series=E24, count=8, weight=None,
+    output="vout", max_rounds=20):
+    """ Replaces the ideal parameters p with standard parts (see
+        standard_parts()) so that the response at output stays as close as
+        possible to target_db (e.g. the response of the ideal design).
+        kinds is the kind of each parameter ("c", "r" or "l"), or one kind
+        for all of them.  Parameters that are 0 (no part) are left alone.
+        Returns a QuantizeResult. """
+    p = np.asarray(p, dtype=float)
+    if isinstance(kinds, str):
+        kinds = [kinds] * len(p)
+    parts = [standard_parts(v, kind, series, count) if v != 0 else [None] for v, kind in zip(p, kinds)]
+    values = [np.array([0.0 if part is None else part.value for part in options]) for options in parts]
+    evaluated = 0
+
+    def score(choices):
+        nonlocal evaluated
+        evaluated += len(choices)
+        P = np.array([[values[k][c] for k, c in enumerate(choice)] for choice in choices])
+        return response_scores(network, make_values, P, f, target_db, weight, output)
+
+    # Start from the closest part for each parameter
+    choice = [0] * len(p)
+    best = score([choice])[0]
+    changeable = [k for k in range(len(p)) if len(values[k]) > 1]
+    for _ in range(max_rounds):
+        candidates = []
+        # All single changes
+        for k in changeable:
+            for c in range(len(values[k])):
+                if c != choice[k]:
+                    candidates.append(choice[:k] + [c] + choice[k + 1:])
+        # All pairs of changes among the closest few parts
+        near = min(count, 3)
+        for k, l in itertools.combinations(changeable, 2):
+            for c, d in itertools.product(range(min(near, len(values[k]))), range(min(near, len(values[l])))):
+                if c != choice[k] and d != choice[l]:
+                    candidate = list(choice)
+                    candidate[k] = c
+                    candidate[l] = d
+                    candidates.append(candidate)
+        if not candidates:
+            break
+        scores = score(candidates)
+        k = int(np.argmin(scores))
+        if scores[k] >= best:
+            break
+        choice = candidates[k]
+        best = scores[k]
+
+    chosen = [options[c] for options, c in zip(parts, choice)]
+    return QuantizeResult(chosen, np.array([values[k][c] for k, c in enumerate(choice)]), float(best), evaluated)
@@ -0,0 +1,108 @@
+# Multi-dimensional sweeps with named axes.
+#
+# A Sweep holds the frequencies and any number of named axes (element
+# values, temperature, ...).  The axes are handed to a make_values()
+# function as arrays shaped for broadcasting, so the values dict it
+# returns describes the whole Cartesian product, which is then solved in
+# one numeric call (in chunks along the first axis to bound the memory
+# used by the stack of matrices).  Frequency is always the last axis.
+#
+import numpy as np
+from elements import as_element
+
+class Sweep:
+    def __init__(self, f):
+        self.f = np.asarray(f, dtype=float)
+        # Axis name -> coordinates, in axis order
+        self.axes = {}
+
+    def add_axis(self, name, coords):
+        """ Adds an axis (after the existing ones).  Returns the sweep so that
+            calls can be chained. """
+        if name == "f" or name in self.axes:
+            raise ValueError("Axis '" + name + "' already exists")
+        coords = np.atleast_1d(np.asarray(coords))
+        if coords.ndim != 1:
+            raise ValueError("The coordinates of axis '" + name + "' must be one-dimensional")
+        self.axes[name] = coords
+        return self
+
+    def dims(self):
+        return tuple(self.axes) + ("f",)
+
+    def shape(self):
+        return tuple(len(c) for c in self.axes.values()) + (len(self.f),)
+
+    def grid(self, start=0, stop=None):
+        """ Returns the coordinates of each axis shaped for broadcasting
+            against the others (without the frequency axis, which the models
+            in elements.py add).  start and stop select part of the first
+            axis. """
+        grid = {}
+        count = len(self.axes)
+        for k, (name, coords) in enumerate(self.axes.items()):
+            if k == 0:
+                coords = coords[start:stop]
+            shape = [1] * count
+            shape[k] = len(coords)
+            grid[name] = coords.reshape(shape)
+        return grid
+
+    def run(self, network, make_values, outputs=None, max_bytes=256e6, precision="double"):
+        """ Solves the network over the sweep.  make_values(**grid) gets one
+            keyword argument per axis (see grid()) and returns the values dict
+            for Network.get_numeric_solution(); plain numbers or arrays are
+            taken to be resistances.  outputs lists the nodes to keep (all of
+            them by default).  precision="single" solves (and stores the
+            result) in complex64, see Network.get_numeric_solution().
+            Returns a SweepResult. """
+        shape = self.shape()
+        n = len(network.nodes)
+        data = None
+        # Split the first axis so that each solve stays under max_bytes
+        itemsize = 8 if precision == "single" else 16
+        inner = int(np.prod(shape[1:])) * n * n * itemsize
+        length = shape[0] if self.axes else 1
+        step = max(1, int(max_bytes // inner)) if self.axes else 1
+        for start in range(0, length, step):
+            grid = self.grid(start, start + step)
+            values = { name: value if callable(value) else as_element(value)
+                for name, value in make_values(**grid).items() }
+            x, names = network.get_numeric_solution(self.f, values, precision)
+            if data is None:
+                outputs = names if outputs is None else list(outputs)
+                columns = [names.index(name) for name in outputs]
+                data = np.empty(shape + (len(outputs),), dtype=x.dtype)
+            part = data[start:start + step] if self.axes else data
+            # Axes that the values don't depend on are broadcast
+            part[...] = np.broadcast_to(x[..., columns], part.shape)
+        coords = dict(self.axes)
+        coords["f"] = self.f
+        return SweepResult(data, outputs, self.dims(), coords)
+
+class SweepResult:
+    """ The node voltages over a sweep, with shape (..., len(f)) for each node.
+        dims names the axes and coords holds their coordinates. """
+    def __init__(self, data, names, dims, coords):
+        self.data = data
+        self.names = names
+        self.dims = dims
+        self.coords = coords
+
+    def __getitem__(self, name):
+        return self.data[..., self.names.index(name)]
+
+    def sel(self, name, **coords):
+        """ Returns the voltage of node name at the coordinates given for some
+            of the axes (the nearest point is taken), e.g. sel("vout", rs=50).
+            The remaining axes are kept, in order. """
+        index = []
+        for dim in self.dims:
+            if dim in coords:
+                index.append(int(np.argmin(np.absolute(self.coords[dim] - coords[dim]))))
+            else:
+                index.append(slice(None))
+        for dim in coords:
+            if dim not in self.dims:
+                raise ValueError("No axis named '" + dim + "'")
+        return self[name][tuple(index)]
@@ -44,8 +44,8 @@ network.set_input("vin")
 
 # Get the solution for the node voltages
 print("Solving linear system ...")
-x, names = network.get_solution()
-print(names)
+x = network.get_solution()
+print(x.names)
 
 # Setup the complex impedances using RLC values
 s, w = symbols("s w")
@@ -109,7 +109,7 @@ x = x.subs(s, w * I)
 
 # Create the transfer function H(jw) = vout(jw) / vin(jw)
 # But we are assuming vin(jw) = 1.0
-H = x[8]
+H = x["vout"]
 
 # Create the sweep of frequencies in rad/sec
 bw = 2000
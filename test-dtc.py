@@ -29,8 +29,8 @@ network.set_input("vin")
 
 # Get the solution for the node voltages
 print("Solving linear system ...")
-x, names = network.get_solution()
-print(names)
+x = network.get_solution()
+print(x.names)
 
 # Setup the complex impedances using RLC values
 s, w, l_qu, rs, c1, l2, c3, c4, l5, c6, c7, rl = symbols("s w l_qu rs c1 l2 c3 c4 l5 c6 c7 rl")
@@ -73,11 +73,11 @@ lcr_values = [
 x = x.subs(lcr_values)
 
 # Change s->jw and simplify.  Notice the use of I (imaginary component)
-x = simplify(x.subs(s, w * I))
+x = x.subs(s, w * I).simplify()
 
 # Create the transfer function H(jw) = vout(jw) / vin(jw)
 # But we are assuming vin(jw) = 1.0
-H = x[5]
+H = x["vout"]
 
 # Create the sweep of frequencies in rad/sec
 input_angles = np.linspace(1300000, 2100000, 50)
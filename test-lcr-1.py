@@ -22,8 +22,8 @@ network.add_element("vout", "gnd", "rl")
 network.set_input("vin")
 
 # Get the solution for the node voltages
-x, names = network.get_solution()
-print(names)
+x = network.get_solution()
+print(x.names)
 
 # Setup the complex impedances using RLC values
 s, w, l, c, r = symbols("s w l c r")
@@ -47,10 +47,10 @@ z_values = [
 x = x.subs(z_values)
 
 # Change s->jw and simplify.  Notice the use of I (imaginary component)
-x = simplify(x.subs(s, w * I))
+x = x.subs(s, w * I).simplify()
 
 # Create the transfer function H(jw) = vout(jw) / vin(jw)
-H = x[3]
+H = x["vout"]
 
 # Create the sweep of frequencies in rad/sec
 input_angles = np.linspace(0.01, 5, 100)
@@ -23,8 +23,8 @@ network.add_element("vout", "gnd", "rl")
 network.set_input("vin")
 
 # Get the solution for the node voltages
-x, names = network.get_solution()
-print(names)
+x = network.get_solution()
+print(x.names)
 
 # Setup the complex impedances using RLC values
 s, w, l1, c2, l3, c4, r = symbols("s w l1 c2 l3 c4 r")
@@ -50,11 +50,11 @@ lcr_values = [
 x = x.subs(lcr_values)
 
 # Change s->jw and simplify.  Notice the use of I (imaginary component)
-x = simplify(x.subs(s, w * I))
+x = x.subs(s, w * I).simplify()
 
 # Create the transfer function H(jw) = vout(jw) / vin(jw)
 # But we are assuming vin(jw) = 1.0
-H = x[4]
+H = x["vout"]
 
 # Create the sweep of frequencies in rad/sec
 input_angles = np.linspace(0, 50000000, 100)
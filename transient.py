@@ -0,0 +1,73 @@
+# Time-domain (impulse and step) responses computed from the numeric
+# frequency response using the inverse FFT.
+#
+# Two modes are supported:
+#
+# * fc=None: the real response.  H is evaluated on the rfft grid from
+#   DC to fs/2 and transformed with irfft.  This is what you'd use for
+#   low-pass designs.
+# * fc given: the baseband-equivalent (complex envelope) response of a
+#   band-pass filter.  H is only evaluated on fc +/- fs/2, so fs needs to
+#   cover the interesting part of the response around fc rather than
+#   fc itself.  A narrow crystal filter at 5 MHz can then be handled
+#   with a few thousand samples.
+#
+import numpy as np
+
+def frequency_grid(n, fs, fc=None):
+    """ Returns the frequencies (Hz) where H needs to be evaluated for an
+        n sample transient with sample rate fs. """
+    if fc is None:
+        return np.fft.rfftfreq(n, 1.0 / fs)
+    if fs / 2.0 >= fc:
+        raise ValueError("Baseband sample rate must be less than 2 * fc")
+    return fc + np.fft.fftfreq(n, 1.0 / fs)
+
+def _transfer(network, values, f, output):
+    x, names = network.get_numeric_solution(f, values)
+    return x[..., names.index(output)]
+
+def impulse_response_from_h(h, n, fs, fc=None):
+    """ Converts H sampled on frequency_grid(n, fs, fc) into the impulse
+        response (or its complex envelope when fc is given).  The sum over
+        the grid approximates the inverse Fourier integral, hence the
+        scaling by fs. """
+    if fc is None:
+        return fs * np.fft.irfft(h, n, axis=-1)
+    return fs * np.fft.ifft(h, n, axis=-1)
+
+def impulse_response(network, values, n, fs, fc=None, output="vout"):
+    """ Computes the impulse response of the network from vin to output.
+        values can carry batch axes (see elements.py), which end up on the
+        leading axes of the result.  Returns the times and the response
+        (complex envelope when fc is given).
+
+        NOTE: The time window n / fs must be long enough for the ringing to
+        die out, otherwise it wraps around. """
+    f = frequency_grid(n, fs, fc)
+    if fc is None:
+        # Avoid evaluating exactly at DC (capacitors are open, inductors
+        # are shorted there)
+        f[0] = f[1] * 1e-9
+    h = _transfer(network, values, f, output)
+    return np.arange(n) / fs, impulse_response_from_h(h, n, fs, fc)
+
+def step_response(network, values, n, fs, fc=None, output="vout"):
+    """ Computes the step response of the network from vin to output.  When
+        fc is given this is the complex envelope of the response to a carrier
+        at fc that is switched on at t=0 (i.e. a CW key-down), which settles
+        to H(fc). """
+    t, h = impulse_response(network, values, n, fs, fc, output)
+    # Trapezoidal integration.  The sample at t=0 already holds the average
+    # across the jump in h, so it isn't halved again.
+    return t, (np.cumsum(h, axis=-1) - h / 2.0) / fs
+
+def settling_time(t, y, tolerance=0.01):
+    """ Returns the time after which |y| stays within tolerance (relative) of
+        its final value.  The final value is taken from the last sample. """
+    mag = np.absolute(y)
+    final = mag[..., -1:]
+    outside = np.absolute(mag - final) > tolerance * np.absolute(final)
+    # Index of the last sample that is outside of the tolerance
+    last = outside.shape[-1] - 1 - np.argmax(outside[..., ::-1], axis=-1)
+    return np.where(np.any(outside, axis=-1), t[np.minimum(last + 1, len(t) - 1)], t[0])
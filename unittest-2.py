@@ -0,0 +1,450 @@
+import unittest
+import math
+import os
+import subprocess
+import sys
+import numpy as np
+from network import Network, Solution, Subcircuit
+from elements import *
+from numeric import LUFactorization, estimate_condition, make_namespace, omega
+from response import *
+from ladder import *
+
+class TestNumeric(unittest.TestCase):
+
+    def make_lpf(self):
+        # A very simple circuit (From Radio Frequency Design (Hayward) pg. 48)
+        network = Network()
+        network.add_element("vin", "va", "rs")
+        network.add_element("va", "vout", "z1")
+        network.add_element("vout", "gnd", "z2")
+        network.add_element("vout", "gnd", "rl")
+        network.set_input("vin")
+        return network
+
+    def lpf_values(self, l):
+        return { "rs": 1.0, "rl": 1.0, "z1": Inductor(l), "z2": Capacitor(math.sqrt(2.0)) }
+
+    def test_lpf(self):
+        """ Normalized Butterworth LPF is -3dB (available power) at 1 rad/sec """
+        network = self.make_lpf()
+        f = np.array([0.0001, 1.0 / (2.0 * math.pi)])
+        x, names = network.get_numeric_solution(f, self.lpf_values(math.sqrt(2.0)))
+        h = x[..., names.index("vout")]
+        mag_db = 10.0 * np.log10(4.0 * (np.absolute(h) ** 2.0))
+        self.assertAlmostEqual(0.0, mag_db[0], places=4)
+        self.assertAlmostEqual(-3.0103, mag_db[1], places=4)
+        # Input node is driven at 1.0, ground is 0.0
+        self.assertAlmostEqual(1.0, x[0, names.index("vin")])
+        self.assertAlmostEqual(0.0, x[0, names.index("gnd")])
+
+    def test_matches_symbolic(self):
+        from sympy import symbols, I, lambdify
+        network = self.make_lpf()
+        x = network.get_solution()
+        names = x.names
+        s, w = symbols("s w")
+        x = x.subs([(symbols("rs"), 50), (symbols("rl"), 50),
+            (symbols("z1"), 1e-6 * s), (symbols("z2"), 1.0 / (s * 1e-9))])
+        h_fast = x.subs(s, w * I).lambdify(w, "vout")
+        f = np.linspace(1e5, 1e7, 20)
+        values = { "rs": Resistor(50), "rl": 50, "z1": Inductor(1e-6), "z2": Capacitor(1e-9) }
+        xn, names_n = network.get_numeric_solution(f, values)
+        self.assertEqual(names, names_n)
+        np.testing.assert_allclose(h_fast(2.0 * math.pi * f), xn[..., names.index("vout")], rtol=1e-9)
+
+    def test_partially_symbolic(self):
+        from sympy import symbols, I, lambdify
+        network = self.make_lpf()
+        s, w, z2 = symbols("s w z2")
+        values = { "rs": 50, "rl": "50", "z1": Inductor(1e-6) }
+        x = network.get_solution(values, keep=["z2"])
+        self.assertEqual({ s, z2 }, x["vout"].free_symbols)
+        # The same as substituting into the full solution
+        h = lambdify(w, x["vout"].subs(z2, 1.0 / (s * 1e-9)).subs(s, w * I))
+        f = np.linspace(1e5, 1e7, 20)
+        xn, names = network.get_numeric_solution(f, dict(values, rl=50, z2=Capacitor(1e-9)))
+        np.testing.assert_allclose(h(2.0 * math.pi * f), xn[..., names.index("vout")], rtol=1e-9)
+        with self.assertRaises(ValueError):
+            network.get_solution({ "rs": 50 }, keep=["z2"])
+        with self.assertRaises(ValueError):
+            network.get_solution(dict(values, z2=1.0), keep=["z2"])
+
+    def test_single_precision(self):
+        network = self.make_lpf()
+        f = np.linspace(0.01, 1.0, 50)
+        x, names = network.get_numeric_solution(f, self.lpf_values(math.sqrt(2.0)))
+        x32, _ = network.get_numeric_solution(f, self.lpf_values(math.sqrt(2.0)), precision="single")
+        self.assertEqual(np.complex64, x32.dtype)
+        np.testing.assert_allclose(x, x32, rtol=1e-6, atol=1e-7)
+        # A high-Q tank: near resonance the admittances of L and C cancel,
+        # which is harmless since they are stamped in double
+        network = Network()
+        network.add_element("vin", "va", "rb")
+        network.add_element("va", "gnd", "zl")
+        network.add_element("va", "gnd", "zc")
+        network.set_input("vin")
+        values = { "rb": 1e6, "zl": Inductor(1e-6, 1e6), "zc": Capacitor(1e-6) }
+        f = 1 / (2 * math.pi * 1e-6) * np.linspace(0.999, 1.001, 51)
+        x, names = network.get_numeric_solution(f, values)
+        x32, _ = network.get_numeric_solution(f, values, precision="single")
+        a = names.index("va")
+        np.testing.assert_allclose(x[..., a], x32[..., a], rtol=1e-6)
+        unchecked, _ = network.get_numeric_solution(f, values, precision="single", tolerance=np.inf)
+        np.testing.assert_allclose(x[..., a], unchecked[..., a], rtol=1e-6)
+        with self.assertRaises(ValueError):
+            network.get_numeric_solution(f, values, precision="half")
+
+    def test_single_precision_ladder(self):
+        """ The ill-conditioned points of a crystal ladder (test-design-6.py) 
+            near the series resonance of the crystals are solved in double """
+        Lm, Cm = 0.098, 0.010339e-12
+        Rse, Ck_list, Cs_list, _ = crystal_ladder_design(4, 5e6, 3000, Lm, Cm, 240000)
+        network = crystal_ladder_network(4)
+        values = crystal_ladder_values(4, Crystal(Lm, Cm, 0.8333, 4e-12), Rse, Cs_list, Ck_list)
+        f = 1 / (2 * math.pi * math.sqrt(Lm * Cm)) * np.linspace(1 - 1e-5, 1 + 1e-5, 101)
+        x, names = network.get_numeric_solution(f, values)
+        out = names.index("vout")
+        unchecked, _ = network.get_numeric_solution(f, values, "single", tolerance=np.inf)
+        self.assertGreater(np.amax(np.absolute(unchecked[..., out] / x[..., out] - 1)), 1e-5)
+        x32, _ = network.get_numeric_solution(f, values, "single", tolerance=1e-5)
+        self.assertEqual(np.complex64, x32.dtype)
+        np.testing.assert_allclose(x[..., out], x32[..., out], rtol=1e-5)
+        # Only some of the points needed it
+        resolved = np.any(x32 != unchecked, axis=-1)
+        self.assertTrue(0 < np.sum(resolved) < len(f))
+        h = x32[..., out]
+        self.assertEqual(np.float32, magnitude_db(h).dtype)
+        self.assertEqual(np.float32, group_delay(h, h).dtype)
+
+    def test_lazy_solution(self):
+        from sympy import symbols
+        network = self.make_lpf()
+        x = network.get_solution()
+        calls = []
+        y = x.subs(symbols("other"), 0)
+        z = Solution(y.names, lambda name: calls.append(name) or y[name])
+        self.assertEqual([], calls)
+        vout = z["vout"]
+        self.assertEqual(["vout"], calls)
+        # Cached on the second request, and available by position
+        self.assertIs(vout, z[z.names.index("vout")])
+        self.assertEqual(["vout"], calls)
+        self.assertEqual(len(network.nodes), x.matrix().shape[0])
+        with self.assertRaises(KeyError):
+            x["nope"]
+
+    def test_variants(self):
+        network = self.make_lpf()
+        f = np.linspace(0.01, 1.0, 10)
+        variants = { "a": self.lpf_values(1.0), "b": self.lpf_values(math.sqrt(2.0)) }
+        x, names = network.get_variant_solution(f, variants)
+        self.assertEqual((2, 10, 4), x.shape)
+        for i, values in enumerate(variants.values()):
+            xi, _ = network.get_numeric_solution(f, values)
+            np.testing.assert_allclose(xi, x[i])
+
+    def test_batched_values(self):
+        network = self.make_lpf()
+        f = np.linspace(0.01, 1.0, 10)
+        x, names = network.get_numeric_solution(f, self.lpf_values(np.array([1.0, 2.0, 3.0])))
+        self.assertEqual((3, 10, 4), x.shape)
+        x1, _ = network.get_numeric_solution(f, self.lpf_values(2.0))
+        np.testing.assert_allclose(x1, x[1])
+
+    def test_missing_value(self):
+        network = self.make_lpf()
+        with self.assertRaises(ValueError):
+            network.get_numeric_solution([1.0], { "rs": 1.0 })
+
+    def test_group_delay(self):
+        network = self.make_lpf()
+        values = self.lpf_values(math.sqrt(2.0))
+        f = np.linspace(0.01, 0.5, 50)
+        x, dx, names = network.get_numeric_derivative(f, values)
+        h = x[..., names.index("vout")]
+        dh = dx[..., names.index("vout")]
+        # Compare against a finite difference of the phase
+        df = 1e-7
+        xp, _ = network.get_numeric_solution(f + df, values)
+        xm, _ = network.get_numeric_solution(f - df, values)
+        dphase = np.angle(xp[..., names.index("vout")] / xm[..., names.index("vout")])
+        np.testing.assert_allclose(-dphase / (2.0 * math.pi * 2.0 * df), group_delay(h, dh), rtol=1e-5)
+        # Butterworth N=2 group delay (normalized)
+        w = 2.0 * math.pi * f
+        np.testing.assert_allclose(math.sqrt(2.0) * (1 + w ** 2) / (1 + w ** 4), group_delay(h, dh))
+
+class TestSubcircuit(unittest.TestCase):
+
+    def make_ladder(self, N):
+        # One mesh: crystal + tuning cap in series, then a shunt coupling cap
+        mesh = Subcircuit(["a", "b"])
+        mesh.add_element("a", "m", "zs")
+        mesh.add_element("m", "b", "zx")
+        mesh.add_element("b", "gnd", "zk")
+        network = Network()
+        network.add_element("vin", "v0", "rs")
+        network.set_input("vin")
+        for k in range(N):
+            network.add_subcircuit(mesh, ["v" + str(k), "v" + str(k + 1)], { "zk": "zk" + str(k + 1) })
+        network.add_element("v" + str(N), "vout", "zs")
+        network.add_element("vout", "gnd", "rl")
+        values = { "rs": 2400.0, "rl": 2400.0, "zs": Capacitor(30e-12),
+            "zx": Crystal(0.098, 0.010339e-12, 6.0, 4e-12) }
+        for k in range(N):
+            values["zk" + str(k + 1)] = Capacitor(60e-12 if k in (0, N - 1) else 25e-12)
+        return mesh, network, values
+
+    def test_flatten(self):
+        mesh, network, values = self.make_ladder(4)
+        f = np.linspace(4.995e6, 5.005e6, 50)
+        x, names = network.get_numeric_solution(f, values)
+        flat = network.flatten()
+        self.assertEqual(len(network.nodes) + 4, len(flat.nodes))
+        xf, names_f = flat.get_numeric_solution(f, values)
+        self.assertEqual(names, names_f[:len(names)])
+        np.testing.assert_allclose(xf[..., :len(names)], x, atol=1e-12)
+        # Derivatives go through the Schur complement too
+        x, dx, _ = network.get_numeric_derivative(f, values)
+        xf, dxf, _ = flat.get_numeric_derivative(f, values)
+        np.testing.assert_allclose(dxf[..., :len(names)], dx, rtol=1e-6, atol=1e-12)
+
+    def test_cache(self):
+        mesh, network, values = self.make_ladder(4)
+        # The end meshes and the inner meshes share their values, so only 
+        # two port admittances are computed
+        f = np.linspace(4.995e6, 5.005e6, 10)
+        network.get_numeric_solution(f, values)
+        self.assertEqual(2, len(mesh._numeric_ports))
+        network.get_numeric_solution(f, values)
+        self.assertEqual(2, len(mesh._numeric_ports))
+
+    def test_modified(self):
+        """ Elements added to a subcircuit after a solve are picked up """
+        mesh, network, values = self.make_ladder(4)
+        f = np.linspace(4.995e6, 5.005e6, 10)
+        x, names = network.get_numeric_solution(f, values)
+        y = mesh.get_port_admittance()
+        mesh.add_element("m", "gnd", "zp")
+        values["zp"] = Capacitor(10e-12)
+        x2, names2 = network.get_numeric_solution(f, values)
+        xf, names_f = network.flatten().get_numeric_solution(f, values)
+        np.testing.assert_allclose(xf[..., :len(names2)], x2, atol=1e-12)
+        self.assertGreater(np.amax(np.absolute(x2 - x)), 1e-3)
+        self.assertIn("zp", str(mesh.get_port_admittance()))
+        self.assertNotIn("zp", str(y))
+
+    def test_symbolic(self):
+        from sympy import symbols, I
+        mesh = Subcircuit(["a", "b"])
+        mesh.add_element("a", "m", "zs")
+        mesh.add_element("m", "b", "zl")
+        network = Network()
+        network.add_element("vin", "va", "rs")
+        network.set_input("vin")
+        network.add_subcircuit(mesh, ["va", "vout"])
+        network.add_element("vout", "gnd", "rl")
+        network.add_subcircuit(mesh, ["vout", "gnd"], { "zs": "zs2", "zl": "zl2" })
+        s, w = symbols("s w")
+        x = network.get_solution()
+        x = x.subs([(symbols("rs"), 50), (symbols("rl"), 50), (symbols("zs"), 10), 
+            (symbols("zl"), 1e-6 * s), (symbols("zs2"), 5), (symbols("zl2"), 1.0 / (1e-9 * s))])
+        h_fast = x.subs(s, w * I).lambdify(w, "vout")
+        f = np.linspace(1e5, 1e7, 20)
+        values = { "rs": 50, "rl": 50, "zs": 10, "zl": Inductor(1e-6), "zs2": 5, "zl2": Capacitor(1e-9) }
+        xn, names = network.get_numeric_solution(f, values)
+        np.testing.assert_allclose(h_fast(2.0 * math.pi * f), xn[..., names.index("vout")], rtol=1e-9)
+
+    def test_equilibrated(self):
+        mesh, network, values = self.make_ladder(4)
+        f = np.linspace(4.995e6, 5.005e6, 50)
+        x, names = network.get_numeric_solution(f, values)
+        A, _, _ = network.get_numeric_system(f, values)
+        xe, names_e, condition = network.get_equilibrated_solution(f, values, condition=True)
+        self.assertEqual(names, names_e)
+        np.testing.assert_allclose(x, xe, rtol=1e-12, atol=1e-14)
+        # The equilibrated matrices are much better conditioned
+        self.assertLess(np.amax(condition), np.amax(np.linalg.cond(A, 1)) / 10)
+        # Single precision factorization, refined to double accuracy
+        x32, _, condition32 = network.get_equilibrated_solution(f, values, "single", refine=0, condition=True)
+        self.assertGreater(np.amax(np.absolute(x32 - x)), 1e-9)
+        np.testing.assert_allclose(condition, condition32, rtol=1e-3)
+        xr, _, estimate = network.get_equilibrated_solution(f, values, "single", refine=2)
+        self.assertIsNone(estimate)
+        np.testing.assert_allclose(x, xr, rtol=1e-12, atol=1e-14)
+        with self.assertRaises(ValueError):
+            network.get_equilibrated_solution(f, values, "half")
+
+class TestSparse(unittest.TestCase):
+
+    def make_chain(self, n):
+        """ LC ladder with some longer links """
+        network = Network()
+        network.add_element("vin", "n1", "rs")
+        network.set_input("vin")
+        for k in range(1, n):
+            network.add_element("n" + str(k), "n" + str(k + 1), "zl")
+            network.add_element("n" + str(k + 1), "gnd", "zc")
+            if k % 10 == 0:
+                network.add_element("n" + str(k), "n" + str(min(k + 10, n)), "zx")
+        network.add_element("n" + str(n), "gnd", "rs")
+        return network
+
+    def test_sparse(self):
+        network = self.make_chain(60)
+        values = { "rs": 50.0, "zl": Inductor(1e-7 * np.array([1.0, 1.1])), "zc": Capacitor(4e-11), 
+            "zx": Resistor(1e4) }
+        f = np.linspace(1e6, 3e8, 100)
+        x, names = network.get_numeric_solution(f, values)
+        xs, names_s = network.get_sparse_solution(f, values)
+        self.assertEqual(names, names_s)
+        np.testing.assert_allclose(x, xs, rtol=1e-9, atol=1e-12)
+        # The plan is only redone when the topology changes
+        plan = network.get_elimination_plan()
+        network.get_sparse_solution(f, values)
+        self.assertIs(plan, network.get_elimination_plan())
+        network.add_element("n5", "gnd", "rs")
+        self.assertIsNot(plan, network.get_elimination_plan())
+        x, _ = network.get_numeric_solution(f, values)
+        xs, _ = network.get_sparse_solution(f, values)
+        np.testing.assert_allclose(x, xs, rtol=1e-9, atol=1e-12)
+
+    def test_subcircuit(self):
+        cell = Subcircuit(["a", "b"])
+        cell.add_element("a", "m", "zl")
+        cell.add_element("m", "b", "zl")
+        cell.add_element("m", "gnd", "zc")
+        network = Network()
+        network.add_element("vin", "v1", "rs")
+        network.set_input("vin")
+        network.add_subcircuit(cell, ["v1", "v2"])
+        network.add_subcircuit(cell, ["v2", "vout"])
+        network.add_element("vout", "gnd", "rs")
+        values = { "rs": 50.0, "zl": Inductor(1e-7), "zc": Capacitor(4e-11) }
+        f = np.linspace(1e6, 3e8, 50)
+        x, _ = network.get_numeric_solution(f, values)
+        xs, _ = network.get_sparse_solution(f, values)
+        np.testing.assert_allclose(x, xs, rtol=1e-9, atol=1e-12)
+
+    def test_small_pivot(self):
+        """ At resonance the first pivot (L and C in parallel at va) is ~0, 
+            that point is solved densely """
+        network = Network()
+        network.add_element("va", "gnd", "zc")
+        network.add_element("va", "vb", "zl")
+        network.add_element("vb", "gnd", "r")
+        network.add_element("vin", "vb", "r")
+        network.set_input("vin")
+        values = { "zc": Capacitor(1e-6), "zl": Inductor(1e-6), "r": 1.0 }
+        f = np.array([1e5, 1 / (2 * math.pi * 1e-6), 2e5])
+        x, _ = network.get_numeric_solution(f, values)
+        xs, _ = network.get_sparse_solution(f, values)
+        np.testing.assert_allclose(x, xs, rtol=1e-9, atol=1e-12)
+
+    def test_growth(self):
+        """ Just off resonance the first pivot is small but not tiny.  With 
+            two neighbours its elimination swamps the rest of the matrix, 
+            which the growth check catches """
+        network = Network()
+        network.add_element("va", "gnd", "zc")
+        network.add_element("va", "vb", "zl")
+        network.add_element("va", "vc", "zl")
+        network.add_element("vin", "vb", "r")
+        network.add_element("vb", "gnd", "r")
+        network.add_element("vc", "gnd", "r")
+        network.add_element("vb", "vc", "r")
+        network.set_input("vin")
+        values = { "zc": Capacitor(1e-6), "zl": Inductor(2e-6), "r": 1.0 }
+        f = 1 / (2 * math.pi * 1e-6) * np.array([0.5, 1 + 1e-10, 2.0])
+        x, _ = network.get_numeric_solution(f, values)
+        namespace = make_namespace(network.get_symbol_names(), values, 1j * omega(f))
+        plan = network.get_elimination_plan()
+        xs, bad = plan.solve(network, namespace, growth_tolerance=np.inf)
+        self.assertGreater(np.amax(np.absolute(xs[1] - x[1])), 1e-9)
+        _, bad = plan.solve(network, namespace)
+        self.assertEqual([False, True, False], list(bad))
+        xs, _ = network.get_sparse_solution(f, values)
+        np.testing.assert_allclose(x, xs, rtol=1e-9, atol=1e-12)
+
+class TestNoise(unittest.TestCase):
+
+    def test_divider(self):
+        """ Each resistor of a matched divider gives half of 4kT(R || R) """
+        network = Network()
+        network.add_element("vin", "vout", "rs")
+        network.add_element("vout", "gnd", "rl")
+        network.set_input("vin")
+        noise, elements = network.get_numeric_noise([1e6, 2e6], { "rs": 50, "rl": 50 })
+        self.assertEqual(["rs", "rl"], elements)
+        np.testing.assert_allclose(noise, 4 * 1.380649e-23 * 290 * 12.5)
+        np.testing.assert_allclose(noise_figure(noise, elements, "rs"), 10 * np.log10(2))
+
+    def test_subcircuit(self):
+        """ The noise of a subcircuit (from its port admittance) is the same
+            as that of its flattened elements """
+        mesh = Subcircuit(["a", "b"])
+        mesh.add_element("a", "m", "zx")
+        mesh.add_element("m", "b", "zk")
+        mesh.add_element("m", "gnd", "rq")
+        network = Network()
+        network.add_element("vin", "va", "rs")
+        network.add_element("va", "vb", "zl")
+        network.add_element("vb", "gnd", "zc")
+        network.add_element("va", "gnd", "zc")
+        network.add_subcircuit(mesh, ["vb", "vout"])
+        network.add_element("vout", "gnd", "rl")
+        network.set_input("vin")
+        values = { "rs": 50, "rl": 75, "zl": Inductor(1e-6, 50), "zc": Capacitor(1e-9),
+            "zx": Crystal(0.01, 1e-13, 20, 3e-12), "zk": Capacitor(2e-10), "rq": 300 }
+        f = np.linspace(4e6, 6e6, 7)
+        noise, elements = network.get_numeric_noise(f, values)
+        self.assertEqual(["rs", "zl", "zc(vb,gnd)", "zc(va,gnd)", "rl", "x1"], elements)
+        flat, _ = network.flatten().get_numeric_noise(f, values)
+        np.testing.assert_allclose(flat[..., :5], noise[..., :5])
+        np.testing.assert_allclose(np.sum(flat[..., 5:], axis=-1), noise[..., 5])
+        with self.assertRaises(ValueError):
+            network.get_numeric_noise(f, values, output="nope")
+
+class TestImports(unittest.TestCase):
+
+    def test_numeric_only(self):
+        """ The numeric path must not pull in sympy or matplotlib """
+        code = ("import sys\n"
+            "from network import Network\n"
+            "from elements import Capacitor\n"
+            "import filterdesign, response\n"
+            "network = Network()\n"
+            "network.add_element('vin', 'vout', 'rs')\n"
+            "network.add_element('vout', 'gnd', 'zc')\n"
+            "network.set_input('vin')\n"
+            "network.get_numeric_derivative([1e6], { 'rs': 50, 'zc': Capacitor(1e-9) })\n"
+            "print('sympy' in sys.modules, 'matplotlib' in sys.modules)\n")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual("False False", out.stdout.strip())
+
+class TestDerivative(unittest.TestCase):
+
+    def test_lu(self):
+        rng = np.random.default_rng(1)
+        a = rng.normal(size=(3, 5, 6, 6)) + 1j * rng.normal(size=(3, 5, 6, 6))
+        b = rng.normal(size=(6,))
+        lu = LUFactorization(a)
+        np.testing.assert_allclose(np.linalg.solve(a, b), lu.solve(b))
+        np.testing.assert_allclose(np.linalg.solve(np.swapaxes(a, -1, -2), b), lu.solve(b, trans=True))
+        # The condition estimate is (close to) the 1-norm condition number
+        estimate = estimate_condition(a, lu)
+        exact = np.linalg.cond(a, 1)
+        self.assertTrue(np.all(estimate <= exact * (1 + 1e-9)))
+        self.assertTrue(np.all(estimate >= exact / 3))
+        self.assertEqual(np.complex64, LUFactorization(a, np.complex64).lu.dtype)
+
+    def test_passband(self):
+        f = np.arange(6.0)
+        mag_db = np.array([[-10, -2, 0, -1, -5, -9], [-1, 0, -1, -1, -2, -2.5]])
+        min_freq, max_freq = passband(f, mag_db)
+        np.testing.assert_allclose([1, 0], min_freq)
+        np.testing.assert_allclose([4, np.nan], max_freq)
+
+if __name__ == '__main__':
+    unittest.main()
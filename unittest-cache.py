@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+from network import Network
+from elements import *
+from cache import *
+
+class TestCache(unittest.TestCase):
+
+    def test_cache(self):
+        network = Network()
+        network.add_element("vin", "vout", "r")
+        network.add_element("vout", "gnd", "zc")
+        network.set_input("vin")
+        f = np.logspace(2, 5, 30)
+        cache = ResultCache()
+        x, names = cache.get_numeric_solution(network, f, { "r": 1000.0, "zc": Capacitor(1e-8) })
+        expected, _ = network.get_numeric_solution(f, { "r": 1000.0, "zc": Capacitor(1e-8) })
+        np.testing.assert_allclose(expected, x)
+        self.assertFalse(x.flags.writeable)
+        # Rounding noise still hits
+        y, _ = cache.get_numeric_solution(network, f, { "r": 1000.0 * (1 + 1e-15), "zc": Capacitor(1e-8) })
+        self.assertIs(x, y)
+        # Different values, frequencies or topology miss
+        cache.get_numeric_solution(network, f, { "r": 1000.0, "zc": Capacitor(2e-8) })
+        cache.get_numeric_solution(network, f, { "r": 1000.0, "zc": Inductor(1e-8) })
+        cache.get_numeric_solution(network, f[:-1], { "r": 1000.0, "zc": Capacitor(1e-8) })
+        network.add_element("vout", "gnd", "r")
+        cache.get_numeric_solution(network, f, { "r": 1000.0, "zc": Capacitor(1e-8) })
+        # Arbitrary callables can't be keyed
+        cache.get_numeric_solution(network, f, { "r": 1000.0, "zc": lambda s: 1 / (1e-8 * s) })
+        stats = cache.statistics()
+        self.assertEqual((1, 5, 1, 5), (stats["hits"], stats["misses"], stats["uncacheable"], stats["entries"]))
+        # The memory limit evicts the oldest entries
+        cache.max_bytes = 2 * x.nbytes
+        cache.get_numeric_solution(network, f, { "r": 10.0, "zc": Capacitor(1e-8) })
+        self.assertEqual(2, cache.statistics()["entries"])
+        self.assertEqual(4, cache.statistics()["evictions"])
+        # The precision is part of the key
+        values = { "r": 10.0, "zc": Capacitor(1e-8) }
+        x32, _ = cache.get_numeric_solution(network, f, values, precision="single")
+        self.assertEqual(np.complex64, x32.dtype)
+        self.assertEqual(np.complex128, cache.get_numeric_solution(network, f, values)[0].dtype)
+        # Results too large to be cached stay writeable
+        cache.max_bytes = 1
+        self.assertTrue(cache.get_numeric_solution(network, f, { "r": 20.0, "zc": Capacitor(1e-8) })[0].flags.writeable)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import math
+import numpy as np
+from elements import *
+from crystal import *
+
+class TestCrystal(unittest.TestCase):
+
+    def lot(self, count):
+        rng = np.random.default_rng(1)
+        fs = 5.0e6 + rng.uniform(-500, 500, count)
+        lm = 0.098 * (1 + 0.05 * rng.normal(size=count))
+        cm = 1 / ((2 * math.pi * fs) ** 2 * lm)
+        rx = rng.uniform(8, 30, count)
+        cp = rng.uniform(3e-12, 5e-12, count)
+        return lm, cm, rx, cp
+
+    def test_fit(self):
+        params = self.lot(20)
+        f = np.linspace(4.996e6, 5.012e6, 801)
+        z = Crystal(*params)(2j * math.pi * f)
+        s21 = 100 / (100 + z)
+        for kind, data in (("z", np.absolute(z)), ("z", z), ("s21", np.absolute(s21)), ("s21", s21)):
+            fit = fit_crystals(f, data, kind=kind, r0=50)
+            for fitted, actual in zip((fit.lm, fit.cm, fit.rx, fit.cp), params):
+                np.testing.assert_allclose(fitted, actual, rtol=1e-6)
+        # The fit can be used as a model
+        np.testing.assert_allclose(fit.crystal()(2j * math.pi * f), z, rtol=1e-6)
+        self.assertEqual(len(fit.crystals()), 20)
+
+    def test_outside(self):
+        params = self.lot(3)
+        f = np.linspace(5.003e6, 5.012e6, 401)
+        with self.assertRaises(ValueError):
+            fit_crystals(f, np.absolute(Crystal(*params)(2j * math.pi * f)))
+
+if __name__ == '__main__':
+    unittest.main()
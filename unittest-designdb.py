@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+from network import Network
+from elements import *
+from ladder import *
+from designdb import *
+
+class TestDesignDatabase(unittest.TestCase):
+
+    def test_designs(self):
+        database = DesignDatabase()
+        for N, bw, lot in ((4, 2400, "a"), (4, 3000, "a"), (4, 3500, "b"), (6, 2700, "a")):
+            database.crystal_ladder_design(N, 5e6, bw, 0.098, 0.010339e-12, 240000, lot)
+        self.assertEqual(4, database.misses)
+        design = database.crystal_ladder_design(4, 5e6, 3000, 0.098, 0.010339e-12, 240000, "a")
+        self.assertEqual(crystal_ladder_design(4, 5e6, 3000, 0.098, 0.010339e-12, 240000), design)
+        self.assertEqual(1, database.hits)
+        self.assertEqual([2400, 3000], [r.bw for r in database.find(n=4, fc=5e6, bw=(2400, 3000))])
+        self.assertEqual([3500], [r.bw for r in database.find(lot="b")])
+        record = database.find(n=6)[0]
+        database.set_metrics(record, loss_db=3.5)
+        database.set_metrics(record.id, ripple_db=0.2)
+        self.assertEqual({ "loss_db": 3.5, "ripple_db": 0.2 }, database.find(n=6)[0].metrics)
+        with self.assertRaises(ValueError):
+            database.set_metrics(100, loss_db=1.0)
+
+    def test_responses(self):
+        database = DesignDatabase()
+        record = database.add_design("rc", { "r": 1000.0, "c": 1e-8 }, {})
+        network = Network()
+        network.add_element("vin", "vout", "r")
+        network.add_element("vout", "gnd", "zc")
+        network.set_input("vin")
+        f = np.logspace(2, 5, 30)
+        values = { "r": 1000.0, "zc": Capacitor(1e-8) }
+        x, names = database.get_numeric_solution(network, f, values, record)
+        y, names_y = database.get_numeric_solution(network, f, values)
+        self.assertEqual((1, 1), (database.hits, database.misses))
+        self.assertEqual(names, names_y)
+        np.testing.assert_array_equal(x, y)
+        self.assertEqual(1, len(database.responses(record)))
+
+    def test_hooks(self):
+        """ The db= hooks of the ladder design and of the numeric solve """
+        database = DesignDatabase()
+        design = crystal_ladder_design(4, 5e6, 3000, 0.098, 0.010339e-12, 240000, db=database)
+        self.assertEqual(design, crystal_ladder_design(4, 5e6, 3000, 0.098, 0.010339e-12, 240000, db=database))
+        self.assertEqual((1, 1), (database.hits, database.misses))
+        Rse, Ck_list, Cs_list, _ = design
+        network = crystal_ladder_network(4)
+        values = crystal_ladder_values(4, Crystal(0.098, 0.010339e-12, 6.0), Rse, Cs_list, Ck_list)
+        f = np.linspace(4.99e6, 5.01e6, 20)
+        x, _ = network.get_numeric_solution(f, values, db=database)
+        y, _ = network.get_numeric_solution(f, values, db=database)
+        x32, _ = network.get_numeric_solution(f, values, "single", db=database)
+        self.assertEqual((2, 3), (database.hits, database.misses))
+        np.testing.assert_array_equal(x, y)
+        self.assertEqual(np.complex64, x32.dtype)
+
+if __name__ == '__main__':
+    unittest.main()
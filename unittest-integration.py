@@ -0,0 +1,186 @@
+# Slow integration tests: these start worker pools, subprocesses and a
+# socket server, so they are kept out of the unit tests.
+#
+#   python unittest-integration.py
+#
+import unittest
+import numpy as np
+from network import Network
+from elements import *
+from ladder import *
+import benchmark
+import server
+
+class TestParallel(unittest.TestCase):
+
+    def test_parallel_symbolic(self):
+        from sympy import symbols
+        # A bridged ladder with five unknown nodes
+        network = Network()
+        network.add_element("vin", "v0", "rs")
+        network.set_input("vin")
+        for k in range(4):
+            network.add_element("v" + str(k), "v" + str(k + 1), "zs" + str(k))
+            network.add_element("v" + str(k + 1), "gnd", "zp" + str(k))
+        network.add_element("v0", "v2", "zb")
+        network.add_element("v4", "vout", "rl")
+        x = network.get_solution()
+        calls = []
+        for workers in (1, 2):
+            y = network.get_parallel_solution(["vout"], workers=workers,
+                progress=lambda done, total: calls.append((done, total)))
+            point = { symbols(name): k + 1.5 for k, name in enumerate(network.get_symbol_names()) }
+            self.assertAlmostEqual(complex(x["vout"].subs(point)), complex(y["vout"].subs(point)))
+            self.assertEqual(1, y["vin"])
+            with self.assertRaises(KeyError):
+                y["v1"]
+        # det(A) and vout in this process, then split up for the pool
+        self.assertEqual([(1, 2), (2, 2)], calls[:2])
+        self.assertGreater(len(calls), 4)
+        self.assertEqual(calls[-1][0], calls[-1][1])
+        with self.assertRaises(TimeoutError):
+            network.get_parallel_solution(workers=2, timeout=1e-6)
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_scenario(self):
+        script = benchmark.run_scenario("test-lcr-1.py")
+        fast = benchmark.run_scenario("test-lcr-1.py", fast=True)
+        self.assertEqual(1, len(script["lines"]))
+        self.assertGreater(script["rss"], 0)
+        records = { "test-lcr-1.py": { "script": script, "fast": fast } }
+        report = benchmark.compare(records, records)["test-lcr-1.py"]
+        self.assertTrue(report["baseline"])
+        self.assertTrue(report["fast agrees"])
+        self.assertEqual(1.0, report["speed"])
+        # A changed response doesn't agree with the baseline
+        changed = { "test-lcr-1.py": { "script": dict(script, lines=[[script["lines"][0][0],
+            list(np.array(script["lines"][0][1]) + 0.01)]]) } }
+        self.assertFalse(benchmark.compare(records, changed)["test-lcr-1.py"]["baseline"])
+        self.assertIsNone(benchmark.compare(records, {})["test-lcr-1.py"]["speed"])
+
+    def test_reference(self):
+        """ The numeric rewrite of test-design-6 is checked against the
+            symbolic reference """
+        script = benchmark.run_scenario("test-design-6.py")
+        reference = benchmark.run_scenario("test-design-6.py", reference=True)
+        self.assertEqual(4, len(reference["lines"]))
+        records = { "test-design-6.py": { "script": script, "reference": reference } }
+        self.assertTrue(benchmark.compare(records, {})["test-design-6.py"]["reference agrees"])
+        changed = dict(reference, lines=[[x, list(np.array(y) + 0.01)] for x, y in reference["lines"]])
+        records["test-design-6.py"]["reference"] = changed
+        self.assertFalse(benchmark.compare(records, {})["test-design-6.py"]["reference agrees"])
+
+class TestServer(unittest.TestCase):
+
+    def test_solve(self):
+        import asyncio, os, tempfile, threading, time
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "server.sock")
+        simulation = server.SimulationServer(path, workers=2)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(simulation.start())
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            client = server.SimulationClient(path)
+            N = 3
+            Rse, Ck_list, Cs_list, _ = crystal_ladder_design(N, 5e6, 3000, 0.098, 0.010339e-12, 240000)
+            network = crystal_ladder_network(N)
+            f = np.linspace(4.995e6, 5.005e6, 20)
+            values = crystal_ladder_values(N, Crystal(0.098, 0.010339e-12, 6.0, 4e-12), Rse, Cs_list, Ck_list)
+            expected, names = network.get_numeric_solution(f, values)
+            for k in range(2):
+                x, names_x = client.get_numeric_solution(network, f, values)
+                self.assertEqual(names, names_x)
+                np.testing.assert_allclose(expected, x)
+            # Batched values and a subset of the outputs
+            values["rs"] = Resistor(np.array([[Rse], [2 * Rse]]))
+            x, names_x = client.get_numeric_solution(network, f, values, outputs=["vout"])
+            self.assertEqual((2, 1, 20, 1), x.shape)
+            self.assertEqual({ "requests": 3, "network_hits": 2, "networks": 1 }, client.statistics())
+            with self.assertRaises(RuntimeError):
+                client.get_numeric_solution(network, f, { "rs": 50 })
+            with self.assertRaises(ValueError):
+                client.get_numeric_solution(network, f, dict(values, rs=lambda s: 50 + 0 * s))
+            client.close()
+            # Only the user running the server can connect
+            self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+            # The server unlinks the blocks that a client leaves behind
+            client = server.SimulationClient(path)
+            response = client._request({ "op": "solve", "network": server.encode_network(network),
+                "f": f.tolist(), "values": { name: server.encode_value(v) for name, v in values.items() } })
+            self.assertTrue(os.path.exists("/dev/shm/" + response["shm"].lstrip("/")))
+            client.ping()
+            self.assertFalse(os.path.exists("/dev/shm/" + response["shm"].lstrip("/")))
+            response = client._request({ "op": "solve", "network": server.encode_network(network),
+                "f": f.tolist(), "values": { name: server.encode_value(v) for name, v in values.items() } })
+            client.close()
+            for _ in range(100):
+                if not simulation._blocks:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(set(), simulation._blocks)
+            self.assertFalse(os.path.exists("/dev/shm/" + response["shm"].lstrip("/")))
+        finally:
+            asyncio.run_coroutine_threadsafe(simulation.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_untrusted(self):
+        """ Only arithmetic expressions and constructor arguments are accepted """
+        network = crystal_ladder_network(3)
+        spec = server.encode_network(network)
+        self.assertEqual(network.get_topology_key(), server.decode_network(spec).get_topology_key())
+        for imp in ("__import__('os').getcwd()", "zx.real", "zs1[0]", "zs1 + 'a'", "zs1 ** 2"):
+            spec["edges"][0][2] = imp
+            with self.assertRaises(ValueError):
+                server.decode_network(spec)
+        crystal = server.decode_value(server.encode_value(Crystal(0.098, 0.010339e-12, 6.0)))
+        self.assertEqual(Crystal(0.098, 0.010339e-12, 6.0).key(), crystal.key())
+        series = Series(Capacitor(1e-12), Short())
+        self.assertEqual(series.key(), server.decode_value(server.encode_value(series)).key())
+        with self.assertRaises(ValueError):
+            server.decode_value({ "type": "Resistor", "attributes": { "r": 50, "__class__": 1 } })
+
+    def test_concurrent(self):
+        """ Clients on several threads solving the same network """
+        import asyncio, os, tempfile, threading
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "server.sock")
+        simulation = server.SimulationServer(path, workers=4)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(simulation.start())
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            N = 4
+            Rse, Ck_list, Cs_list, _ = crystal_ladder_design(N, 5e6, 3000, 0.098, 0.010339e-12, 240000)
+            network = crystal_ladder_network(N)
+            f = np.linspace(4.995e6, 5.005e6, 50)
+            crystals = [Crystal(0.098, 0.010339e-12, 6.0 + k, 4e-12) for k in range(8)]
+            results = [None] * len(crystals)
+            def run(k):
+                client = server.SimulationClient(path)
+                values = crystal_ladder_values(N, crystals[k], Rse, Cs_list, Ck_list)
+                results[k] = client.get_numeric_solution(network, f, values)[0]
+                client.close()
+            threads = [threading.Thread(target=run, args=(k,)) for k in range(len(crystals))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for k, crystal in enumerate(crystals):
+                values = crystal_ladder_values(N, crystal, Rse, Cs_list, Ck_list)
+                np.testing.assert_allclose(network.get_numeric_solution(f, values)[0], results[k])
+            self.assertEqual(1, len(simulation._networks))
+        finally:
+            asyncio.run_coroutine_threadsafe(simulation.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import math
+import numpy as np
+from network import Network
+from elements import *
+from sweep import *
+from jobs import *
+
+def _rc_network():
+    network = Network()
+    network.add_element("vin", "vout", "r")
+    network.add_element("vout", "gnd", "zc")
+    network.set_input("vin")
+    return network
+
+def _sweep_values(r, c):
+    return { "r": r, "zc": Capacitor(c) }
+
+def _random_values(rng, count):
+    return { "r": rng.normal(1000.0, 10.0, count), "zc": Capacitor(1e-8) }
+
+class TestJobs(unittest.TestCase):
+
+    def test_sweep(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        f = np.logspace(2, 5, 30)
+        sweep = Sweep(f).add_axis("r", [500.0, 1000.0, 2000.0, 4000.0, 8000.0]).add_axis("c", [1e-9, 1e-8])
+        job = SweepJob(directory, sweep, _rc_network(), _sweep_values, ["vout"], chunk_size=2)
+        self.assertEqual(3, job.chunks)
+        # A job that was stopped after its first chunk only computes the rest
+        job.run_chunk(1)
+        calls = []
+        job.run(progress=lambda done, total: calls.append(done))
+        self.assertEqual([2, 3], calls)
+        expected = sweep.run(_rc_network(), _sweep_values)
+        np.testing.assert_allclose(expected["vout"], job.result()["vout"])
+        # Nothing is left to do
+        job.run(progress=lambda done, total: calls.append(done))
+        self.assertEqual([2, 3], calls)
+        # A different job can't use the directory
+        other = SweepJob(directory, sweep, _rc_network(), _sweep_values, ["vout"], chunk_size=1)
+        with self.assertRaises(ValueError):
+            other.run()
+
+    def test_monte_carlo(self):
+        import tempfile
+        f = np.logspace(3, 5, 10)
+        jobs = [MonteCarloJob(tempfile.mkdtemp(), _rc_network(), _random_values, f, 250, ["vout"], seed=5,
+            chunk_size=100) for _ in range(2)]
+        with self.assertRaises(ValueError):
+            jobs[0].result()
+        jobs[0].run()
+        # Chunks computed out of order (and in other processes) are the same
+        jobs[1]._prepare()
+        jobs[1].run_chunk(2)
+        jobs[1].run(workers=2)
+        x = jobs[0].result()
+        self.assertEqual((250, 10, 1), x.shape)
+        np.testing.assert_array_equal(x, jobs[1].result())
+        r = _random_values(jobs[0].generator(1), 100)["r"]
+        np.testing.assert_allclose(1 / (1 + 2j * math.pi * f * r[:, np.newaxis] * 1e-8), x[100:200, :, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import numpy as np
+from elements import *
+from ladder import *
+from lookup import *
+
+class TestLookup(unittest.TestCase):
+
+    def test_table(self):
+        N = 4
+        Rse, Ck_list, Cs_list, fmesh2 = crystal_ladder_design(N, 5e6, 3000, 0.098, 0.010339e-12, 240000)
+        network = crystal_ladder_network(N)
+        # Two designs (with different crystal Q) share one table
+        values = crystal_ladder_values(N, Crystal(0.098, 0.010339e-12, np.array([10, 20]), 4e-12), 
+            Rse, Cs_list, Ck_list)
+        table = build_response_table(network, values, 4.94e6, 5.06e6, tolerance=1e-5)
+        self.assertEqual((2, len(table.f)), table.h.shape)
+        f = np.random.default_rng(3).uniform(4.94e6, 5.06e6, 500)
+        x, names = network.get_numeric_solution(f, values)
+        error = np.absolute(table(f) / x[..., names.index("vout")] - 1)
+        self.assertLess(np.amax(error), 1e-5)
+        self.assertTrue(np.all(error <= 2 * table.error_estimate(f) + 1e-12))
+        # The samples are densest around the passband
+        spacing = np.diff(table.f)
+        self.assertLess(spacing[np.searchsorted(table.f, 5.002e6)], spacing[0] / 10)
+        with self.assertRaises(ValueError):
+            table([5.1e6])
+
+if __name__ == '__main__':
+    unittest.main()
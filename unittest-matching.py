@@ -0,0 +1,37 @@
+import unittest
+import math
+import numpy as np
+from elements import *
+from ladder import *
+from response import *
+from crystal import *
+from matching import *
+
+class TestMatching(unittest.TestCase):
+
+    def test_match(self):
+        N = 4
+        Lm, Cm, Cp = 0.098, 0.010339e-12, 4e-12
+        Rse, Ck_list, Cs_list, fmesh2 = crystal_ladder_design(N, 5e6, 3000, Lm, Cm, 240000)
+        f = np.linspace(4.994e6, 5.006e6, 60)
+        values = crystal_ladder_values(N, Crystal(Lm, Cm, 10, Cp), Rse, Cs_list, Ck_list)
+        x, names = crystal_ladder_network(N).get_numeric_solution(f, values)
+        target = magnitude_db(x[..., names.index("vout")])
+        rng = np.random.default_rng(2)
+        count = 40
+        fs = 1 / (2 * math.pi * math.sqrt(Lm * Cm)) + rng.normal(0, 150, count)
+        lm = Lm * (1 + 0.03 * rng.normal(size=count))
+        lot = CrystalFit(lm, 1 / ((2 * math.pi * fs) ** 2 * lm), rng.uniform(10, 12, count), 
+            Cp * (1 + 0.1 * rng.normal(size=count)), np.zeros(count))
+        match = match_crystals(N, lot, Rse, Cs_list, Ck_list, f, target, exclude=[0, 1])
+        self.assertEqual(len(set(match.assignment)), N)
+        self.assertFalse(set(match.assignment) & {0, 1})
+        # The score is reported correctly and beats any random choice
+        score = assignment_scores(N, lot, match.assignment, Rse, Cs_list, Ck_list, f, target)
+        self.assertAlmostEqual(score[0], match.score)
+        random = np.array([rng.permutation(np.arange(2, count))[:N] for _ in range(200)])
+        self.assertLess(match.score, np.amin(assignment_scores(N, lot, random, Rse, Cs_list, Ck_list, f, target)))
+        self.assertLess(match.evaluated, 10000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from elements import *
+from ladder import *
+from optimize import *
+from response import *
+
+class TestOptimize(unittest.TestCase):
+
+    def setUp(self):
+        fc = 5000000
+        bw = 3000
+        self.N = 4
+        self.Rse, Ck_list, Cs_list, _ = crystal_ladder_design(self.N, fc, bw, 0.098, 0.010339e-12, 240000)
+        self.p0 = [Cs_list[0], Ck_list[0], Ck_list[1]]
+        self.crystal = Crystal(0.098, 0.010339e-12, 0.8, 4e-12)
+        self.network = crystal_ladder_network(self.N)
+        self.f = np.linspace(fc - 2 * bw, fc + 2 * bw, 200)
+
+    def make_values(self, p):
+        # Symmetric: the end tuning capacitors and the end coupling 
+        # capacitors are the same
+        return crystal_ladder_values(self.N, self.crystal, self.Rse, [p[0], 0, 0, p[0]], [p[1], p[2], p[1]])
+
+    def test_gradient(self):
+        x, dx, names = self.network.get_numeric_gradient(self.f, self.make_values, self.p0)
+        self.assertEqual((3,) + x.shape, dx.shape)
+        for k in range(3):
+            p = list(self.p0)
+            p[k] *= 1 + 1e-7
+            x2, _ = self.network.get_numeric_solution(self.f, self.make_values(p))
+            np.testing.assert_allclose((x2 - x) / (self.p0[k] * 1e-7), dx[k], atol=1e-5 * np.amax(np.absolute(dx[k])))
+
+    def test_mask(self):
+        lower, upper = passband_mask([0.0, 1.0, 2.0, 3.0], 1.5, 1.0, ripple_db=1.0, loss_db=2.0, stop_bw=3.0, stop_db=20)
+        np.testing.assert_array_equal([-np.inf, -3.0, -3.0, -np.inf], lower)
+        np.testing.assert_array_equal([-20.0, -1.0, -1.0, -20.0], upper)
+
+    def test_optimize(self):
+        """ With Cp the design is off-centre, so pull it onto 5.002 MHz """
+        lower, upper = passband_mask(self.f, 5002000, 2500, ripple_db=1.0, loss_db=0.5, stop_bw=6000, stop_db=15)
+        r, _ = mask_residuals(self.network, self.make_values, self.p0, self.f, lower, upper)
+        self.assertGreater(r @ r, 1.0)
+        result = optimize_mask(self.network, self.make_values, self.p0, self.f, lower, upper,
+            bounds=[(1e-12, 200e-12)] * 3)
+        self.assertTrue(result.converged)
+        self.assertLess(result.cost, 1e-6)
+        x, names = self.network.get_numeric_solution(self.f, self.make_values(result.p))
+        min_freq, max_freq = passband(self.f, magnitude_db(x[..., names.index("vout")]))
+        self.assertAlmostEqual(5002000, (min_freq + max_freq) / 2.0, delta=100)
+
+    def test_stalled(self):
+        """ With the parameters pinned no step lowers the cost, which isn't
+            convergence """
+        lower, upper = passband_mask(self.f, 5002000, 2500, ripple_db=1.0, loss_db=0.5, stop_bw=6000, stop_db=15)
+        result = optimize_mask(self.network, self.make_values, self.p0, self.f, lower, upper,
+            bounds=[(p, p) for p in self.p0])
+        self.assertFalse(result.converged)
+        self.assertGreater(result.cost, 1.0)
+        # The rejected trials only evaluate the cost, not the gradient
+        calls = []
+        gradient = self.network.get_numeric_gradient
+        self.network.get_numeric_gradient = lambda *args: calls.append(1) or gradient(*args)
+        optimize_mask(self.network, self.make_values, self.p0, self.f, lower, upper,
+            bounds=[(p, p) for p in self.p0])
+        self.assertEqual(1, len(calls))
+        result = optimize_mask(self.network, self.make_values, self.p0, self.f, lower, upper,
+            bounds=[(1e-12, 200e-12)] * 3, max_iter=1)
+        self.assertFalse(result.converged)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from network import Network
+from elements import *
+from reduction import *
+
+class TestReduction(unittest.TestCase):
+
+    def make_ladder(self, N, cp):
+        network = Network()
+        network.add_element("vin", "v1", "rs")
+        network.set_input("vin")
+        for mesh in range(1, N):
+            network.add_element("v" + str(mesh), "v" + str(mesh + 1), "zs" + str(mesh) + " + zx")
+            network.add_element("v" + str(mesh + 1), "gnd", "zk" + str(mesh))
+        network.add_element("v" + str(N), "vout", "zs" + str(N) + " + zx")
+        network.add_element("vout", "gnd", "rl")
+        values = { "rs": 2400.0, "rl": 2400.0, "zx": Crystal(0.098, 0.010339e-12, 6.0, cp) }
+        for mesh in range(1, N + 1):
+            values["zs" + str(mesh)] = Capacitor(31.8e-12) if mesh in (1, N) else Short()
+            if mesh < N:
+                values["zk" + str(mesh)] = Capacitor(20.5e-12 if mesh in (1, N - 1) else 31.8e-12)
+        return network, values
+
+    def test_prima(self):
+        network, values = self.make_ladder(6, 4e-12)
+        f = np.linspace(4.995e6, 5.01e6, 300)
+        model = reduce_network(network, values, 5.0e6, f_check=f, tolerance=1e-4)
+        self.assertLess(model.order, model.full_order)
+        self.assertLess(model.error, 1e-4)
+        self.assertTrue(model.converged)
+        self.assertTrue(model.is_passive())
+        x, names = network.get_numeric_solution(f, values)
+        xr, names_r = model.evaluate(f)
+        self.assertEqual(["vout"], names_r)
+        np.testing.assert_allclose(x[..., names.index("vout")], xr[..., 0], atol=1e-4)
+        # The order can also be given directly
+        fixed = reduce_network(network, values, 5.0e6, order=model.order - 2)
+        self.assertEqual(model.order - 2, fixed.order)
+        self.assertIsNone(fixed.error)
+        self.assertIsNone(fixed.converged)
+        # A tolerance that can't be met within max_order is reported
+        short = reduce_network(network, values, 5.0e6, f_check=f, tolerance=1e-4, max_order=4)
+        self.assertEqual(4, short.order)
+        self.assertGreater(short.error, 1e-4)
+        self.assertFalse(short.converged)
+
+    def test_not_expandable(self):
+        network, values = self.make_ladder(2, None)
+        values["rs"] = Inductor(1e-6, qu=200)
+        with self.assertRaises(ValueError):
+            reduce_network(network, values, 5.0e6, order=4)
+
+    def test_shorted_input(self):
+        network, values = self.make_ladder(2, None)
+        network.add_element("vin", "gnd", "zg")
+        values["zg"] = Short()
+        with self.assertRaises(ValueError):
+            reduce_network(network, values, 5.0e6, order=4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from elements import *
+from ladder import *
+from response import *
+from standard import *
+
+class TestStandard(unittest.TestCase):
+
+    def test_parts(self):
+        self.assertEqual(len(standard_values(E96, 1, 1000)), 289)
+        np.testing.assert_allclose(standard_values(E12, 1e-12, 1e-11), np.array(E12 + [10]) * 1e-12, rtol=1e-9)
+        parts = standard_parts(10.3e-12)
+        self.assertAlmostEqual(parts[0].value, 10.3e-12, delta=1e-18)
+        self.assertEqual(parts[0].connection, "parallel")
+        self.assertEqual(str(standard_parts(4.7e-12)[0]), "4.7p")
+        # Resistors add in series
+        self.assertEqual(str(standard_parts(1234, "r", E96)[0]), "series(698, 536)")
+        self.assertEqual(str(Part(33.3e-12, (82e-12, 56e-12), "series")), "series(82p, 56p)")
+
+    def test_quantize(self):
+        N = 4
+        Rse, Ck_list, Cs_list, fmesh2 = crystal_ladder_design(N, 5e6, 3000, 0.098, 0.010339e-12, 240000)
+        f = np.linspace(4.994e6, 5.006e6, 60)
+        crystal = Crystal(0.098, 0.010339e-12, 10, 4e-12)
+        def make_values(p):
+            return crystal_ladder_values(N, crystal, Rse, p[N - 1:], p[:N - 1])
+        network = crystal_ladder_network(N)
+        x, names = network.get_numeric_solution(f, make_values(Ck_list + Cs_list))
+        target = magnitude_db(x[..., names.index("vout")])
+        result = quantize_values(network, make_values, Ck_list + Cs_list, f, target)
+        self.assertIsNone(result.parts[N])
+        nearest = [0.0 if v == 0 else standard_parts(v)[0].value for v in Ck_list + Cs_list]
+        self.assertLessEqual(result.score, response_scores(network, make_values, nearest, f, target)[0])
+        self.assertLess(result.score, 0.05)
+
+    def test_mixed_batch(self):
+        """ A zero tuning capacitor in a batch is a short for that design
+            only """
+        N = 4
+        Rse, Ck_list, Cs_list, _ = crystal_ladder_design(N, 5e6, 3000, 0.098, 0.010339e-12, 240000)
+        f = np.linspace(4.994e6, 5.006e6, 60)
+        crystal = Crystal(0.098, 0.010339e-12, 10, 4e-12)
+        network = crystal_ladder_network(N)
+        cs = np.array([0.0, 100e-12])
+        batch = list(Cs_list)
+        batch[1] = cs
+        x, names = network.get_numeric_solution(f, crystal_ladder_values(N, crystal, Rse, batch, Ck_list))
+        for k in range(len(cs)):
+            single = list(Cs_list)
+            single[1] = cs[k]
+            xk, _ = network.get_numeric_solution(f, crystal_ladder_values(N, crystal, Rse, single, Ck_list))
+            np.testing.assert_allclose(xk, x[k], rtol=1e-9, atol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import math
+import numpy as np
+from network import Network
+from elements import *
+from sweep import *
+
+class TestSweep(unittest.TestCase):
+
+    def test_sweep(self):
+        network = Network()
+        network.add_element("vin", "vout", "r")
+        network.add_element("vout", "gnd", "zc")
+        network.set_input("vin")
+        f = np.logspace(2, 5, 30)
+        sweep = Sweep(f).add_axis("r", [500.0, 1000.0, 2000.0]).add_axis("c", [1e-9, 1e-8]).add_axis("t", [0, 25, 50])
+        def make_values(r, c, t):
+            # r is a plain number (a resistance), t is ignored
+            return { "r": r, "zc": Capacitor(c) }
+        result = sweep.run(network, make_values, outputs=["vout"])
+        self.assertEqual(("r", "c", "t", "f"), result.dims)
+        self.assertEqual((3, 2, 3, 30), result["vout"].shape)
+        expected = 1 / (1 + 2j * math.pi * f * 1000.0 * 1e-8)
+        np.testing.assert_allclose(expected, result.sel("vout", r=1000, c=1e-8, t=25))
+        np.testing.assert_allclose(result["vout"][:, :, 0], result["vout"][:, :, 2])
+        self.assertEqual((2, 3, 30), result.sel("vout", r=990).shape)
+        # Chunked along the first axis
+        small = sweep.run(network, make_values, max_bytes=1)
+        np.testing.assert_allclose(result["vout"], small["vout"])
+        with self.assertRaises(ValueError):
+            sweep.add_axis("r", [1.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import math
+import numpy as np
+from network import Network
+from elements import *
+from transient import *
+
+class TestTransient(unittest.TestCase):
+
+    def make_rc(self):
+        network = Network()
+        network.add_element("vin", "vout", "r")
+        network.add_element("vout", "gnd", "zc")
+        network.set_input("vin")
+        return network
+
+    def test_rc_step(self):
+        """ RC low-pass step response is 1 - exp(-t/RC) """
+        network = self.make_rc()
+        tau = np.array([1e-3, 2e-3])
+        values = { "r": 1000.0, "zc": Capacitor(tau / 1000.0) }
+        t, y = step_response(network, values, 4096, 200000.0)
+        self.assertEqual((2, 4096), y.shape)
+        expected = 1.0 - np.exp(-t / tau[:, np.newaxis])
+        np.testing.assert_allclose(expected[:, 10:2000], y[:, 10:2000], atol=1e-3)
+        np.testing.assert_allclose([5 * 1e-3, 5 * 2e-3], settling_time(t, y, 0.0067), rtol=0.01)
+
+    def test_baseband(self):
+        """ Series resonator at 5 MHz: the envelope behaves like the RC
+            low-pass with tau = 2L/R """
+        network = Network()
+        network.add_element("vin", "vout", "zx")
+        network.add_element("vout", "gnd", "rl")
+        network.set_input("vin")
+        fc = 5000000.0
+        lm = 0.1
+        cm = 1.0 / ((2.0 * math.pi * fc) ** 2 * lm)
+        values = { "zx": Crystal(lm, cm, 50.0), "rl": 50.0 }
+        t, y = step_response(network, values, 4096, 20000.0, fc=fc)
+        tau = 2.0 * lm / 100.0
+        expected = 0.5 * (1.0 - np.exp(-t / tau))
+        np.testing.assert_allclose(expected[10:2000], np.absolute(y[10:2000]), atol=1e-3)
+        with self.assertRaises(ValueError):
+            frequency_grid(16, 2 * fc, fc)
+
+if __name__ == '__main__':
+    unittest.main()
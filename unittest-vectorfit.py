@@ -0,0 +1,41 @@
+import unittest
+import math
+import numpy as np
+from elements import *
+from ladder import *
+from vectorfit import *
+
+class TestVectorFit(unittest.TestCase):
+
+    def test_recover(self):
+        """ A rational response is fitted exactly, with its own poles """
+        rng = np.random.default_rng(0)
+        f = np.linspace(1e6, 2e6, 200)
+        poles = -rng.uniform(1e4, 1e5, 6) + 2j * math.pi * rng.uniform(1e6, 2e6, 6)
+        model = PoleResidueModel(poles, rng.normal(size=6) * 1e5 + 1j * rng.normal(size=6) * 1e5, 0.1)
+        fit = vector_fit(f, model(f), 6)
+        self.assertLess(fit.rms, 1e-10)
+        np.testing.assert_allclose(np.sort_complex(poles), np.sort_complex(fit.poles), rtol=1e-9)
+        self.assertAlmostEqual(0.1, fit.d)
+
+    def test_ladder(self):
+        N = 4
+        Rse, Ck_list, Cs_list, _ = crystal_ladder_design(N, 5e6, 3000, 0.098, 0.010339e-12, 240000)
+        network = crystal_ladder_network(N)
+        f = np.linspace(4.99e6, 5.01e6, 400)
+        crystal = Crystal(0.098, 0.010339e-12, np.array([[6.0], [8.0]]), 4e-12)
+        x, names = network.get_numeric_solution(f, crystal_ladder_values(N, crystal, Rse, Cs_list, Ck_list))
+        h = x[:, 0, :, names.index("vout")]
+        fit = vector_fit(f, h, 6)
+        self.assertEqual((2, 6), fit.poles.shape)
+        self.assertTrue(np.all(fit.poles.real < 0))
+        np.testing.assert_allclose(h, fit(f), rtol=1e-8, atol=1e-8 * np.amax(np.absolute(h)))
+        # Cascading two of the fitted filters
+        a = PoleResidueModel(fit.poles[0], fit.residues[0], fit.d[0])
+        b = PoleResidueModel(fit.poles[1], fit.residues[1], fit.d[1])
+        cascade = a.cascade(b)
+        self.assertEqual((12,), cascade.poles.shape)
+        np.testing.assert_allclose(h[0] * h[1], cascade(f), atol=1e-8 * np.amax(np.absolute(h[0] * h[1])))
+
+if __name__ == '__main__':
+    unittest.main()
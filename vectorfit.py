@@ -0,0 +1,117 @@
+# Vector fitting of frequency responses to compact pole-residue models.
+#
+# The model of order N is
+#
+#   H(s) = sum_k r_k / (s - p_k) + d
+#
+# fitted to complex samples of H over a band (from a Network sweep or from
+# measured S21).  The fitting is the usual vector fitting iteration: the
+# poles are relocated by solving a linear least squares problem for
+# sigma(s) H(s), with sigma(s) = 1 + sum_k c_k / (s - p_k) sharing the
+# poles, and taking the zeros of sigma as the new poles.  Unstable poles
+# are reflected into the left half plane after every step, and the
+# residues are then fitted for the final poles.
+#
+# The poles and residues are complex and not constrained to conjugate
+# pairs, since the data only covers the band of interest (e.g. the
+# passband and skirts of an IF filter), which is what the models are used
+# for.  Every response of a batch gets its own poles; the least squares
+# problems and eigenvalues are solved as stacks.
+#
+import numpy as np
+from numeric import omega
+
+def _lstsq(A, b):
+    """ Least squares solution of a stack of problems, with the columns
+        scaled to unit norm """
+    scale = np.linalg.norm(A, axis=-2, keepdims=True)
+    scale = np.where(scale == 0, 1.0, scale)
+    q, r = np.linalg.qr(A / scale)
+    x = np.linalg.solve(r, np.einsum("...ji,...j->...i", np.conj(q), b)[..., np.newaxis])[..., 0]
+    return x / scale[..., 0, :]
+
+class PoleResidueModel:
+    """ H(s) = sum_k residues[k] / (s - poles[k]) + d, with s in rad/sec.
+        poles and residues have shape (..., N) and d has the batch shape. """
+    def __init__(self, poles, residues, d, rms=None):
+        self.poles = poles
+        self.residues = residues
+        self.d = d
+        # RMS error of the fit (relative to the RMS of the data)
+        self.rms = rms
+
+    def __call__(self, f):
+        """ Evaluates the model at the frequencies f (Hz), returning shape
+            (..., len(f)) """
+        return _evaluate(self, 1j * omega(np.asarray(f, dtype=float)))
+
+    def cascade(self, other):
+        """ The model of this response followed by other (the product of the
+            two), in pole-residue form.  The residue of the product at a pole
+            of one model is its residue times the other model at that pole
+            (the poles of the two must be distinct). """
+        r1 = self.residues * _evaluate(other, self.poles)
+        r2 = other.residues * _evaluate(self, other.poles)
+        return PoleResidueModel(_concatenate(self.poles, other.poles), _concatenate(r1, r2),
+            np.asarray(self.d) * np.asarray(other.d))
+
+def _evaluate(model, s):
+    """ The model at the complex frequencies s (rad/sec, shape (..., M)) """
+    terms = model.residues[..., np.newaxis, :] / (s[..., :, np.newaxis] - model.poles[..., np.newaxis, :])
+    return np.sum(terms, axis=-1) + np.asarray(model.d)[..., np.newaxis]
+
+def _concatenate(a, b):
+    shape = np.broadcast_shapes(np.shape(a)[:-1], np.shape(b)[:-1])
+    return np.concatenate([np.broadcast_to(a, shape + np.shape(a)[-1:]),
+        np.broadcast_to(b, shape + np.shape(b)[-1:])], axis=-1)
+
+def vector_fit(f, h, order, iterations=20, weight=None, tol=1e-12):
+    """ Fits PoleResidueModel's of the given order to the responses h (shape
+        (..., len(f))) sampled at the frequencies f (Hz).  weight (broadcast
+        against h) weights the samples, e.g. 1 / |h| for a relative fit of
+        the skirts.  The poles are relocated up to iterations times, until
+        they move less than tol (relative to the band). """
+    f = np.asarray(f, dtype=float)
+    h = np.asarray(h, dtype=complex)
+    batch = h.shape[:-1]
+    h = h.reshape((-1, len(f)))
+    weight = np.ones(len(f)) if weight is None else weight
+    weight = np.broadcast_to(weight, batch + (len(f),)).reshape(h.shape)
+    # Work with s normalized to the top of the band
+    scale = omega(np.amax(np.absolute(f)))
+    s = 1j * omega(f) / scale
+    low, high = np.amin(s.imag), np.amax(s.imag)
+    # Start with poles spread across the band, damped by their spacing
+    spacing = (high - low) / order
+    poles = -spacing + 1j * np.linspace(low, high, order)
+    poles = np.broadcast_to(poles, (len(h), order)).copy()
+    ones = np.ones(len(f))
+
+    def basis(poles):
+        return 1.0 / (s[:, np.newaxis] - poles[:, np.newaxis, :])
+
+    for _ in range(iterations):
+        phi = basis(poles)
+        # sigma(s) h(s) = sum c_k phi_k + d, with sigma = 1 + sum c'_k phi_k
+        A = np.concatenate([phi, np.broadcast_to(ones[:, np.newaxis], (len(h), len(f), 1)),
+            -h[..., np.newaxis] * phi], axis=-1) * weight[..., np.newaxis]
+        x = _lstsq(A, h * weight)
+        c = x[:, order + 1:]
+        # The zeros of sigma are the eigenvalues of diag(p) - 1 c^T
+        new = np.linalg.eigvals(poles[:, :, np.newaxis] * np.eye(order) - c[:, np.newaxis, :])
+        # Reflect the unstable poles
+        new = -np.absolute(new.real) + 1j * new.imag
+        new = np.sort_complex(new)
+        moved = np.amax(np.absolute(new - np.sort_complex(poles))) / (high - low)
+        poles = new
+        if moved < tol:
+            break
+
+    phi = basis(poles)
+    A = np.concatenate([phi, np.broadcast_to(ones[:, np.newaxis], (len(h), len(f), 1))], axis=-1)
+    x = _lstsq(A * weight[..., np.newaxis], h * weight)
+    fitted = np.einsum("...fk,...k->...f", A, x)
+    rms = np.sqrt(np.mean(np.absolute(fitted - h) ** 2, axis=-1) / np.mean(np.absolute(h) ** 2, axis=-1))
+    # Back to s in rad/sec
+    return PoleResidueModel((poles * scale).reshape(batch + (order,)), (x[:, :order] * scale).reshape(batch + (order,)),
+        x[:, order].reshape(batch), rms.reshape(batch))